@@ -1,14 +1,12 @@
 import os
-import random
-import time
 import json
 import asyncio
 from typing import List, Dict
 
 from config import prompts
-from llm_interact import async_chat_completion
+from llm_interact import async_chat_completion, close_async_llm_clients, LLMBudgetExceeded
+from fetch_policy import fetch_json
 from scrape_functions import (
-    fetch_json_response,
     return_OP,
     return_comments
 )
@@ -16,138 +14,204 @@ from thread_analysis_functions import (
     get_top_comments_by_ef_score,
     get_important_comments
 )
-from try_html_summary import generate_summary
-
-def fetch_thread_data(url: str) -> Dict:
-    max_retries = 3
-    is_local = os.getenv('LOCAL_RUN', 'false').lower() == 'true'
+from try_html_summary import generate_summary_async as generate_link_summary
+from image_preprocessing import (
+    preprocess_images,
+    build_image_chat_histories,
+    format_gallery_report
+)
+from http_client import close_async_client
+from tracing import traced, current_span
+
+def count_comments(comments) -> int:
+    return sum(1 + count_comments(comment.get('replies')) for comment in comments or [])
+
+@traced('parse_thread')
+def parse_thread_data(json_response) -> Dict:
+    """Parses a thread's JSON response into its title, original post and comment tree."""
+    title, original_post = return_OP(json_response)
+    # print(title)
+    comments = return_comments(json_response)
+    span = current_span()
+    if span.recording:
+        span.set(comments=count_comments(comments))
 
-    for attempt in range(max_retries):
-        try:
-            use_proxy = not is_local or (is_local and attempt == max_retries - 1)
-            if is_local and attempt == max_retries - 1:
-                print("Final attempt - trying with proxy...")
-
-            json_response = fetch_json_response(url, use_proxy=use_proxy)
-
-            # Check if the response is an error message
-            if isinstance(json_response, str):
-                raise Exception(json_response)
-
-            title, original_post = return_OP(json_response)
-            # print(title)
-            comments = return_comments(json_response)
-
-            all_data = {
-                "title": title,
-                "original_post": original_post,
-                "comments": comments,
-                'url': None
-            }
-            return all_data
-
-        except Exception as e:
-            print(f"Error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                delay = random.randint(1, 15)
-                time.sleep(delay)
-    
     all_data = {
+        "title": title,
+        "original_post": original_post,
+        "comments": comments,
+        'url': None
+    }
+    return all_data
+
+def failed_thread_data(url: str) -> Dict:
+    return {
         "title": None,
         "original_post": None,
         "comments": None,
-        "url:": url
+        "url": url
     }
-    return all_data
 
-
-def analyze_reddit_thread(all_data, summary_focus, summary_length, tone, include_eli5, analyze_image, search_external, max_comments, include_normal_summary=True):
+@traced('fetch_thread')
+def fetch_thread_data(url: str) -> Dict:
     """
-    Analyzes a Reddit thread.
-
-    Args:
-        all_data: Content of the Reddit thread.
-        summary_focus: Focus of the summary.
-        summary_length: Length of the summary.
-        tone: Tone of the summary.
-        include_eli5: Whether to include an ELI5 summary.
-        analyze_image: Whether to analyze images.
-        search_external: Whether to search external links.
-        include_normal_summary: Whether to include a normal summary (default: True).
+    Fetches and parses a thread. The fetch policy picks the route (direct or proxy) and
+    retries on failures. Returns None fields (with the requested url) if the thread couldn't be read.
     """
-    if summary_length == "Short":
-        length_sentence = ("Your summary should be concise, ideally between 100 and 200 words, "
-                           "depending on the original thread's length.")
-    elif summary_length == "Medium":
-        length_sentence = ("Your summary will be medium sized, preferably between 250 to 350 words, "
-                           "depending on the original thread's length.")
-    elif summary_length == "Long":
-        length_sentence = ("Your summary should be extensive, with a minimum of 400 words unless the "
-                           "original thread is shorter. In that case, match the length of the original thread.")
-    else:
-        length_sentence = ""
+    current_span().set(url=url)
+    try:
+        json_response = fetch_json(url)
 
-    tone_prompt = prompts[tone]['content'] if tone in prompts else ""
+        # Check if the response is an error message
+        if isinstance(json_response, str):
+            raise Exception(json_response)
 
-    system_message_normal_summary = {
-        "role": prompts['summarize_raw_content']['role'],
-        "content": prompts['summarize_raw_content']['content'].format(focus=summary_focus) +
-                   " " + length_sentence + "\nConform to the following tone and imitate it: " + tone_prompt
-    }
+        return parse_thread_data(json_response)
 
-    system_message_eli5 = {
-        "role": prompts['summarize_like_im_5']['role'],
-        "content": prompts['summarize_like_im_5']['content'].format(focus=summary_focus) +
-                   " " + length_sentence
-    }
+    except Exception as e:
+        print(f"Could not fetch {url}: {e}")
+        current_span().set(outcome='failed')
+
+    return failed_thread_data(url)
+
+
+# Model used for the restyling calls. They only rewrite the structured analysis,
+# so a smaller, faster model than MODEL_NAME is usually enough.
+RESTYLE_MODEL_NAME = os.getenv("RESTYLE_MODEL_NAME")
+
+def length_instruction(summary_length: str) -> str:
+    if summary_length == "Short":
+        return ("Your summary should be concise, ideally between 100 and 200 words, "
+                "depending on the original thread's length.")
+    elif summary_length == "Medium":
+        return ("Your summary will be medium sized, preferably between 250 to 350 words, "
+                "depending on the original thread's length.")
+    elif summary_length == "Long":
+        return ("Your summary should be extensive, with a minimum of 400 words unless the "
+                "original thread is shorter. In that case, match the length of the original thread.")
+    return ""
 
+@traced('structured_analysis')
+def build_structured_analysis(all_data, summary_focus, analyze_image, search_external) -> str:
+    """
+    Stage one: a tone-neutral structured analysis of the whole thread for the focus.
+    This is the only call that sends the full thread, with the image and link analyses,
+    to the model. Its result can be cached and restyled for any length and tone.
+    """
     OP = all_data['original_post']
     image_links = OP.get("image_link", [])
     extra_links = OP.get("extra_content_link", [])
-    image_responses, link_summaries = process_media_content(image_links, extra_links, analyze_image, search_external)
+    image_responses, link_summaries, duplicates_dropped = process_media_content(
+        image_links, extra_links, analyze_image, search_external)
 
     media_analysis = ""
     if image_responses:
-        media_analysis += f"\nThere are {len(image_responses)} image(s) in this post. Here are the analyses of these images:\n"
+        media_analysis += "\nThere are image(s) in this post."
+        if duplicates_dropped:
+            media_analysis += f" {duplicates_dropped} near-duplicate image(s) were skipped."
+        media_analysis += f" Here are {len(image_responses)} analyses of these images:\n"
         for idx, resp in enumerate(image_responses, start=1):
-            media_analysis += f"\nImage {idx} analysis: {resp}"
+            media_analysis += f"\nImage analysis {idx}: {resp}"
     if link_summaries:
         media_analysis += f"\n\nThere are {len(link_summaries)} external link(s) in this post. Here are their summaries:\n"
         for idx, summary in enumerate(link_summaries, start=1):
             media_analysis += f"\nLink {idx} summary: {summary}"
+    # The prompt gets its own copy: all_data is shared with the other analyses of the thread
+    prompt_data = all_data
     if media_analysis:
-        OP["body"] += "\n" + media_analysis
+        prompt_data = dict(all_data, original_post=dict(OP, body=OP["body"] + "\n" + media_analysis))
+
+    chat_history = [
+        {
+            "role": prompts['structured_analysis']['role'],
+            "content": prompts['structured_analysis']['content'].format(focus=summary_focus)
+        },
+        {"role": "user", "content": json.dumps(prompt_data, indent=4)}
+    ]
+    async def run_structured_api_call():
+        try:
+            return await async_chat_completion(chat_history, temperature=0.3, kind='structured')
+        finally:
+            await close_async_llm_clients()
+
+    structured_analysis = asyncio.run(run_structured_api_call())
+    return structured_analysis if structured_analysis is not None else ""
+
+@traced('restyle')
+def restyle_analysis(structured_analysis, summary_focus, summary_length, tone, include_eli5, include_normal_summary=True):
+    """
+    Stage two: rewrites the structured analysis in the requested length and tone, and as an
+    ELI5 summary. Only the structured analysis is sent, not the thread.
+    Returns (summary, eli5 summary). Either is None if it wasn't requested.
+    """
+    length_sentence = length_instruction(summary_length)
+    tone_prompt = prompts[tone]['content'] if tone in prompts else ""
 
-    # --- Prepare chat histories - based on include_normal_summary and include_eli5 ---
     chat_history_normal = None
     chat_history_eli5 = None
 
     if include_normal_summary:
         chat_history_normal = [
-            system_message_normal_summary,
-            {"role": "user", "content": json.dumps(all_data, indent=4)}
+            {
+                "role": prompts['restyle_analysis']['role'],
+                "content": prompts['restyle_analysis']['content'].format(focus=summary_focus) +
+                           " " + length_sentence + "\nConform to the following tone and imitate it: " + tone_prompt
+            },
+            {"role": "user", "content": structured_analysis}
         ]
     if include_eli5:
         chat_history_eli5 = [
-            system_message_eli5,
-            {"role": "user", "content": json.dumps(all_data, indent=4)}
+            {
+                "role": prompts['restyle_like_im_5']['role'],
+                "content": prompts['restyle_like_im_5']['content'].format(focus=summary_focus) +
+                           " " + length_sentence
+            },
+            {"role": "user", "content": structured_analysis}
         ]
 
     async def run_parallel_text_api_calls():
         tasks = []
         if chat_history_normal:
-            tasks.append(async_chat_completion(chat_history_normal))
+            tasks.append(async_chat_completion(chat_history_normal, model=RESTYLE_MODEL_NAME, kind='summary'))
         else:
-             tasks.append(asyncio.sleep(0, result=None))
+            tasks.append(asyncio.sleep(0, result=None))
         if chat_history_eli5:
-            tasks.append(async_chat_completion(chat_history_eli5))
+            tasks.append(async_chat_completion(chat_history_eli5, model=RESTYLE_MODEL_NAME, kind='eli5'))
         else:
             tasks.append(asyncio.sleep(0, result=None))
 
-        results = await asyncio.gather(*tasks)
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            await close_async_llm_clients()
         return results
 
-    result_normal, result_for_5yo = asyncio.run(run_parallel_text_api_calls())
+    return asyncio.run(run_parallel_text_api_calls())
+
+def analyze_reddit_thread(all_data, summary_focus, summary_length, tone, include_eli5, analyze_image, search_external, max_comments,
+                          include_normal_summary=True, structured_analysis=None):
+    """
+    Analyzes a Reddit thread in two stages: a structured analysis of the thread, restyled
+    into the requested summaries.
+
+    Args:
+        all_data: Content of the Reddit thread.
+        summary_focus: Focus of the summary.
+        summary_length: Length of the summary.
+        tone: Tone of the summary.
+        include_eli5: Whether to include an ELI5 summary.
+        analyze_image: Whether to analyze images.
+        search_external: Whether to search external links.
+        include_normal_summary: Whether to include a normal summary (default: True).
+        structured_analysis: A structured analysis of the thread for this focus, e.g. from the cache.
+                             Computed if None.
+    """
+    if structured_analysis is None:
+        structured_analysis = build_structured_analysis(all_data, summary_focus, analyze_image, search_external)
+
+    result_normal, result_for_5yo = restyle_analysis(
+        structured_analysis, summary_focus, summary_length, tone, include_eli5, include_normal_summary
+    )
 
     result_normal = result_normal if result_normal is not None else ""  # Ensure string return
     result_for_5yo = result_for_5yo if result_for_5yo is not None else None
@@ -155,6 +219,7 @@ def analyze_reddit_thread(all_data, summary_focus, summary_length, tone, include
     best_comments, important_comments = deep_analysis_of_thread(all_data, max_comments)
     return result_normal, result_for_5yo, [best_comments, important_comments]
 
+@traced('comment_ranking')
 def deep_analysis_of_thread(all_data, max_comments):
     # First, non-LLM statistics
     a = get_top_comments_by_ef_score(all_data['comments'], limit=max_comments)
@@ -162,50 +227,70 @@ def deep_analysis_of_thread(all_data, max_comments):
 
     return (a,b)
 
+@traced('process_media')
 def process_media_content(image_links, extra_content_links, analyze_image=True, search_external=True):
-    """Process images and extra content links concurrently and return aggregated responses"""
+    """
+    Process images and extra content links concurrently and return aggregated responses.
+    Images and links skipped by the LLM budget of the analysis are left out.
+    Returns (image responses, link summaries, number of near-duplicate images dropped).
+    """
+    current_span().set(images=len(image_links or []) if analyze_image else 0,
+                       links=len(extra_content_links or []) if search_external else 0)
     async def run_media_api_calls(img_links, content_links):
-        tasks = []      
-        # Add image analysis tasks
-        if img_links and analyze_image:
-            for link in img_links:
-                chat_history_image = [{
-                    "role": "user", 
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": link}},
-                        {"type": "text", "text": "Describe what's on this image:"}
-                    ]
-                }]
-                tasks.append(async_chat_completion(chat_history_image, is_image=True))
-        
-        # Add link summary tasks  
+        # Link summaries start first, so they run while the images are fetched and preprocessed
+        link_tasks = []
         if content_links and search_external:
             for link in content_links:
-                tasks.append(asyncio.create_task(
+                link_tasks.append(asyncio.create_task(
                     generate_summary_async(link, word_count=200)
                 ))
-                
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
+
+        try:
+            # Add image analysis tasks. Images are fetched, deduplicated and downscaled locally first.
+            image_tasks = []
+            duplicates_dropped = 0
+            if img_links and analyze_image:
+                image_urls, stats = await preprocess_images(img_links)
+                chat_histories_image = build_image_chat_histories(image_urls)
+                print(format_gallery_report(stats, len(chat_histories_image)))
+                duplicates_dropped = stats["duplicates_dropped"]
+                for chat_history_image in chat_histories_image:
+                    image_tasks.append(async_chat_completion(chat_history_image, is_image=True))
+            num_images = len(image_tasks)
+
+            results = await asyncio.gather(*image_tasks, *link_tasks, return_exceptions=True)
+        finally:
+            # Only still running if the image preprocessing failed
+            for task in link_tasks:
+                task.cancel()
+            await close_async_client()
+            await close_async_llm_clients()
+
+        skipped = sum(isinstance(result, LLMBudgetExceeded) for result in results)
+        if skipped:
+            print(f"Skipped {skipped} image and link summaries to stay within the LLM budget")
+            current_span().set(skipped_over_budget=skipped)
+
         # Split results into image and link summaries
-        num_images = len(img_links) if img_links else 0
-        image_results = results[:num_images]
-        link_results = results[num_images:]
+        image_results = [result for result in results[:num_images] if not isinstance(result, LLMBudgetExceeded)]
+        link_results = [result for result in results[num_images:] if not isinstance(result, LLMBudgetExceeded)]
         
-        return image_results, link_results
+        return image_results, link_results, duplicates_dropped
 
     if not image_links and not extra_content_links:
-        return None, None
+        return None, None, 0
         
-    image_responses, link_summaries = asyncio.run(
+    image_responses, link_summaries, duplicates_dropped = asyncio.run(
         run_media_api_calls(image_links, extra_content_links)
     )
     
-    return image_responses, link_summaries
+    return image_responses, link_summaries, duplicates_dropped
 
 async def generate_summary_async(url: str, word_count: int = 200) -> str:
     try:
-        return await asyncio.to_thread(generate_summary, url, word_count)
+        return await generate_link_summary(url, word_count)
+    except LLMBudgetExceeded:
+        raise
     except Exception as e:
         print(f"Error generating summary for {url}: {e}")
         return f"Failed to generate summary: {str(e)}"
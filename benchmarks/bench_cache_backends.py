@@ -0,0 +1,101 @@
+"""
+Measures lookup and insert latency of the analysis cache backends at growing cache sizes.
+
+The caches are filled with synthetic rows in a temporary directory. The CSV backend rewrites
+the whole file on every insert, so by default it is only measured up to 100k rows.
+
+Usage:
+    python benchmarks/bench_cache_backends.py [--sizes 10000 100000 1000000] [--payload-chars 1500]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+# Add the frontend directory to path to allow importing the cache backends
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend"))
+from cache_backends import CsvCacheBackend, SqliteCacheBackend
+
+TONES = ["Teacher", "Foulmouthed", "Cut the Bullshit", "Pirate", "Zen Master"]
+LENGTHS = ["Short", "Medium", "Long"]
+
+def synthetic_row(i: int, payload: str) -> dict:
+    return {
+        'url': f"https://www.reddit.com/r/bench/comments/{i // 4:x}/thread_{i // 4}/",
+        'timestamp': "2025-01-01T00:00:00+00:00",
+        'summary_focus': "General Summary",
+        'summary_length': LENGTHS[i % len(LENGTHS)],
+        'tone': TONES[i % len(TONES)],
+        'include_eli5': False,
+        'analyze_image': True,
+        'search_external': False,
+        'number_of_comments': 100 + i % 500,
+        'total_score': 1000 + i % 5000,
+        'total_ef_score': 2000 + i % 9000,
+        'analysis_result': payload,
+        'eli5_summary': "",
+        'notable_comments': "[[], []]",
+    }
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return statistics.mean(samples) * 1000, statistics.median(samples) * 1000, p99 * 1000
+
+def fill_sqlite(path, size, payload):
+    backend = SqliteCacheBackend(path)
+    with backend.lock, backend.db:
+        for i in range(size):
+            backend._execute_upsert(synthetic_row(i, payload))
+    return backend
+
+def fill_csv(path, size, payload):
+    import pandas as pd
+    pd.DataFrame([synthetic_row(i, payload) for i in range(size)]).to_csv(path, index=False)
+    return CsvCacheBackend(path)
+
+def measure(backend, size, payload, lookups, inserts):
+    lookup_times = []
+    for _ in range(lookups):
+        row = synthetic_row(random.randrange(size), payload)
+        start = time.perf_counter()
+        backend.find(row['url'], row['summary_focus'], row['summary_length'], row['tone'])
+        lookup_times.append(time.perf_counter() - start)
+
+    insert_times = []
+    for i in range(inserts):
+        row = synthetic_row(size + i, payload)
+        start = time.perf_counter()
+        backend.upsert(row)
+        insert_times.append(time.perf_counter() - start)
+    return percentiles(lookup_times), percentiles(insert_times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analysis cache backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--payload-chars", type=int, default=1500, help="Size of the synthetic analysis text")
+    parser.add_argument("--csv-max-rows", type=int, default=100_000, help="Largest cache measured with the CSV backend")
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--inserts", type=int, default=100)
+    args = parser.parse_args()
+
+    payload = ("lorem ipsum " * (args.payload_chars // 12 + 1))[:args.payload_chars]
+    print(f"{'backend':<8} {'rows':>9}   {'lookup mean/p50/p99 (ms)':>26}   {'insert mean/p50/p99 (ms)':>26}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            runs = [("sqlite", fill_sqlite, os.path.join(tmp, f"bench_{size}.db"), args.inserts)]
+            if size <= args.csv_max_rows:
+                runs.append(("csv", fill_csv, os.path.join(tmp, f"bench_{size}.csv"), max(3, args.inserts // 20)))
+            for name, fill, path, inserts in runs:
+                backend = fill(path, size, payload)
+                lookup, insert = measure(backend, size, payload, args.lookups, inserts)
+                backend.close()
+                print(f"{name:<8} {size:>9}   {lookup[0]:8.3f} {lookup[1]:8.3f} {lookup[2]:8.3f}   "
+                      f"{insert[0]:8.2f} {insert[1]:8.2f} {insert[2]:8.2f}")
+
+if __name__ == "__main__":
+    main()
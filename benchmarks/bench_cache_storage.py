@@ -0,0 +1,101 @@
+"""
+Compares the on-disk size and cold-load time of the CSV cache and the SQLite cache with
+compressed payloads.
+
+Rows get realistic payloads: an analysis text and notable comments made of nested comment
+dicts with replies, serialized with json.dumps like perform_new_analysis does.
+Cold load is what a fresh process does before it can answer a lookup: open the cache,
+load the metadata of every row for the index, then read the payload of one matched row
+and parse its notable comments.
+
+Usage:
+    python benchmarks/bench_cache_storage.py [--rows 1000 10000] [--gets 100]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+# Add the frontend directory to path to allow importing the cache backends
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend"))
+import cache_backends
+from cache_backends import CsvCacheBackend, SqliteCacheBackend
+from bench_cache_backends import synthetic_row
+
+WORDS = ("the thread people think this is why game price model open source update community "
+         "actually really never because performance release support bug feature benchmark "
+         "reddit comment users data version cost better worse agree disagree").split()
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def comment(rng, depth):
+    replies = [comment(rng, depth + 1) for _ in range(rng.randint(0, 2))] if depth < 3 else []
+    return {
+        'author': f"user{rng.randrange(10**6)}",
+        'score': rng.randint(-10, 2000),
+        'ef_score': round(rng.uniform(0, 500), 2),
+        'body': " ".join(sentence(rng, rng.randint(6, 25)) for _ in range(rng.randint(1, 4))),
+        'depth': depth,
+        'replies': replies,
+    }
+
+def realistic_row(i, rng):
+    row = synthetic_row(i, " ".join(sentence(rng, rng.randint(8, 20)) for _ in range(25)))
+    notable = [[(comment(rng, 1), comment(rng, 0)) for _ in range(5)] for _ in range(2)]
+    row['notable_comments'] = json.dumps(notable)
+    return row
+
+def cold_load(open_backend, gets, rows):
+    start = time.perf_counter()
+    backend = open_backend()
+    metadata = backend.load_metadata()
+    loaded = time.perf_counter() - start
+
+    ids = [row['id'] for row in metadata]
+    start = time.perf_counter()
+    for row_id in random.sample(ids, min(gets, len(ids))):
+        json.loads(backend.get(row_id)['notable_comments'])
+    per_get = (time.perf_counter() - start) / min(gets, len(ids))
+    backend.close()
+    assert len(metadata) == rows
+    return loaded, per_get
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cache storage size and cold-load time")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--gets", type=int, default=100, help="Matched rows read after the index load")
+    args = parser.parse_args()
+
+    print(f"{'storage':<20} {'rows':>7} {'size (MB)':>10} {'cold load (s)':>14} {'get (ms)':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.rows:
+            rng = random.Random(size)
+            rows = [realistic_row(i, rng) for i in range(size)]
+
+            csv_path = os.path.join(tmp, f"cache_{size}.csv")
+            import pandas as pd
+            pd.DataFrame(rows).to_csv(csv_path, index=False)
+            runs = [("csv", csv_path, lambda: CsvCacheBackend(csv_path))]
+
+            for name, level in (("sqlite uncompressed", 0), ("sqlite zlib", 6)):
+                cache_backends.PAYLOAD_COMPRESSION_LEVEL = level
+                db_path = os.path.join(tmp, f"cache_{size}_{level}.db")
+                backend = SqliteCacheBackend(db_path)
+                with backend.lock, backend.db:
+                    for row in rows:
+                        backend._execute_upsert(row)
+                backend.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                backend.close()
+                runs.append((name, db_path, lambda db_path=db_path: SqliteCacheBackend(db_path)))
+
+            for name, path, open_backend in runs:
+                loaded, per_get = cold_load(open_backend, args.gets, size)
+                print(f"{name:<20} {size:>7} {os.path.getsize(path) / 2**20:>10.1f} "
+                      f"{loaded:>14.3f} {per_get * 1000:>9.3f}")
+
+if __name__ == "__main__":
+    main()
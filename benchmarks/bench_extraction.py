@@ -0,0 +1,85 @@
+"""
+Benchmarks main-content extraction on the saved pages in extraction_corpus/.
+
+For every extractor it reports pages/sec and two quality numbers, computed on word counts
+against the hand-labelled main text of each page:
+    main share: share of the extracted words that belong to the main content
+    recall:     share of the main content words that were extracted
+
+Usage:
+    python benchmarks/bench_extraction.py [--rounds 200]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+
+# Add parent directory to path to allow importing the project modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from content_extraction import extract_main_content
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extraction_corpus")
+
+def legacy_extract(html: str, url: str) -> str:
+    """The previous extractor: the full text of a BeautifulSoup html.parser tree."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    return ' '.join(soup.get_text(separator=' ').split())
+
+def load_corpus():
+    with open(os.path.join(CORPUS_DIR, "corpus.json"), "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    corpus = []
+    for entry in manifest:
+        with open(os.path.join(CORPUS_DIR, entry["page"]), "r", encoding="utf-8") as file:
+            html = file.read()
+        with open(os.path.join(CORPUS_DIR, entry["main_text"]), "r", encoding="utf-8") as file:
+            main_text = file.read()
+        corpus.append((entry["page"], entry["url"], html, main_text))
+    return corpus
+
+def word_counts(text: str) -> Counter:
+    return Counter(word.strip('.,:;!?()"\'').lower() for word in text.split())
+
+def quality(extracted: str, main_text: str):
+    """Returns (main_share, recall) of the extracted text against the labelled main text."""
+    extracted_words = word_counts(extracted)
+    main_words = word_counts(main_text)
+    overlap = sum((extracted_words & main_words).values())
+    main_share = overlap / max(1, sum(extracted_words.values()))
+    recall = overlap / max(1, sum(main_words.values()))
+    return main_share, recall
+
+def run(name, extractor, corpus, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for _, url, html, _ in corpus:
+            extractor(html, url)
+    elapsed = time.perf_counter() - start
+    pages_per_sec = rounds * len(corpus) / elapsed
+
+    print(f"\n{name}: {pages_per_sec:.0f} pages/sec")
+    shares, recalls = [], []
+    for page, url, html, main_text in corpus:
+        main_share, recall = quality(extractor(html, url), main_text)
+        shares.append(main_share)
+        recalls.append(recall)
+        print(f"  {page:<22} main share {main_share:6.1%}   recall {recall:6.1%}")
+    print(f"  {'mean':<22} main share {sum(shares) / len(shares):6.1%}   recall {sum(recalls) / len(recalls):6.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark main-content extraction")
+    parser.add_argument("--rounds", type=int, default=200, help="Passes over the corpus for the speed measurement")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    run("lxml extraction engine", extract_main_content, corpus, args.rounds)
+    try:
+        run("legacy BeautifulSoup html.parser", legacy_extract, corpus, args.rounds)
+    except ImportError:
+        print("\nbeautifulsoup4 is not installed, skipping the legacy extractor")
+
+if __name__ == "__main__":
+    main()
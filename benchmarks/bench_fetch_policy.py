@@ -0,0 +1,111 @@
+"""
+Simulates thread fetches over a direct route and a proxy, and compares the fixed retry
+logic fetch_thread_data used before with the adaptive fetch policy.
+
+The routes run on a virtual clock, so nothing is fetched and nothing really sleeps:
+    healthy    direct answers in ~0.4s, the proxy in ~1.2s, both rarely fail
+    degraded   from --degrade-at on, direct fails --direct-failure-rate of the requests,
+               each failure costing the full timeout (a hanging connection)
+    recovered  from --recover-at on, direct is healthy again
+Fetches are --gap seconds apart. Reported latency is the time from the start of a fetch
+to its result, backoff waits included.
+
+Usage:
+    python benchmarks/bench_fetch_policy.py [--fetches 2000] [--degrade-at 500] [--recover-at 1500]
+"""
+import io
+import os
+import sys
+import random
+import argparse
+import contextlib
+
+# Add the parent directory to path to allow importing fetch_policy
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fetch_policy import FetchPolicy
+
+PROXY = {'http': 'http://proxy', 'https': 'http://proxy'}
+
+class SimulatedRoutes:
+    def __init__(self, args, rng):
+        self.args = args
+        self.rng = rng
+        self.now = 0.0
+        self.fetch_index = 0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def fetch(self, url, proxies=None, timeout=None, use_proxy=False):
+        direct = proxies is None and not use_proxy
+        degraded = self.args.degrade_at <= self.fetch_index < self.args.recover_at
+        if direct and degraded and self.rng.random() < self.args.direct_failure_rate:
+            self.now += timeout or 15
+            return "Error: Request failed with exception: timed out", None
+        if self.rng.random() < 0.01:
+            self.now += self.rng.uniform(0.2, 1.0)
+            return "Error: Request failed with exception: 503", 503
+        self.now += self.rng.lognormvariate(-0.9 if direct else 0.2, 0.3)
+        return {'data': {}}, 200
+
+def fixed_fetch(sim, url, rng):
+    """The previous logic of a local run: direct twice, then the proxy, 1-15s apart."""
+    for attempt in range(3):
+        result, _ = sim.fetch(url, use_proxy=attempt == 2, timeout=15)
+        if not isinstance(result, str):
+            return True
+        if attempt < 2:
+            sim.sleep(rng.randint(1, 15))
+    return False
+
+def run(args, strategy):
+    rng = random.Random(args.seed)
+    sim = SimulatedRoutes(args, rng)
+    policy = FetchPolicy([("direct", None), ("proxy", PROXY)], fetch=sim.fetch, timeout=15,
+                         clock=sim.clock, sleep=sim.sleep)
+    latencies, successes = [], []
+    for i in range(args.fetches):
+        sim.fetch_index = i
+        start = sim.now
+        if strategy == "fixed":
+            success = fixed_fetch(sim, "https://www.reddit.com/r/x/comments/abc", rng)
+        else:
+            success = not isinstance(policy.fetch_json("https://www.reddit.com/r/x/comments/abc"), str)
+        latencies.append(sim.now - start)
+        successes.append(success)
+        sim.now += args.gap
+    return latencies, successes
+
+def summarize(name, latencies, successes):
+    ordered = sorted(latencies)
+    p = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    print(f"{name:<10} {sum(latencies) / len(latencies):>8.2f} {p(0.5):>8.2f} {p(0.95):>8.2f} "
+          f"{p(0.99):>8.2f} {sum(successes) / len(latencies):>9.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fixed and adaptive fetch retries on simulated routes")
+    parser.add_argument("--fetches", type=int, default=2000)
+    parser.add_argument("--degrade-at", type=int, default=500)
+    parser.add_argument("--recover-at", type=int, default=1500)
+    parser.add_argument("--direct-failure-rate", type=float, default=0.7)
+    parser.add_argument("--gap", type=float, default=5.0, help="Seconds between two fetches")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.fetches} fetches, direct degraded for fetches {args.degrade_at}-{args.recover_at} "
+          f"({args.direct_failure_rate:.0%} timeouts)")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = {strategy: run(args, strategy) for strategy in ("fixed", "adaptive")}
+    phases = [("all", 0, args.fetches), ("healthy", 0, args.degrade_at),
+              ("degraded", args.degrade_at, args.recover_at), ("recovered", args.recover_at, args.fetches)]
+    for phase, start, end in phases:
+        print(f"\n{phase} (fetches {start}-{end})")
+        print(f"{'strategy':<10} {'mean (s)':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'succeeded':>9}")
+        for strategy, (latencies, successes) in results.items():
+            summarize(strategy, latencies[start:end], successes[start:end])
+
+if __name__ == "__main__":
+    main()
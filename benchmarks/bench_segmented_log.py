@@ -0,0 +1,164 @@
+"""
+Exercises the cloud cache backends against a local S3 stand-in.
+
+LocalObjectStore mimics the subset of the S3 filesystem used by the backends: whole-object
+PUT and GET, LIST and DELETE, on a temporary directory. It counts requests and bytes so the
+cost of a write and of a read refresh can be compared between the CSV and the segmented log.
+
+It also checks that two sessions writing at the same time don't lose each other's rows,
+and that a compaction keeps every row.
+
+Usage:
+    python benchmarks/bench_segmented_log.py [--rows 5000] [--writes 50]
+"""
+import io
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+# Add the frontend directory to path to allow importing the cache backends
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend"))
+from cache_backends import CsvCacheBackend
+import segmented_log_backend
+from segmented_log_backend import SegmentedLogCacheBackend
+from bench_cache_backends import synthetic_row
+
+class LocalObjectStore:
+    """A local directory that behaves like the S3 filesystem (fsspec API subset) and counts traffic."""
+
+    def __init__(self, root):
+        self.root = root
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def _path(self, path):
+        return os.path.join(self.root, path)
+
+    def _count(self, op, size=0):
+        with self.lock:
+            self.stats[op] += 1
+            self.stats[f"{op}_bytes"] += size
+
+    def open(self, path, mode="r"):
+        store = self
+        full_path = self._path(path)
+        if "w" in mode:
+            class Upload:
+                """Buffers the object and uploads it on close, like S3 does."""
+                def __init__(self):
+                    self.parts = []
+                def write(self, text):
+                    self.parts.append(text)
+                def __enter__(self):
+                    return self
+                def __exit__(self, *exc):
+                    data = "".join(self.parts)
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    tmp_path = f"{full_path}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(data)
+                    os.replace(tmp_path, full_path)
+                    store._count("put", len(data.encode()))
+            return Upload()
+        with open(full_path, "r", encoding="utf-8") as f:
+            data = f.read()
+        self._count("get", len(data.encode()))
+        return io.StringIO(data)
+
+    def read(self, path, input_format="csv", ttl=0):
+        """The st.connection read() used by the CSV backend in cloud mode."""
+        import pandas as pd
+        with self.open(path, "r") as f:
+            return pd.read_csv(f)
+
+    def exists(self, path):
+        return os.path.exists(self._path(path))
+
+    def ls(self, path, detail=False):
+        self._count("list")
+        return [f"{path}/{name}" for name in os.listdir(self._path(path)) if not name.endswith(".tmp")]
+
+    def rm(self, path):
+        self._count("delete")
+        os.remove(self._path(path))
+
+    def invalidate_cache(self, path=None):
+        pass
+
+def fill_csv(store, path, rows):
+    import pandas as pd
+    os.makedirs(os.path.dirname(store._path(path)), exist_ok=True)
+    pd.DataFrame([synthetic_row(i, "x" * 1500) for i in range(rows)]).to_csv(store._path(path), index=False)
+
+def report(name, stats, writes):
+    print(f"{name:<16} per write: {stats['put'] / writes:5.1f} PUTs, {stats['put_bytes'] / writes / 1024:9.1f} KB uploaded | "
+          f"refresh: {stats['get']} GETs, {stats['list']} LISTs, {stats['get_bytes'] / 1024:9.1f} KB downloaded")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cloud cache backends on a local S3 stand-in")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows in the existing cache")
+    parser.add_argument("--writes", type=int, default=50, help="Analyses written during the run")
+    args = parser.parse_args()
+
+    # Compaction is triggered explicitly below instead of in the background
+    segmented_log_backend.CACHE_LOG_COMPACT_AFTER = float("inf")
+    root = tempfile.mkdtemp()
+    try:
+        # CSV backend: every write uploads the whole file
+        store = LocalObjectStore(os.path.join(root, "csv"))
+        fill_csv(store, "bucket/analyses.csv", args.rows)
+        csv_cache = CsvCacheBackend("bucket/analyses.csv", conn=store)
+        store.stats.clear()
+        for i in range(args.writes):
+            csv_cache.upsert(synthetic_row(args.rows + i, "y" * 1500))
+        write_stats = Counter(store.stats)
+        store.stats.clear()
+        CsvCacheBackend("bucket/analyses.csv", conn=store)
+        report("csv", write_stats + store.stats, args.writes)
+
+        # Segmented log: migrate the same CSV, then every write is one small segment
+        store = LocalObjectStore(os.path.join(root, "log"))
+        fill_csv(store, "bucket/analyses.csv", args.rows)
+        mirror = os.path.join(root, "mirror")
+        writer = SegmentedLogCacheBackend(store, "bucket/log", mirror + "_w", legacy_csv_path="bucket/analyses.csv")
+        reader = SegmentedLogCacheBackend(store, "bucket/log", mirror + "_r")
+        store.stats.clear()
+        for i in range(args.writes):
+            writer.upsert(synthetic_row(args.rows + i, "y" * 1500))
+        write_stats = Counter(store.stats)
+        store.stats.clear()
+        reader.refresh(force=True)
+        report("segmented log", write_stats + store.stats, args.writes)
+        assert len(reader) == args.rows + args.writes, "reader missed rows"
+
+        # Two sessions writing concurrently keep both sets of rows
+        other = SegmentedLogCacheBackend(store, "bucket/log", mirror + "_o")
+        threads = [
+            threading.Thread(target=lambda b=b, base=base: [b.upsert(synthetic_row(base + i, "z")) for i in range(20)])
+            for b, base in ((writer, 10**6), (other, 2 * 10**6))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reader.refresh(force=True)
+        assert len(reader) == args.rows + args.writes + 40, "concurrent writes were lost"
+        print("concurrent writers: no rows lost")
+
+        # Compaction folds the segments into a new base without losing rows
+        writer.compact()
+        fresh = SegmentedLogCacheBackend(store, "bucket/log", mirror + "_f")
+        assert len(fresh) == len(reader), "compaction lost rows"
+        store.stats.clear()
+        fresh.refresh(force=True)
+        print(f"after compaction: {len(fresh)} rows, unchanged refresh costs {store.stats['get']} GET and "
+              f"{store.stats['list']} LIST ({store.stats['get_bytes']} bytes)")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    main()
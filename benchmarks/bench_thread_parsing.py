@@ -0,0 +1,177 @@
+"""
+Measures time and peak memory of the thread parsing and comment ranking functions on
+generated threads (thread_generator.py) of growing sizes, and compares them to the stored
+baseline in benchmarks/baselines/thread_parsing.json.
+
+    json_loads                      parsing the .json payload, as response.json() does
+    return_OP, return_comments      scrape_functions
+    get_top_comments_by_ef_score,   thread_analysis_functions, with limit 5
+    get_important_comments
+    count_all_comments              frontend/cache_helpers
+
+Time is the median of up to --repeat samples (fewer for slow cases, see --budget). Peak memory
+is the most memory allocated during one call, measured in a separate run with tracemalloc.
+Right before every sample a fixed pure-Python calibration workload is timed as well, and time
+is compared as the median multiple of it, so a host that is busier or slower than when the
+baseline was saved slows both alike. A case is a regression when its calibrated time is higher than the
+baseline's by more than --time-tolerance or it needs more memory by more than
+--memory-tolerance. Save a baseline on the kind of machine the suite runs on before comparing.
+
+Usage:
+    python benchmarks/bench_thread_parsing.py [--sizes 100 1000 10000 100000 500000] [--check]
+    python benchmarks/bench_thread_parsing.py --save-baseline
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import argparse
+import statistics
+import tracemalloc
+
+# Add the parent and frontend directories to path to allow importing the parsing functions
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "frontend"))
+from scrape_functions import return_OP, return_comments
+from thread_analysis_functions import get_top_comments_by_ef_score, get_important_comments
+from cache_helpers import count_all_comments
+from thread_generator import generate_thread
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "thread_parsing.json")
+
+# Each case gets the thread as .json text, as the parsed payload and as the comment tree
+CASES = {
+    'json_loads': lambda thread: json.loads(thread['text']),
+    'return_OP': lambda thread: return_OP(thread['payload']),
+    'return_comments': lambda thread: return_comments(thread['payload']),
+    'get_top_comments_by_ef_score': lambda thread: get_top_comments_by_ef_score(thread['comments'], limit=5),
+    'get_important_comments': lambda thread: get_important_comments(thread['comments'], limit=5),
+    'count_all_comments': lambda thread: count_all_comments(thread['comments']),
+}
+
+def calibration_workload():
+    """Dict building, sorting and JSON round trips, the kind of work the parsing cases do."""
+    comments = [{'score': i * 7919 % 1000, 'body': f"comment {i}", 'replies': []} for i in range(5000)]
+    comments.sort(key=lambda comment: comment['score'], reverse=True)
+    return json.loads(json.dumps(comments))
+
+def measure_time(case, thread, repeat: int, budget: float) -> dict:
+    """
+    Medians of the seconds per call, of the calibration workload timed right before every
+    sample, and of the ratio of each sample to its calibration. Fast cases are looped so each
+    sample takes at least 0.2s.
+    """
+    timer = timeit.Timer(lambda: case(thread))
+    calibration = timeit.Timer(calibration_workload)
+    calibration_number, _ = calibration.autorange()
+    number, elapsed = timer.autorange()
+    times, calibrations = [], []
+    # Slow cases get fewer samples, so the largest sizes stay within the budget
+    for _ in range(min(repeat, max(1, int(budget / elapsed)))):
+        calibrations.append(calibration.timeit(calibration_number) / calibration_number)
+        times.append(timer.timeit(number) / number)
+    return {
+        'seconds': statistics.median(times),
+        'calibration_seconds': statistics.median(calibrations),
+        'calibrated': statistics.median(t / c for t, c in zip(times, calibrations)),
+    }
+
+def measure_peak_memory(case, thread) -> int:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = case(thread)
+        peak = tracemalloc.get_traced_memory()[1] - before
+        del result
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def run(sizes, repeat: int, budget: float, seed: int) -> dict:
+    results = {name: {} for name in CASES}
+    for size in sizes:
+        start = time.perf_counter()
+        payload = generate_thread(size, seed=seed)
+        thread = {'payload': payload, 'text': json.dumps(payload), 'comments': return_comments(payload)}
+        print(f"\n{size} comments ({len(thread['text']) / 1e6:.1f} MB of JSON, "
+              f"generated in {time.perf_counter() - start:.1f}s)")
+        for name, case in CASES.items():
+            timing = measure_time(case, thread, repeat, budget)
+            peak = measure_peak_memory(case, thread)
+            results[name][str(size)] = dict(timing, peak_bytes=peak)
+            print(f"  {name:<30} {timing['seconds'] * 1000:>10.2f} ms {peak / 1e6:>10.2f} MB "
+                  f"({timing['calibrated']:.2f}x calibration)")
+        del thread, payload
+    return results
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list:
+    """
+    Prints every case next to its baseline and returns the regressions. time is the ratio of
+    the calibrated times, host how much slower the calibration workload ran than for the baseline.
+    """
+    regressions = []
+    print(f"\nAgainst the baseline from {baseline.get('machine', '?')}, Python {baseline.get('python', '?')}:")
+    print(f"{'case':<30} {'size':>7} {'time':>8} {'memory':>8} {'host':>8}")
+    for name, sizes in results.items():
+        for size, current in sizes.items():
+            reference = baseline['results'].get(name, {}).get(size)
+            if reference is None:
+                continue
+            if not reference.get('calibrated'):
+                print(f"{name:<30} {size:>7}  baseline without calibration, save it again")
+                continue
+            time_ratio = current['calibrated'] / reference['calibrated']
+            host_ratio = current['calibration_seconds'] / reference['calibration_seconds']
+            memory_ratio = current['peak_bytes'] / reference['peak_bytes'] if reference['peak_bytes'] else 1.0
+            regressed = time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance
+            print(f"{name:<30} {size:>7} {time_ratio:>7.2f}x {memory_ratio:>7.2f}x {host_ratio:>7.2f}x"
+                  f"{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append((name, size))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thread parsing and comment ranking against a baseline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000, 500000])
+    parser.add_argument("--repeat", type=int, default=7, help="Most samples per case")
+    parser.add_argument("--budget", type=float, default=3.0, help="Seconds of samples per case, at least one")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="Exit with an error on regressions")
+    parser.add_argument("--time-tolerance", type=float, default=0.3, help="Allowed slowdown, 0.3 = 30%%")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1, help="Allowed memory increase")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.budget, args.seed)
+
+    if args.save_baseline:
+        baseline = {'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(machine=platform.platform(), python=platform.python_version())
+        for name, sizes in results.items():
+            baseline['results'].setdefault(name, {}).update(sizes)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nSaved the baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline to store one")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    print(f"\n{len(regressions)} regressions")
+    if regressions and args.check:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
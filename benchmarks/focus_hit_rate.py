@@ -0,0 +1,95 @@
+"""
+Measures how many cache misses fuzzy focus matching turns into hits.
+
+Every stored analysis was a cache miss when it was created. The analyses are replayed in
+timestamp order against an index holding the ones stored before them, and each one counts
+as a hit if an earlier analysis of the same thread, length and tone would now be reused:
+    canonical   same focus after canonicalization (case, punctuation, whitespace)
+    fuzzy       most similar cached focus at or above the similarity threshold
+Hits are at the key level; the comment-count tolerance check applied afterwards in the app
+is not replayed.
+
+Usage:
+    python benchmarks/focus_hit_rate.py analyses.csv [--thresholds 0.7 0.8 0.9] [--show 10]
+    python benchmarks/focus_hit_rate.py analyses.db
+"""
+import os
+import sys
+import argparse
+import contextlib
+
+# Add the frontend directory to path to allow importing the cache backends
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend"))
+from cache_backends import CacheBackend, IndexedCache, SqliteCacheBackend, read_csv_rows
+
+class ReplayBackend(CacheBackend):
+    """Empty in-memory backend that only keeps the index fed."""
+
+    name = "replay"
+
+    def __init__(self):
+        self.next_id = 0
+
+    def load_metadata(self):
+        return []
+
+    def upsert(self, row, row_id=None):
+        self.next_id += 1
+        return self.next_id
+
+    def __len__(self):
+        return self.next_id
+
+def load_rows(path):
+    if path.endswith(".db"):
+        backend = SqliteCacheBackend(path)
+        rows = backend.load_metadata()
+        backend.close()
+        return rows
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        return read_csv_rows(file)
+
+def replay(rows, threshold):
+    """Returns the number of hits and the (requested, reused) focus pairs of the fuzzy hits."""
+    cache = IndexedCache(ReplayBackend())
+    cache.matcher.threshold = threshold
+    hits, fuzzy_pairs = 0, []
+    for row in rows:
+        key = (row['url'], row['summary_focus'], row['summary_length'], row['tone'])
+        with contextlib.redirect_stdout(None):
+            matches = cache.find(*key)
+        if matches:
+            hits += 1
+            if cache._key(matches[0]) != cache._key(row):
+                fuzzy_pairs.append((row['summary_focus'], matches[0]['summary_focus']))
+        cache.upsert(row)
+    return hits, fuzzy_pairs
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the cache hit rate gained by fuzzy focus matching")
+    parser.add_argument("cache", help="CSV cache file or SQLite cache database")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.8, 0.9])
+    parser.add_argument("--show", type=int, default=10, help="Fuzzy matches to print at the lowest threshold")
+    args = parser.parse_args()
+
+    rows = sorted(load_rows(args.cache), key=lambda row: str(row.get('timestamp') or ''))
+    if not rows:
+        print(f"{args.cache} holds no analyses")
+        return
+    custom = sum(1 for row in rows if row['summary_focus'] != 'General Summary')
+    print(f"{len(rows)} analyses, {custom} with a custom focus")
+
+    # A threshold above 1 never matches: canonicalization only
+    canonical_hits, _ = replay(rows, float("inf"))
+    print(f"{'canonical':<16} {canonical_hits:6d} reused ({canonical_hits / len(rows):6.1%})")
+    fuzzy_pairs = []
+    for threshold in sorted(args.thresholds):
+        hits, pairs = replay(rows, threshold)
+        fuzzy_pairs = fuzzy_pairs or pairs
+        print(f"{f'fuzzy >= {threshold:.2f}':<16} {hits:6d} reused ({hits / len(rows):6.1%})")
+
+    for requested, reused in fuzzy_pairs[:args.show]:
+        print(f"  '{requested}' -> '{reused}'")
+
+if __name__ == "__main__":
+    main()
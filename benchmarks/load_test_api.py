@@ -0,0 +1,140 @@
+"""
+Load test of the analysis API (frontend/api_server.py) against the Reddit and LLM stubs.
+
+Starts both stubs in this process and the API server as a subprocess pointed at them
+(REDDIT_BASE_URL, LLM_BASE_URL), with an empty SQLite cache. Then sends --requests
+POST /analyze requests with --concurrency in flight, spread over --threads distinct
+threads and --tones tones, so later requests hit the cache. Reports requests/sec,
+latency percentiles and response statuses. --api-url tests an already running server
+instead; it must have been started with the stub URLs in its environment.
+
+Usage:
+    python benchmarks/load_test_api.py [--requests 200] [--concurrency 16] [--threads 20]
+    python benchmarks/load_test_api.py --llm-latency 1.0 --workers 8
+"""
+import os
+import sys
+import time
+import random
+import socket
+import asyncio
+import tempfile
+import argparse
+import subprocess
+from collections import Counter
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stubs import start_stubs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TONES = ["Teacher", "Pirate", "Zen Master", "Chill Bro", "Valley Girl"]
+
+def start_api(port: int, reddit_url: str, llm_url: str, workers: int, db_path: str) -> subprocess.Popen:
+    env = dict(os.environ,
+               LOCAL_RUN="true", LOCAL_CACHE_DB_PATH=db_path, LOCAL_CACHE_CSV_PATH=db_path + ".csv",
+               CACHE_METRICS_PATH="", CACHE_WARMER_ENABLED="false",
+               REDDIT_BASE_URL=reddit_url, LLM_BASE_URL=llm_url, LLM_API_KEY="stub",
+               MODEL_NAME="stub", VLM_NAME="stub", ANALYSIS_WORKERS=str(workers))
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "frontend", "api_server.py"), "--port", str(port)],
+                            cwd=os.path.dirname(db_path), env=env, stdout=subprocess.DEVNULL)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_for_health(client: httpx.AsyncClient, api_url: str, api: subprocess.Popen = None, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if api is not None and api.poll() is not None:
+            raise RuntimeError(f"The API server exited with code {api.returncode}")
+        try:
+            if (await client.get(f"{api_url}/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"The API at {api_url} didn't come up")
+
+async def run_load(api_url: str, api: subprocess.Popen, args) -> tuple:
+    rng = random.Random(args.seed)
+    requests = [{
+        'url': f"https://www.reddit.com/r/loadtest/comments/t{rng.randrange(args.threads)}/generated_thread/",
+        'tone': rng.choice(TONES[:args.tones]),
+        'analyze_image': False,
+    } for _ in range(args.requests)]
+
+    latencies, statuses = [], Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout + 10,
+                                 limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        await wait_for_health(client, api_url, api)
+
+        async def send(payload):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(f"{api_url}/analyze", json=dict(payload, wait=args.timeout))
+                    status = str(response.status_code)
+                    if response.status_code == 200:
+                        status += f" {response.json()['status']}"
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(payload) for payload in requests))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the analysis API against the Reddit and LLM stubs")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--threads", type=int, default=20, help="Distinct threads requested")
+    parser.add_argument("--tones", type=int, default=2, help="Distinct tones requested (1-5)")
+    parser.add_argument("--workers", type=int, default=4, help="ANALYSIS_WORKERS of the API server")
+    parser.add_argument("--reddit-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--comments", type=int, default=200, help="Comments per generated thread")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds a request waits for its analysis")
+    parser.add_argument("--port", type=int, help="Port of the started API server (default: a free one)")
+    parser.add_argument("--api-url", help="Test a running API server instead of starting one")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    reddit_url, llm_url, servers = start_stubs(reddit_latency=args.reddit_latency,
+                                               llm_latency=args.llm_latency, comments=args.comments)
+    api_url, api = args.api_url, None
+    workdir = tempfile.TemporaryDirectory()
+    if api_url is None:
+        port = args.port or free_port()
+        api_url = f"http://127.0.0.1:{port}"
+        api = start_api(port, reddit_url, llm_url, args.workers, os.path.join(workdir.name, "analyses.db"))
+
+    try:
+        latencies, statuses, elapsed = asyncio.run(run_load(api_url, api, args))
+    finally:
+        if api is not None:
+            api.terminate()
+            api.wait()
+        for server in servers:
+            server.shutdown()
+        workdir.cleanup()
+
+    print(f"{args.requests} requests, {args.concurrency} in flight, {args.threads} threads x {args.tones} tones, "
+          f"{args.workers} workers, LLM latency {args.llm_latency}s, Reddit latency {args.reddit_latency}s")
+    print(f"{len(latencies) / elapsed:.1f} requests/s over {elapsed:.1f}s")
+    print(f"latency p50 {percentile(latencies, 0.5):.2f}s  p90 {percentile(latencies, 0.9):.2f}s  "
+          f"p99 {percentile(latencies, 0.99):.2f}s  max {max(latencies):.2f}s")
+    print("statuses: " + ", ".join(f"{status}: {count}" for status, count in statuses.most_common()))
+
+if __name__ == "__main__":
+    main()
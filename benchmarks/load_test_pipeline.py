@@ -0,0 +1,207 @@
+"""
+End-to-end load test of the analysis pipeline against the Reddit and LLM stubs.
+
+Starts both stubs and runs the home page pipeline in this process (analysis_jobs.run_analysis:
+the cache lookup, fetch_thread_data, perform_new_analysis and analyze_reddit_thread) on an
+empty SQLite cache, from --users simulated users. Each user sends one request after the
+other, pausing --think-time seconds in between, until --requests have been sent.
+
+--hit-ratio sets the mix of cache hits and misses. First, --warm-threads threads are
+analyzed in every tone, outside the measurement. A hit then asks for one of them again,
+and a miss asks for a thread that wasn't seen before. Hits are served without fetching
+while they are younger than --freshness-ttl. With 0 they fetch the thread for the
+tolerance check, as older analyses do.
+
+The report shows throughput, p50/p95/p99 latency overall and for hits and misses, the
+error rate and the LLM usage. --json appends it to a file, so runs can be compared.
+The stubs' --*-error-rate options make them fail a share of their requests with 503.
+
+Usage:
+    python benchmarks/load_test_pipeline.py [--users 8] [--requests 200] [--hit-ratio 0.8]
+    python benchmarks/load_test_pipeline.py --llm-latency 1.0 --reddit-error-rate 0.05 --json runs.jsonl
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+from datetime import datetime, timezone
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stubs import start_stubs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TONES = ["Teacher", "Pirate", "Zen Master", "Chill Bro", "Valley Girl"]
+THREAD_URL = "https://www.reddit.com/r/loadtest/comments/{}/generated_thread/"
+
+def configure_environment(reddit_url: str, llm_url: str, workdir: str, freshness_ttl: float = None):
+    """Points the pipeline at the stubs and a cache in workdir. Must run before it is imported."""
+    os.environ.update(
+        LOCAL_RUN="true", CACHE_BACKEND="sqlite",
+        LOCAL_CACHE_DB_PATH=os.path.join(workdir, "analyses.db"),
+        WRITE_BEHIND_JOURNAL_DIR=os.path.join(workdir, ".write_behind"),
+        CACHE_METRICS_PATH="", CACHE_WARMER_ENABLED="false",
+        REDDIT_BASE_URL=reddit_url, LLM_BASE_URL=llm_url, LLM_API_KEY="stub",
+        MODEL_NAME="stub", VLM_NAME="stub",
+    )
+    if freshness_ttl is not None:
+        os.environ["CACHE_FRESHNESS_TTL_SECONDS"] = str(freshness_ttl)
+
+def plan_requests(count: int, hit_ratio: float, warm_threads: int, tones: int, seed: int):
+    """The warm-up (url, tone) pairs and the measured ('hit' or 'miss', url, tone) requests."""
+    rng = random.Random(seed)
+    warm = [(THREAD_URL.format(f"w{i}"), tone) for i in range(warm_threads) for tone in TONES[:tones]]
+    requests = []
+    for n in range(count):
+        if warm and rng.random() < hit_ratio:
+            requests.append(('hit', *rng.choice(warm)))
+        else:
+            requests.append(('miss', THREAD_URL.format(f"m{n}"), rng.choice(TONES[:tones])))
+    return warm, requests
+
+def run_users(requests: list, users: int, think_time: float, analyze) -> tuple:
+    """
+    Sends the requests from `users` threads, each waiting for its answer before taking the
+    next one. Returns the outcome of every request and the elapsed seconds.
+    """
+    pending = queue.Queue()
+    for request in requests:
+        pending.put(request)
+    outcomes, lock = [], threading.Lock()
+
+    def user():
+        while True:
+            try:
+                request = pending.get_nowait()
+            except queue.Empty:
+                return
+            outcome = analyze(*request)
+            with lock:
+                outcomes.append(outcome)
+            if think_time:
+                time.sleep(think_time)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix="load-user") as pool:
+        for future in [pool.submit(user) for _ in range(users)]:
+            future.result()
+    return outcomes, time.perf_counter() - start
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+def summarize(outcomes: list, elapsed: float) -> dict:
+    latencies = {'all': [o['seconds'] for o in outcomes]}
+    for kind in ('hit', 'miss'):
+        latencies[kind] = [o['seconds'] for o in outcomes if o['kind'] == kind]
+    errors = [o for o in outcomes if o['error']]
+    return {
+        'requests': len(outcomes),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(outcomes) / elapsed, 3) if elapsed else 0.0,
+        'latency': {kind: {'count': len(values), 'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95),
+                           'p99': percentile(values, 0.99), 'max': max(values, default=0.0)}
+                    for kind, values in latencies.items()},
+        'served_from_cache': sum(1 for o in outcomes if o['source'] == 'cache'),
+        'errors': len(errors),
+        'error_rate': len(errors) / len(outcomes) if outcomes else 0.0,
+        'top_errors': Counter(o['error'] for o in errors).most_common(3),
+        'llm_calls': sum(o['llm_calls'] for o in outcomes),
+        'tokens': sum(o['tokens'] for o in outcomes),
+        'llm_cost_usd': round(sum(o['llm_cost_usd'] for o in outcomes), 6),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the analysis pipeline against the Reddit and LLM stubs")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent simulated users")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests, over all users")
+    parser.add_argument("--hit-ratio", type=float, default=0.8, help="Share of requests for an analyzed thread")
+    parser.add_argument("--warm-threads", type=int, default=10, help="Threads analyzed before the measurement")
+    parser.add_argument("--tones", type=int, default=2, help="Distinct tones requested (1-5)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds a user waits between requests")
+    parser.add_argument("--freshness-ttl", type=float, help="CACHE_FRESHNESS_TTL_SECONDS, 0 makes hits fetch the thread")
+    parser.add_argument("--reddit-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--reddit-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--comments", type=int, default=200, help="Comments per generated thread")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Append the report as a JSON line to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    reddit_url, llm_url, servers = start_stubs(reddit_latency=args.reddit_latency, llm_latency=args.llm_latency,
+                                               comments=args.comments, reddit_error_rate=args.reddit_error_rate,
+                                               llm_error_rate=args.llm_error_rate)
+    workdir = tempfile.TemporaryDirectory()
+    configure_environment(reddit_url, llm_url, workdir.name, args.freshness_ttl)
+    # Imported only now: the pipeline reads its settings from the environment on import
+    sys.path.append(ROOT)
+    sys.path.append(os.path.join(ROOT, "frontend"))
+    from analysis_jobs import run_analysis
+    from analysis_options import DEFAULT_OPTIONS
+    from cache_backends import get_cache_backend, reset_cache_backends
+
+    cache = get_cache_backend()
+
+    def analyze(kind, url, tone):
+        start = time.perf_counter()
+        outcome = {'kind': kind, 'source': None, 'error': None, 'llm_calls': 0, 'tokens': 0, 'llm_cost_usd': 0.0}
+        try:
+            result = run_analysis(cache, url, dict(DEFAULT_OPTIONS, tone=tone), lambda *args: None)
+            if result['notable_comments'] is None:
+                outcome['error'] = result['analysis_result']
+            outcome['source'] = 'cache' if result['cache_time'] is not None else 'new'
+            usage = result['llm_usage']
+            outcome.update(llm_calls=usage['llm_calls'], tokens=usage['prompt_tokens'] + usage['completion_tokens'],
+                           llm_cost_usd=usage['llm_cost_usd'])
+        except Exception as e:
+            outcome['error'] = f"{type(e).__name__}: {e}"
+        outcome['seconds'] = time.perf_counter() - start
+        return outcome
+
+    warm, requests = plan_requests(args.requests, args.hit_ratio, args.warm_threads, args.tones, args.seed)
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with output:
+            warm_outcomes, warm_elapsed = run_users([('warm', url, tone) for url, tone in warm],
+                                                    args.users, 0.0, analyze)
+            outcomes, elapsed = run_users(requests, args.users, args.think_time, analyze)
+    finally:
+        reset_cache_backends()
+        for server in servers:
+            server.shutdown()
+        workdir.cleanup()
+
+    report = summarize(outcomes, elapsed)
+    warm_errors = sum(1 for o in warm_outcomes if o['error'])
+    print(f"Warm-up: {len(warm_outcomes)} analyses in {warm_elapsed:.1f}s ({warm_errors} failed)")
+    print(f"{args.requests} requests from {args.users} users, hit ratio {args.hit_ratio:.2f} "
+          f"({report['served_from_cache']} served from the cache), {args.tones} tones, "
+          f"LLM latency {args.llm_latency}s, Reddit latency {args.reddit_latency}s")
+    print(f"{report['requests_per_second']:.2f} requests/s over {elapsed:.1f}s")
+    print(f"\n{'':<6} {'count':>6} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'max (s)':>8}")
+    for kind, latency in report['latency'].items():
+        print(f"{kind:<6} {latency['count']:>6} {latency['p50']:>8.3f} {latency['p95']:>8.3f} "
+              f"{latency['p99']:>8.3f} {latency['max']:>8.3f}")
+    print(f"\nerrors: {report['errors']} ({report['error_rate']:.1%})")
+    for error, count in report['top_errors']:
+        print(f"  {count:>5} {error[:100]}")
+    print(f"LLM: {report['llm_calls']} calls, {report['tokens']} tokens, ${report['llm_cost_usd']:.4f} estimated")
+
+    if args.json:
+        config = {key: value for key, value in vars(args).items() if key not in ('json', 'verbose')}
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(report, config=config, finished=datetime.now(timezone.utc).isoformat())) + "\n")
+        print(f"Appended the report to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Local stand-ins for Reddit and the OpenAI-compatible LLM endpoint, for load tests.
+
+    Reddit stub   GET /r/<subreddit>/comments/<id>/<slug>.json returns a generated thread,
+                  the same for the same id. GET /r/<subreddit>/<listing>.json lists threads.
+    LLM stub      POST /v1/chat/completions answers every request with a canned completion.
+
+Both add a configurable latency to every response, can fail a share of the requests
+with 503 and run on threaded stdlib servers.
+Point the app at them with LLM_BASE_URL=<llm base>/v1 and thread URLs on the Reddit stub.
+
+Usage:
+    python benchmarks/stubs.py [--reddit-port 8101] [--llm-port 8102] [--llm-latency 0.5] [--llm-error-rate 0.01]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import thread_generator
+
+def generate_thread(subreddit: str, thread_id: str, comments: int = 200) -> list:
+    """A Reddit thread JSON response with `comments` comments, seeded by the thread id."""
+    return thread_generator.generate_thread(comments, seed=thread_id, subreddit=subreddit, thread_id=thread_id)
+
+def listing(subreddit: str, count: int = 25) -> dict:
+    children = [{"kind": "t3", "data": {"permalink": f"/r/{subreddit}/comments/gen{i}/generated_thread/",
+                                        "stickied": False}} for i in range(count)]
+    return {"data": {"children": children}}
+
+def completion(messages: list, model: str) -> dict:
+    prompt_chars = sum(len(m.get("content", "")) if isinstance(m.get("content"), str) else 200 for m in messages)
+    content = ("## Summary\n\nThis is a stubbed analysis of the thread. People mostly agree on the main "
+               "point, with a few dissenting replies.\n\n- Point one\n- Point two\n- Point three")
+    return {
+        "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4,
+                  "total_tokens": prompt_chars // 4 + len(content) // 4},
+    }
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    error_rate = 0.0
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+    def _fail(self) -> bool:
+        """Answers 503 for a share of error_rate of the requests. True if it did."""
+        if self.error_rate and random.random() < self.error_rate:
+            self._send_json({"error": "stub failure"}, 503)
+            return True
+        return False
+
+    def log_message(self, format, *args):
+        pass
+
+class RedditStubHandler(StubHandler):
+    comments = 200
+
+    def do_GET(self):
+        self._delay()
+        if self._fail():
+            return
+        parts = [p for p in self.path.split("?")[0].removesuffix(".json").split("/") if p]
+        if len(parts) >= 4 and parts[0] == "r" and parts[2] == "comments":
+            self._send_json(generate_thread(parts[1], parts[3], self.comments))
+        elif len(parts) == 3 and parts[0] == "r":
+            self._send_json(listing(parts[1]))
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+class LLMStubHandler(StubHandler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self._delay()
+        if self._fail():
+            return
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(completion(request.get("messages", []), request.get("model", "stub")))
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+def start_stub(handler, port: int = 0, **attributes) -> ThreadingHTTPServer:
+    """Starts a stub server in a background thread. Port 0 picks a free port (server.server_port)."""
+    handler = type(handler.__name__, (handler,), attributes)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_stubs(reddit_port: int = 0, llm_port: int = 0, reddit_latency: float = 0.2,
+                llm_latency: float = 0.5, comments: int = 200, reddit_error_rate: float = 0.0,
+                llm_error_rate: float = 0.0):
+    """Starts both stubs. Returns (reddit base URL, LLM base URL, servers)."""
+    reddit = start_stub(RedditStubHandler, reddit_port, latency=reddit_latency, comments=comments,
+                        error_rate=reddit_error_rate)
+    llm = start_stub(LLMStubHandler, llm_port, latency=llm_latency, error_rate=llm_error_rate)
+    return (f"http://127.0.0.1:{reddit.server_port}", f"http://127.0.0.1:{llm.server_port}/v1", [reddit, llm])
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Reddit and LLM stubs")
+    parser.add_argument("--reddit-port", type=int, default=8101)
+    parser.add_argument("--llm-port", type=int, default=8102)
+    parser.add_argument("--reddit-latency", type=float, default=0.2, help="Mean seconds per Reddit response")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Mean seconds per completion")
+    parser.add_argument("--comments", type=int, default=200, help="Comments per generated thread")
+    parser.add_argument("--reddit-error-rate", type=float, default=0.0, help="Share of Reddit requests failed with 503")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Share of completions failed with 503")
+    args = parser.parse_args()
+
+    reddit_url, llm_url, _ = start_stubs(args.reddit_port, args.llm_port, args.reddit_latency,
+                                         args.llm_latency, args.comments, args.reddit_error_rate,
+                                         args.llm_error_rate)
+    print(f"Reddit stub: {reddit_url}/r/test/comments/<id>/title")
+    print(f"LLM stub:    LLM_BASE_URL={llm_url}")
+    threading.Event().wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Seeded generator of Reddit thread .json payloads, for benchmarks and the Reddit stub.
+
+A payload is what Reddit returns for <thread url>.json: a listing with the post, then a
+listing with the comment tree. The same arguments always give the same payload.
+
+    comments        number of comments, replies included ('more' stubs not counted)
+    width           mean number of direct replies of a root comment; deeper comments get
+                    fewer (times decay per level)
+    depth           deepest reply level, 0 for root comments only
+    score_alpha     Pareto shape of the comment scores: lower means a heavier tail
+    quote_rate      share of comments quoting their parent (&gt; lines)
+    gif_rate        share of comments with a GIF (![gif] in the body, <img> in body_html)
+    link_rate       share of comments with a link, with &amp; escaped query strings
+    more_rate       share of reply lists cut short by a 'more' stub, like Reddit does past
+                    its comment limit
+    gallery_images  images of a gallery post, 0 for a text post
+
+Usage:
+    python benchmarks/thread_generator.py [--comments 10000] [--seed 1] [--gallery-images 4] > thread.json
+"""
+import sys
+import json
+import random
+import argparse
+
+WORDS = ("the thread people think this is why because actually source data model cost price time "
+         "game city policy team season update bug release first great bad agree disagree honestly "
+         "performance benchmark version support feature community users really never always").split()
+DOMAINS = ["github.com", "en.wikipedia.org", "www.theverge.com", "arxiv.org", "www.youtube.com"]
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def _body_words(rng: random.Random) -> int:
+    # Mostly short replies, a few long ones
+    return rng.randint(20, 400) if rng.random() < 0.05 else rng.randint(3, 60)
+
+def _link(rng: random.Random) -> str:
+    return f"https://{rng.choice(DOMAINS)}/{_text(rng, 2).replace(' ', '-')}?ref=reddit&amp;id={rng.randrange(10**6)}"
+
+def generate_thread(comments: int = 200, seed=0, subreddit: str = "bench", thread_id: str = None,
+                    width: float = 2.0, depth: int = 8, decay: float = 0.6, score_alpha: float = 1.2,
+                    quote_rate: float = 0.1, gif_rate: float = 0.02, link_rate: float = 0.05,
+                    more_rate: float = 0.02, gallery_images: int = 0) -> list:
+    """A thread .json payload with exactly `comments` comments. See the module docstring for the shape."""
+    rng = random.Random(seed)
+    thread_id = thread_id or f"{rng.randrange(36 ** 6):x}"
+    permalink = f"/r/{subreddit}/comments/{thread_id}/generated_thread/"
+    created = 1700000000 + rng.randrange(10 ** 7)
+    remaining = comments
+    next_id = 0
+
+    def comment_id():
+        nonlocal next_id
+        next_id += 1
+        return f"c{next_id:x}"
+
+    def score(level):
+        if rng.random() < 0.05:
+            return -rng.randint(1, 20)
+        return int(rng.paretovariate(score_alpha) / (1 + 0.5 * level))
+
+    def comment(level, parent_name):
+        nonlocal remaining
+        remaining -= 1
+        cid = comment_id()
+        body = _text(rng, _body_words(rng))
+        data = {
+            "id": cid, "name": f"t1_{cid}", "parent_id": parent_name, "depth": level,
+            "author": f"user_{rng.randint(1, 50000)}", "score": score(level),
+            "created_utc": created + rng.randrange(86400), "body": body, "replies": "",
+        }
+        if level and rng.random() < quote_rate:
+            data["body"] = f"&gt; {_text(rng, rng.randint(4, 20))}\n\n{body}"
+        if rng.random() < link_rate:
+            data["body"] += f" {_link(rng)}"
+        if rng.random() < gif_rate:
+            gif = f"giphy|{rng.randrange(16 ** 8):08x}"
+            data["body"] += f"\n\n![gif]({gif})"
+            data["body_html"] = (f'&lt;div class="md"&gt;&lt;p&gt;{body}&lt;/p&gt;&lt;p&gt;&lt;img src="'
+                                 f'https://i.giphy.com/{gif.split("|")[1]}.gif?width=200&amp;amp;height=200" '
+                                 f'alt="gif"/&gt;&lt;/p&gt;&lt;/div&gt;')
+
+        replies = []
+        if level < depth:
+            mean = width * decay ** level
+            count = 0
+            # Geometric number of replies with the level's mean
+            while remaining > 0 and rng.random() < mean / (mean + 1):
+                count += 1
+            for _ in range(count):
+                if remaining <= 0:
+                    break
+                replies.append(comment(level + 1, data["name"]))
+            if replies and rng.random() < more_rate:
+                hidden = [comment_id() for _ in range(rng.randint(1, 20))]
+                replies.append({"kind": "more", "data": {
+                    "count": len(hidden), "name": f"t1_{hidden[0]}", "id": hidden[0],
+                    "parent_id": data["name"], "depth": level + 1, "children": hidden,
+                }})
+        if replies:
+            data["replies"] = {"kind": "Listing", "data": {"children": replies}}
+        return {"kind": "t1", "data": data}
+
+    post_name = f"t3_{thread_id}"
+    roots = []
+    while remaining > 0:
+        roots.append(comment(0, post_name))
+
+    post = {
+        "id": thread_id, "name": post_name, "subreddit": subreddit,
+        "title": f"Generated thread {thread_id}", "author": "op", "score": rng.randint(10, 50000),
+        "created_utc": created, "permalink": permalink, "num_comments": comments,
+        "link_flair_text": rng.choice(["Discussion", "News", "Question", None]),
+        "selftext": f"{_text(rng, 120)}\n\nMore here: {_link(rng)}",
+        "url": f"https://www.reddit.com{permalink}",
+    }
+    if gallery_images:
+        post["is_gallery"] = True
+        post["url"] = f"https://www.reddit.com/gallery/{thread_id}"
+        post["media_metadata"] = {
+            f"img{i}": {"status": "valid", "e": "Image", "m": "image/jpg", "s": {
+                "u": f"https://preview.redd.it/img{i}_{thread_id}.jpg?width=1080&amp;format=pjpg&amp;auto=webp&amp;s={i:040x}",
+                "x": 1080, "y": 1350}}
+            for i in range(gallery_images)
+        }
+    return [
+        {"kind": "Listing", "data": {"children": [{"kind": "t3", "data": post}]}},
+        {"kind": "Listing", "data": {"children": roots}},
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a generated Reddit thread .json payload to stdout")
+    parser.add_argument("--comments", type=int, default=200)
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--width", type=float, default=2.0)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--score-alpha", type=float, default=1.2)
+    parser.add_argument("--quote-rate", type=float, default=0.1)
+    parser.add_argument("--gif-rate", type=float, default=0.02)
+    parser.add_argument("--more-rate", type=float, default=0.02)
+    parser.add_argument("--gallery-images", type=int, default=0)
+    args = parser.parse_args()
+    json.dump(generate_thread(args.comments, args.seed, width=args.width, depth=args.depth,
+                              score_alpha=args.score_alpha, quote_rate=args.quote_rate, gif_rate=args.gif_rate,
+                              more_rate=args.more_rate, gallery_images=args.gallery_images), sys.stdout)
+
+if __name__ == "__main__":
+    main()
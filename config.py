@@ -1,17 +1,22 @@
+import os
 import yaml
 
-prompt_file_path = "prompts.yaml"
+# prompts.yaml next to this file, whatever the working directory is
+prompt_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts.yaml")
 
-try:
-    # Try to load from the current directory
-    with open("prompts.yaml", "r", encoding="utf-8") as file:
-        prompts = yaml.safe_load(file)
-except FileNotFoundError:
+def load_prompts(path: str = prompt_file_path) -> dict:
     try:
-        # If the first attempt fails, try to load from the parent directory
-        prompt_file_path = "../" + prompt_file_path
-        with open(prompt_file_path, 'r', encoding="utf-8") as file:
-            prompts = yaml.safe_load(file)
+        with open(path, "r", encoding="utf-8") as file:
+            return yaml.safe_load(file)
     except FileNotFoundError:
-        # If both attempts fail, raise a custom error or handle it as needed
-        raise FileNotFoundError("The prompts.yaml file was not found in the current directory or the parent directory.")
\ No newline at end of file
+        raise FileNotFoundError(f"The prompts.yaml file was not found at {path}.")
+
+# Parsed once per process. Modules import this dict, so reloading updates it in place.
+prompts = load_prompts()
+
+def reload_prompts(path: str = prompt_file_path) -> dict:
+    """Re-reads prompts.yaml into the shared prompts dict, e.g. after editing it."""
+    fresh = load_prompts(path)
+    prompts.clear()
+    prompts.update(fresh)
+    return prompts
@@ -0,0 +1,194 @@
+import re
+from typing import Optional
+from urllib.parse import urlparse
+
+import lxml.html
+from lxml import etree
+
+# Tags that never carry main content. They are removed before any text is extracted.
+BOILERPLATE_TAGS = [
+    'script', 'style', 'noscript', 'template', 'nav', 'footer', 'header', 'aside',
+    'form', 'button', 'input', 'select', 'textarea', 'iframe', 'svg', 'canvas', 'dialog'
+]
+
+# class/id hints, in the spirit of Mozilla's Readability
+UNLIKELY_CANDIDATES = re.compile(
+    r"banner|breadcrumb|combx|comment|community|cookie|disqus|extra|foot|header|legends|menu|"
+    r"modal|newsletter|pager|pagination|popup|promo|related|remark|replies|rss|share|shoutbox|"
+    r"sidebar|skyscraper|social|sponsor|subscribe|tags|tool|widget|advert|ad-break|agegate",
+    re.I
+)
+MAYBE_CANDIDATES = re.compile(r"and|article|body|column|content|main|shadow|readme|post", re.I)
+POSITIVE_HINTS = re.compile(
+    r"article|body|content|entry|hentry|h-entry|main|page|pagination|post|text|blog|story|readme|markdown",
+    re.I
+)
+NEGATIVE_HINTS = re.compile(
+    r"hidden|banner|combx|comment|com-|contact|foot|footer|footnote|masthead|media|meta|outbrain|"
+    r"promo|related|scroll|share|shoutbox|sidebar|skyscraper|sponsor|shopping|tags|tool|widget",
+    re.I
+)
+
+# Elements whose own text is scored as a content block
+SCORED_TAGS = {'p', 'pre', 'td', 'blockquote', 'li', 'dd', 'h2', 'h3'}
+# Elements that can be picked as the container of the main content
+CONTAINER_TAGS = {'div', 'article', 'section', 'main', 'td', 'blockquote', 'pre', 'body'}
+MIN_BLOCK_CHARS = 25
+# lxml refuses str input that carries an XML declaration, so it is stripped before parsing
+XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>", re.I)
+
+# Per-domain extractor rules, also used for subdomains. The XPath selects the main content directly.
+# 'required' is a pattern of paths on the rule's own domain (or www.) where a missing element raises
+# ValueError instead of falling back to scoring, e.g. repository pages whose README is still loading.
+DOMAIN_RULES = {
+    'github.com': {'xpath': '//article[contains(@class, "markdown-body")]', 'required': r'/[^/]+/[^/]+/?'},
+    'huggingface.co': {'xpath': '//div[contains(@class, "model-card-content")]'},
+    'wikipedia.org': {'xpath': '//div[@id="mw-content-text"]'},
+    'medium.com': {'xpath': '//article'},
+    'stackoverflow.com': {'xpath': '//div[@id="question"] | //div[@id="answers"]'},
+    'arxiv.org': {'xpath': '//blockquote[contains(@class, "abstract")]'},
+}
+
+def normalize_whitespace(text: str) -> str:
+    return ' '.join(text.split())
+
+def find_domain_rule(domain: str) -> Optional[dict]:
+    """Returns the extractor rule for the domain or any of its parent domains."""
+    domain = domain.lower().split(':')[0]
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    parts = domain.split('.')
+    for i in range(len(parts) - 1):
+        rule = DOMAIN_RULES.get('.'.join(parts[i:]))
+        if rule:
+            return rule
+    return None
+
+def content_required(url: str, rule: dict) -> bool:
+    """Whether the rule's element must be found: only on the rule's exact domain and required paths."""
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return (bool(rule.get('required')) and DOMAIN_RULES.get(host) is rule
+            and re.fullmatch(rule['required'], parsed.path or "/") is not None)
+
+def class_weight(element) -> int:
+    """Scores an element by its class and id attributes."""
+    weight = 0
+    for attribute in (element.get('class'), element.get('id')):
+        if not attribute:
+            continue
+        if NEGATIVE_HINTS.search(attribute):
+            weight -= 25
+        if POSITIVE_HINTS.search(attribute):
+            weight += 25
+    return weight
+
+def link_density(element) -> float:
+    """Share of the element's text that sits inside links."""
+    text_length = len(normalize_whitespace(element.text_content()))
+    if not text_length:
+        return 0.0
+    link_length = sum(len(normalize_whitespace(a.text_content())) for a in element.iter('a'))
+    return link_length / text_length
+
+def prune_boilerplate(doc):
+    """Removes boilerplate tags, comments and unlikely candidates from the tree in place."""
+    etree.strip_elements(doc, etree.Comment, *BOILERPLATE_TAGS, with_tail=False)
+    for element in list(doc.iter('div', 'section', 'ul', 'table', 'span', 'p')):
+        if element.getparent() is None:
+            continue
+        hint = f"{element.get('class', '')} {element.get('id', '')}"
+        if UNLIKELY_CANDIDATES.search(hint) and not MAYBE_CANDIDATES.search(hint):
+            element.drop_tree()
+
+def score_candidates(doc) -> dict:
+    """
+    Scores content blocks by readability. Every text block adds its score to its parent
+    and half of it to its grandparent, so the element wrapping most prose wins.
+    """
+    scores = {}
+
+    def initial_score(element):
+        score = class_weight(element)
+        if element.tag in ('div', 'article', 'main'):
+            score += 5
+        elif element.tag in ('pre', 'td', 'blockquote'):
+            score += 3
+        return score
+
+    for block in doc.iter(*SCORED_TAGS):
+        text = normalize_whitespace(block.text_content())
+        if len(text) < MIN_BLOCK_CHARS:
+            continue
+        block_score = 1 + text.count(',') + min(len(text) // 100, 3)
+
+        parent = block.getparent()
+        for ancestor, share in ((parent, 1.0), (parent.getparent() if parent is not None else None, 0.5)):
+            if ancestor is None or ancestor.tag not in CONTAINER_TAGS:
+                continue
+            if ancestor not in scores:
+                scores[ancestor] = initial_score(ancestor)
+            scores[ancestor] += block_score * share
+
+    # Containers full of links (menus, link lists) are penalized
+    return {element: score * (1 - link_density(element)) for element, score in scores.items()}
+
+def select_main_elements(doc) -> list:
+    """
+    Picks the best scoring container and the siblings that score close to it.
+    Returns an empty list when nothing on the page looks like prose.
+    """
+    scores = score_candidates(doc)
+    if not scores:
+        return []
+    top = max(scores, key=scores.get)
+    parent = top.getparent()
+    if parent is None:
+        return [top]
+
+    threshold = max(10, scores[top] * 0.2)
+    selected = []
+    for sibling in parent:
+        if sibling is top or scores.get(sibling, 0) >= threshold:
+            selected.append(sibling)
+        elif sibling.tag == 'p':
+            text = normalize_whitespace(sibling.text_content())
+            if len(text) > 80 and link_density(sibling) < 0.25:
+                selected.append(sibling)
+    return selected
+
+def extract_main_content(html: str, url: str) -> str:
+    """
+    Extracts and cleans the main textual content from HTML using lxml.
+    Domain rules are tried first, then boilerplate is pruned and the content
+    block with the best readability score is returned.
+    """
+    if not html or not html.strip():
+        return ""
+    if isinstance(html, str):
+        # The text is already decoded, so the encoding named in an XHTML prolog no longer applies
+        html = XML_DECLARATION.sub("", html, count=1)
+    try:
+        doc = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return ""
+
+    rule = find_domain_rule(urlparse(url).netloc)
+    if rule:
+        matches = doc.xpath(rule['xpath'])
+        if matches:
+            for match in matches:
+                etree.strip_elements(match, etree.Comment, 'script', 'style', 'noscript', 'template',
+                                     with_tail=False)
+            return normalize_whitespace(' '.join(match.text_content() for match in matches))
+        if content_required(url, rule):
+            raise ValueError(f"Could not find the main content element for {url}.")
+
+    prune_boilerplate(doc)
+    selected = select_main_elements(doc)
+    if not selected:
+        body = doc.find('body')
+        return normalize_whitespace((body if body is not None else doc).text_content())
+    return normalize_whitespace(' '.join(element.text_content() for element in selected))
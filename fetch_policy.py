@@ -0,0 +1,220 @@
+import os
+import time
+import random
+import threading
+from typing import Callable, Dict, List, Optional, Union
+
+from scrape_functions import fetch_json_response
+from tracing import span
+
+# Attempts per fetch, across all routes
+FETCH_MAX_ATTEMPTS = int(os.getenv("FETCH_MAX_ATTEMPTS", "3"))
+# Seconds before a request on a route is given up
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "15"))
+# Backoff before retrying a route that already failed in the same fetch: a random wait
+# between 0 and min(cap, base * 2^retry) seconds ("full jitter")
+FETCH_BACKOFF_BASE_SECONDS = float(os.getenv("FETCH_BACKOFF_BASE_SECONDS", "0.5"))
+FETCH_BACKOFF_CAP_SECONDS = float(os.getenv("FETCH_BACKOFF_CAP_SECONDS", "8"))
+# A route's circuit opens after this many failures in a row and stays open for the cooldown,
+# then a single trial request decides whether it closes again. The cooldown doubles after
+# every failed trial, up to 16 times.
+FETCH_BREAKER_FAILURES = int(os.getenv("FETCH_BREAKER_FAILURES", "3"))
+FETCH_BREAKER_COOLDOWN_SECONDS = float(os.getenv("FETCH_BREAKER_COOLDOWN_SECONDS", "60"))
+# Weight of the latest request in the moving averages of a route's latency and success rate
+FETCH_EWMA_ALPHA = float(os.getenv("FETCH_EWMA_ALPHA", "0.3"))
+# Comma separated proxy URLs, each one a route of its own. Defaults to PROXY_HTTP/PROXY_HTTPS.
+FETCH_PROXIES = [p.strip() for p in os.getenv("FETCH_PROXIES", "").split(",") if p.strip()]
+
+# Client errors every route gets: deleted threads, removed content and legal blocks. A 401 or
+# 403 may be Reddit blocking the route's IP, like an HTML page instead of the JSON, so another
+# route is tried for those.
+PERMANENT_CLIENT_ERRORS = {404, 410, 451}
+
+def is_permanent_failure(status_code: Optional[int]) -> bool:
+    """
+    Whether a failed fetch would fail the same way on every route: one of the
+    PERMANENT_CLIENT_ERRORS. The route itself worked.
+    """
+    return status_code in PERMANENT_CLIENT_ERRORS
+
+class RouteStats:
+    """Moving averages and circuit breaker state of one route."""
+
+    def __init__(self, name: str, proxies: Optional[Dict], prior_latency: float):
+        self.name = name
+        self.proxies = proxies
+        self.latency = prior_latency
+        self.success_rate = 1.0
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.failed_trials = 0
+        self.trial_running = False
+        self.last_used = 0.0
+
+    def expected_cost(self) -> float:
+        """Expected seconds to a successful response: the latency of successful requests inflated by the failure rate."""
+        return self.latency / max(self.success_rate, 0.05)
+
+    def available(self, now: float, cooldown: float) -> bool:
+        """Closed, or open for longer than the cooldown with no trial request running yet."""
+        if self.opened_at is None:
+            return True
+        return now - self.opened_at >= cooldown * 2 ** min(self.failed_trials, 4) and not self.trial_running
+
+    def snapshot(self) -> dict:
+        return {
+            'route': self.name, 'requests': self.requests, 'latency': round(self.latency, 3),
+            'success_rate': round(self.success_rate, 3), 'open': self.opened_at is not None,
+        }
+
+def configured_routes(is_local: bool) -> List[tuple]:
+    """
+    (name, proxies) of the routes allowed in this mode, most preferred first.
+    Local runs go direct and fall back on the proxies. Cloud runs only use the proxies,
+    or go direct if none is configured.
+    """
+    if FETCH_PROXIES:
+        proxies = [{'http': proxy, 'https': proxy} for proxy in FETCH_PROXIES]
+    elif os.getenv("PROXY_HTTP") or os.getenv("PROXY_HTTPS"):
+        proxies = [{'http': os.getenv("PROXY_HTTP"), 'https': os.getenv("PROXY_HTTPS")}]
+    else:
+        proxies = []
+    proxy_routes = [("proxy" if i == 0 else f"proxy-{i + 1}", p) for i, p in enumerate(proxies)]
+    if is_local or not proxy_routes:
+        return [("direct", None)] + proxy_routes
+    return proxy_routes
+
+class FetchPolicy:
+    """
+    Picks the route (direct or one of the proxies) of every Reddit fetch.
+
+    Each route keeps a moving average of its latency and success rate. A fetch tries the
+    healthy route with the lowest expected time to a successful response; routes nobody
+    has measured yet are ranked in their configured order, and a route left unused for
+    the cooldown gets one probe request. After FETCH_BREAKER_FAILURES
+    failures in a row a route's circuit opens and it is skipped for the cooldown, then a
+    single trial request closes it again or reopens it. Retrying a route that already
+    failed in the same fetch waits a capped exponential backoff with full jitter; moving
+    on to another route doesn't wait. Permanent failures (see is_permanent_failure) are
+    returned right away and count as a healthy response of the route.
+    """
+
+    def __init__(self, routes: List[tuple], fetch: Callable = fetch_json_response,
+                 max_attempts: int = FETCH_MAX_ATTEMPTS, timeout: float = FETCH_TIMEOUT_SECONDS,
+                 backoff_base: float = FETCH_BACKOFF_BASE_SECONDS, backoff_cap: float = FETCH_BACKOFF_CAP_SECONDS,
+                 breaker_failures: int = FETCH_BREAKER_FAILURES, breaker_cooldown: float = FETCH_BREAKER_COOLDOWN_SECONDS,
+                 alpha: float = FETCH_EWMA_ALPHA, clock: Callable = time.monotonic, sleep: Callable = time.sleep):
+        # The configured order is the prior: a slightly higher latency for every later route
+        self.routes = [RouteStats(name, proxies, 1.0 + 0.5 * i) for i, (name, proxies) in enumerate(routes)]
+        self.fetch = fetch
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.alpha = alpha
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    def _pick(self, failed: set) -> RouteStats:
+        """The cheapest available route not failed in this fetch yet, else the cheapest available one."""
+        with self.lock:
+            now = self.clock()
+            available = [r for r in self.routes if r.available(now, self.breaker_cooldown)]
+            if not available:
+                # Every circuit is open: try the one that opened first rather than not fetching at all
+                return min(self.routes, key=lambda r: r.opened_at)
+            untried = [r for r in available if r.name not in failed]
+            candidates = untried or available
+            route = min(candidates, key=RouteStats.expected_cost)
+            # A route that lost the comparison gets no traffic, so its stats would never
+            # recover: probe it once per cooldown
+            idle = [r for r in candidates if now - r.last_used >= self.breaker_cooldown and r.requests]
+            if idle and route not in idle and not failed:
+                route = min(idle, key=lambda r: r.last_used)
+            if route.opened_at is not None:
+                route.trial_running = True
+                print(f"Trying the {route.name} route again after its circuit opened")
+            route.last_used = now
+            return route
+
+    def _record(self, route: RouteStats, seconds: float, success: bool):
+        """success: the route answered, even if the answer was a permanent failure."""
+        with self.lock:
+            route.requests += 1
+            if success:
+                # Failures count in the success rate only, their latency is mostly the timeout
+                route.latency += self.alpha * (seconds - route.latency)
+            route.success_rate += self.alpha * ((1.0 if success else 0.0) - route.success_rate)
+            route.trial_running = False
+            if success:
+                route.consecutive_failures = 0
+                if route.opened_at is not None:
+                    # Its success rate still has to recover before the route is preferred again
+                    print(f"Closed the circuit of the {route.name} route")
+                route.opened_at = None
+                route.failed_trials = 0
+            else:
+                route.consecutive_failures += 1
+                if route.opened_at is not None:
+                    route.failed_trials += 1
+                if route.opened_at is not None or route.consecutive_failures >= self.breaker_failures:
+                    if route.opened_at is None:
+                        print(f"Opened the circuit of the {route.name} route after "
+                              f"{route.consecutive_failures} failures in a row")
+                    route.opened_at = self.clock()
+
+    def backoff(self, retry: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** retry))
+
+    def fetch_json(self, url: str) -> Union[dict, str]:
+        """
+        Fetches the JSON of a Reddit URL over the best route, retrying on the others.
+        Returns the parsed JSON, or the last error message like fetch_json_response.
+        """
+        failed = {}
+        result = "Error: no route to fetch from"
+        for attempt in range(self.max_attempts):
+            route = self._pick(set(failed))
+            with span('fetch_attempt', route=route.name, attempt=attempt + 1) as attempt_span:
+                if route.name in failed:
+                    delay = self.backoff(failed[route.name] - 1)
+                    print(f"Retrying the {route.name} route in {delay:.1f}s")
+                    attempt_span.set(backoff_seconds=round(delay, 3))
+                    self.sleep(delay)
+
+                start = self.clock()
+                result, status_code = self.fetch(url, proxies=route.proxies, timeout=self.timeout)
+                success = not isinstance(result, str)
+                permanent = not success and is_permanent_failure(status_code)
+                attempt_span.set(outcome='ok' if success else 'permanent_failure' if permanent else 'failed')
+            self._record(route, self.clock() - start, success or permanent)
+            if success:
+                return result
+            if permanent:
+                print(f"Not retrying {url} (status {status_code}): {result}")
+                return result
+            failed[route.name] = failed.get(route.name, 0) + 1
+            print(f"Error on attempt {attempt + 1} over the {route.name} route: {result}")
+        return result
+
+    def snapshot(self) -> List[dict]:
+        with self.lock:
+            return [route.snapshot() for route in self.routes]
+
+_policy = None
+_policy_lock = threading.Lock()
+
+def get_fetch_policy() -> FetchPolicy:
+    """Returns the process-wide fetch policy, so route health is shared by all fetches."""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = FetchPolicy(configured_routes(os.getenv('LOCAL_RUN', 'false').lower() == 'true'))
+        return _policy
+
+def fetch_json(url: str) -> Union[dict, str]:
+    return get_fetch_policy().fetch_json(url)
@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import traceback
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path to allow importing analyze_main
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analyze_main import deep_analysis_of_thread, fetch_thread_data
+from cache_backends import CacheBackend, is_local
+from cache_metrics import metrics
+from cache_retention import parse_timestamp
+from focus_matching import same_focus
+from llm_interact import track_llm_usage
+from tracing import span
+from cache_helpers import (
+    pre_filter_analyses, filter_by_params, find_best_match, find_fresh_analysis, tolerance_drift,
+    perform_new_analysis, generate_eli5_summary, update_eli5_in_cache, replaceable_row_id, FETCH_FAILED_MESSAGE,
+    STALE_FALLBACK_MAX_AGE_SECONDS
+)
+
+# Analyses running at the same time, shared by all sessions of the process
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+# Finished jobs are kept this long for sessions that come back to collect them
+ANALYSIS_JOB_TTL_SECONDS = float(os.getenv("ANALYSIS_JOB_TTL_SECONDS", "3600"))
+
+# Stages of a job, in order. The home page shows the progress through them.
+JOB_STAGES = ['queued', 'cache', 'fetch', 'analysis', 'done']
+
+class AnalysisJob:
+    """
+    One analysis request and its progress. The worker updates it, sessions poll it.
+    status is 'queued', 'running', 'done' or 'failed'. result holds analysis_result,
+    sum_for_5yo, notable_comments, cache_time, served_focus, stale and llm_usage once the job is done.
+    """
+
+    def __init__(self, url: str, options: dict):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.options = options
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.message, self.icon = "Waiting for a free worker...", "⏳"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def progress(self, stage: str, message: str, icon: str = "ℹ️"):
+        with self.lock:
+            self.stage, self.message, self.icon = stage, message, icon
+
+    def wait(self, timeout: float = None) -> bool:
+        """Blocks until the job is done or failed. Returns False on timeout."""
+        return self.done.wait(timeout)
+
+    def snapshot(self) -> dict:
+        """A consistent copy of the job's state for display."""
+        with self.lock:
+            return {
+                'id': self.id, 'status': self.status, 'stage': self.stage,
+                'progress': JOB_STAGES.index(self.stage) / (len(JOB_STAGES) - 1),
+                'message': self.message, 'icon': self.icon,
+                'result': self.result, 'error': self.error,
+            }
+
+def run_analysis(cache: CacheBackend, url: str, options: dict, progress, fetch=fetch_thread_data) -> dict:
+    """
+    The home page pipeline: serves the analysis from the cache when it can, runs a new
+    one otherwise. options holds summary_focus, summary_length, tone, include_eli5,
+    analyze_image, search_external and max_comments. progress(stage, message, icon)
+    receives the status updates. fetch(url) returns the thread data, only called when
+    the cache can't answer without it.
+    The result's llm_usage holds the tokens, latency and estimated cost of the LLM calls
+    of this request (LLMUsage.summary), all zero when it was served from the cache.
+    served_focus is the focus the analysis was made for, which differs from the requested
+    one when the cache served an analysis of a similar custom focus. stale is True when the
+    thread couldn't be fetched and a cached analysis up to STALE_FALLBACK_MAX_AGE_SECONDS old
+    was served without the tolerance check.
+    """
+    with track_llm_usage() as usage:
+        result = _run_pipeline(cache, url, options, progress, fetch)
+    result['llm_usage'] = usage.summary()
+    return result
+
+def _run_pipeline(cache: CacheBackend, url: str, options: dict, progress, fetch) -> dict:
+    summary_focus, summary_length, tone = options['summary_focus'], options['summary_length'], options['tone']
+    include_eli5, analyze_image = options['include_eli5'], options['analyze_image']
+    search_external, max_comments = options['search_external'], options['max_comments']
+    best_match_time = None
+    served_focus = summary_focus
+
+    if cache is None:
+        progress('cache', "Error reading existing analyses. Starting new analysis...", "⚠️")
+    elif is_local:
+        progress('cache', f"Opened local {cache.name} cache with {cache.count_analyses()} analyses", "📚")
+    else:
+        progress('cache', f"Found {cache.count_analyses()} existing analyses in cloud cache", "✅")
+
+    # Cache-first: an analysis younger than the freshness TTL is served without fetching the thread
+    lookup_start = time.perf_counter()
+    best_match = find_fresh_analysis(cache, url, summary_focus, summary_length, tone, analyze_image, search_external)
+    if best_match is not None:
+        # The full row, or None if retention evicted it since the lookup
+        best_match = cache.get(best_match['id'])
+    all_thread_data = None
+    hit_outcome, comment_drift, score_drift = 'hit_fresh', None, None
+
+    if best_match is None:
+        progress('fetch', "Fetching the thread...", "📥")
+        with metrics.timer('fetch'):
+            all_thread_data = fetch(url)
+
+        # Perform filtering and analysis logic
+        lookup_start = time.perf_counter()
+        filtered_analyses = pre_filter_analyses(cache, all_thread_data, summary_focus, summary_length, tone)
+
+        if not all_thread_data['original_post']:
+            # Without the thread there is nothing to check the tolerances against:
+            # serve the newest cached analysis with the requested settings, if it isn't too old
+            param_filtered = [
+                row for row in filter_by_params(filtered_analyses, image=analyze_image, external=search_external)
+                if time.time() - parse_timestamp(row['timestamp']) <= STALE_FALLBACK_MAX_AGE_SECONDS
+            ]
+            if param_filtered:
+                newest = max(param_filtered, key=lambda row: parse_timestamp(row['timestamp']))
+                best_match = cache.get(newest['id'])
+            if best_match is None:
+                metrics.record_lookup('fetch_failed', time.perf_counter() - lookup_start)
+                progress('done', "Could not fetch the thread. Please try again later.", "❌")
+                return {
+                    'analysis_result': FETCH_FAILED_MESSAGE,
+                    'sum_for_5yo': None,
+                    'notable_comments': None,
+                    'cache_time': None,
+                    'served_focus': summary_focus,
+                    'stale': False,
+                }
+            hit_outcome = 'hit_stale'
+            progress('fetch', "Could not fetch the thread. Serving the latest cached analysis instead...", "⚠️")
+        elif not filtered_analyses:
+            metrics.record_lookup('no_cache' if cache is None else 'miss_no_entry', time.perf_counter() - lookup_start)
+            progress('analysis', "No analysis found in cache for this thread. Performing new analysis...", "🔄")
+            analysis_result, sum_for_5yo, notable_comments = perform_new_analysis(
+                cache, all_thread_data, summary_focus, summary_length, tone, include_eli5,
+                analyze_image, search_external, max_comments
+            )
+        else:
+            # Filter by image/external parameters
+            progress('fetch', "Found a match in cache. Checking if settings are same too and it's recent enough...", "🔍")
+            param_filtered = filter_by_params(filtered_analyses, image=analyze_image, external=search_external)
+
+            if not param_filtered:
+                metrics.record_lookup('miss_params', time.perf_counter() - lookup_start)
+                progress('analysis', "Performing a new analysis because the cached thread's settings do not match your request...", "🔄")
+                analysis_result, sum_for_5yo, notable_comments = perform_new_analysis(
+                    cache, all_thread_data, summary_focus, summary_length, tone, include_eli5,
+                    analyze_image, search_external, max_comments,
+                    replaceable_row_id(filtered_analyses, summary_focus)
+                )
+            else:
+                best_match = find_best_match(param_filtered, all_thread_data)
+                if best_match is not None:
+                    best_match = cache.get(best_match['id'])
+                hit_outcome = 'hit'
+                comment_drift, score_drift = tolerance_drift(param_filtered, all_thread_data)
+
+                if best_match is None:
+                    metrics.record_lookup('miss_tolerance', time.perf_counter() - lookup_start, comment_drift, score_drift)
+                    progress('analysis', "Cached thread was not recent enough. Performing new analysis...", "🔄")
+                    analysis_result, sum_for_5yo, notable_comments = perform_new_analysis(
+                        cache, all_thread_data, summary_focus, summary_length, tone, include_eli5,
+                        analyze_image, search_external, max_comments,
+                        replaceable_row_id(param_filtered, summary_focus)
+                    )
+
+    if best_match is not None:
+        progress('analysis', "Cache can be used for this thread. Retrieving analysis...", "🔍")
+        analysis_result = best_match['analysis_result']
+        notable_comments = json.loads(best_match['notable_comments'])
+        # max_comments isn't part of the cache key: a row cached with fewer comments than requested
+        # gets them ranked again from the thread, which needs no LLM call
+        if len(notable_comments[0]) < min(max_comments, best_match['number_of_comments'] or 0):
+            if all_thread_data is None:
+                with metrics.timer('fetch'):
+                    all_thread_data = fetch(url)
+            if all_thread_data['original_post']:
+                notable_comments = list(deep_analysis_of_thread(all_thread_data, max_comments))
+        notable_comments = [group[:max_comments] for group in notable_comments]
+
+        # Handle potential empty or "nan" value for eli5_summary
+        sum_for_5yo = best_match.get('eli5_summary', None)
+        if not sum_for_5yo or (isinstance(sum_for_5yo, str) and sum_for_5yo.lower() == 'nan'):
+            sum_for_5yo = None
+
+        best_match_time = best_match['timestamp']
+        served_focus = best_match['summary_focus']
+        if not same_focus(served_focus, summary_focus):
+            progress('analysis', f"Serving the cached analysis of the similar focus '{served_focus}'...", "🔍")
+        metrics.record_lookup('hit_eli5_missing' if include_eli5 and not sum_for_5yo else hit_outcome,
+                              time.perf_counter() - lookup_start, comment_drift, score_drift)
+
+        # Wanted eli5 but cache doesn't have it
+        if include_eli5 and not sum_for_5yo:
+            if all_thread_data is None:
+                with metrics.timer('fetch'):
+                    all_thread_data = fetch(url)
+            if all_thread_data['original_post']:
+                progress('analysis', "ELI5 was missing in the cache. Generating ELI5 summary...", "🔄")
+                # The ELI5 goes into the served row, so it is made for that row's focus
+                sum_for_5yo = generate_eli5_summary(cache, all_thread_data, served_focus, summary_length, tone, analyze_image, search_external, max_comments)
+                update_eli5_in_cache(cache, sum_for_5yo, best_match['id'])
+                progress('done', "Retrieved existing analysis and generated ELI5 summary!", "✅")
+            else:
+                progress('done', "Retrieved existing analysis. The ELI5 summary needs the thread, which could not be fetched.", "⚠️")
+        else:
+            progress('done', "Retrieved existing analysis!", "✅")
+    else:
+        progress('done', "Analysis complete!", "✅")
+
+    return {
+        'analysis_result': analysis_result,
+        'sum_for_5yo': sum_for_5yo,
+        'notable_comments': notable_comments,
+        'cache_time': best_match_time,
+        'served_focus': served_focus,
+        'stale': hit_outcome == 'hit_stale',
+    }
+
+class JobQueue:
+    """
+    Runs analyses on a pool of worker threads shared by every session of the process.
+
+    submit() returns a job id right away. Sessions poll the job with get() across reruns
+    and page reloads until it is done. A request identical to one still queued or running
+    joins that job instead of starting another analysis.
+    """
+
+    def __init__(self, workers: int = ANALYSIS_WORKERS, ttl: float = ANALYSIS_JOB_TTL_SECONDS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+        self.ttl = ttl
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _request_key(url: str, options: dict):
+        return (url, tuple(sorted(options.items())))
+
+    def submit(self, cache: CacheBackend, url: str, options: dict) -> str:
+        key = self._request_key(url, options)
+        with self.lock:
+            self._prune()
+            for job in self.jobs.values():
+                if job.status in ('queued', 'running') and self._request_key(job.url, job.options) == key:
+                    print(f"Joining analysis job {job.id} for {url}")
+                    return job.id
+            job = AnalysisJob(url, options)
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, cache, job)
+        return job.id
+
+    def _run(self, cache: CacheBackend, job: AnalysisJob):
+        with job.lock:
+            job.status = 'running'
+        try:
+            # The job id is the trace id, so a slow request can be looked up in the traces
+            with span('analysis', request_id=job.id, url=job.url, **job.options):
+                result = run_analysis(cache, job.url, job.options, job.progress)
+            with job.lock:
+                job.result, job.status = result, 'done'
+        except Exception as e:
+            traceback.print_exc()
+            with job.lock:
+                job.error, job.status = str(e), 'failed'
+        finally:
+            job.finished = time.time()
+            job.done.set()
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished is not None and now - job.finished > self.ttl]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in ('queued', 'running', 'done', 'failed')}
+
+    def pending(self) -> int:
+        """Jobs queued or running."""
+        stats = self.stats()
+        return stats['queued'] + stats['running']
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue, starting its workers on first use."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,48 @@
+from urllib.parse import urlparse
+
+# Same defaults as the home page
+DEFAULT_OPTIONS = {
+    'summary_focus': "General Summary",
+    'summary_length': "Medium",
+    'tone': "Teacher",
+    'include_eli5': False,
+    'analyze_image': True,
+    'search_external': False,
+    'max_comments': 5,
+}
+# The choices of the home page
+SUMMARY_LENGTHS = ["Short", "Medium", "Long"]
+TONES = ["Teacher", "Foulmouthed", "Cut the Bullshit", "Clickbaiter Youtuber", "Chill Bro", "Valley Girl",
+         "Motivational Speaker", "Pirate", "Time Traveler", "Zen Master"]
+MAX_FOCUS_CHARS = 50
+MAX_COMMENTS = 500
+
+class InvalidRequest(ValueError):
+    """An analysis request with a URL or options that can't be analyzed."""
+
+def parse_options(payload: dict, other_fields=('url',)) -> dict:
+    """
+    The analysis options of a request, with the home page defaults for the missing ones.
+    other_fields are the request's fields that aren't options.
+    """
+    unknown = set(payload) - set(DEFAULT_OPTIONS) - set(other_fields)
+    if unknown:
+        raise InvalidRequest(f"Unknown fields: {', '.join(sorted(unknown))}")
+    options = {key: payload.get(key, default) for key, default in DEFAULT_OPTIONS.items()}
+    for key, default in DEFAULT_OPTIONS.items():
+        if type(options[key]) is not type(default):
+            raise InvalidRequest(f"'{key}' must be a {type(default).__name__}")
+    if options['summary_length'] not in SUMMARY_LENGTHS:
+        raise InvalidRequest(f"'summary_length' must be one of {', '.join(SUMMARY_LENGTHS)}")
+    if options['tone'] not in TONES:
+        raise InvalidRequest(f"Unknown tone '{options['tone']}'")
+    if len(options['summary_focus']) > MAX_FOCUS_CHARS:
+        raise InvalidRequest(f"'summary_focus' must be at most {MAX_FOCUS_CHARS} characters")
+    if not 1 <= options['max_comments'] <= MAX_COMMENTS:
+        raise InvalidRequest(f"'max_comments' must be between 1 and {MAX_COMMENTS}")
+    return options
+
+def parse_url(value) -> str:
+    if not isinstance(value, str) or urlparse(value).scheme not in ("http", "https"):
+        raise InvalidRequest("'url' must be a thread URL")
+    return value
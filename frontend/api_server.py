@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path to allow importing analyze_main and config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analyze_main import fetch_thread_data
+from cache_backends import get_standalone_cache
+from cache_helpers import filter_by_params, find_fresh_analysis
+from analysis_jobs import get_job_queue, ANALYSIS_WORKERS
+from analysis_options import DEFAULT_OPTIONS, InvalidRequest, parse_options, parse_url
+
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+# Seconds a request waits for its analysis before answering 202 with the job id to poll
+API_REQUEST_TIMEOUT_SECONDS = float(os.getenv("API_REQUEST_TIMEOUT_SECONDS", "120"))
+# New analyses are refused with 503 while this many jobs are queued or running
+API_MAX_PENDING_JOBS = int(os.getenv("API_MAX_PENDING_JOBS", str(ANALYSIS_WORKERS * 25)))
+# Thread fetches (GET /thread) running at the same time
+API_FETCH_WORKERS = int(os.getenv("API_FETCH_WORKERS", "8"))
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _flag(query, name, default):
+    values = query.get(name)
+    return default if not values else values[0].lower() in ("1", "true", "yes")
+
+class AnalysisApi:
+    """
+    The request handling behind the HTTP endpoints, without the HTTP parts.
+
+    Analyses run on the shared job queue of analysis_jobs, so the API and the Streamlit app
+    in the same process share workers and join identical requests. Thread fetches run on a
+    small pool of their own. Every call is bounded by a timeout.
+    """
+
+    def __init__(self, cache, timeout: float = API_REQUEST_TIMEOUT_SECONDS,
+                 max_pending: int = API_MAX_PENDING_JOBS, fetch_workers: int = API_FETCH_WORKERS):
+        self.cache = cache
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.jobs = get_job_queue()
+        self.fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="api-fetch")
+
+    def submit(self, payload: dict):
+        url = parse_url(payload.get('url'))
+        options = parse_options(payload, other_fields=('url', 'wait', 'stream'))
+        if self.jobs.pending() >= self.max_pending:
+            raise ApiError(503, "Too many analyses in progress, try again later")
+        return self.jobs.get(self.jobs.submit(self.cache, url, options))
+
+    def analyze(self, payload: dict):
+        """Waits up to 'wait' seconds (default and maximum: the request timeout) for the analysis."""
+        wait = payload.get('wait', self.timeout)
+        # bool is an int, but true and false aren't a number of seconds
+        if isinstance(wait, bool) or not isinstance(wait, (int, float)) or wait < 0:
+            raise ApiError(400, "'wait' must be a number of seconds")
+        job = self.submit(payload)
+        job.wait(min(wait, self.timeout))
+        return self.job_state(job)
+
+    def job(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ApiError(404, "Unknown or expired job")
+        return self.job_state(job)
+
+    @staticmethod
+    def job_state(job):
+        state = job.snapshot()
+        del state['icon']
+        return state
+
+    def thread(self, query: dict):
+        url = parse_url((query.get('url') or [None])[0])
+        future = self.fetch_pool.submit(fetch_thread_data, url)
+        try:
+            all_thread_data = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ApiError(504, "Fetching the thread timed out")
+        if not all_thread_data['original_post']:
+            raise ApiError(502, "Could not fetch the thread")
+        return all_thread_data
+
+    def cache_lookup(self, query: dict):
+        """
+        Cached analyses of a thread for a focus, length and tone, as metadata, newest first.
+        'fresh' is the one the app would serve without fetching the thread, if any.
+        """
+        url = parse_url((query.get('url') or [None])[0])
+        # Validated like an analysis request, which also keeps the structured analyses out
+        options = parse_options({key: values[0] for key, values in query.items()
+                                 if key in ('summary_focus', 'summary_length', 'tone')}, other_fields=())
+        focus, length, tone = options['summary_focus'], options['summary_length'], options['tone']
+        image = _flag(query, 'analyze_image', DEFAULT_OPTIONS['analyze_image'])
+        external = _flag(query, 'search_external', DEFAULT_OPTIONS['search_external'])
+        if self.cache is None:
+            return {'matches': [], 'fresh': None}
+        matches = filter_by_params(self.cache.find(url, focus, length, tone), image=image, external=external)
+        fresh = find_fresh_analysis(self.cache, url, focus, length, tone, image, external)
+        return {
+            'matches': sorted(matches, key=lambda row: str(row['timestamp']), reverse=True),
+            'fresh': self.cache.get(fresh['id']) if fresh else None,
+        }
+
+    def health(self):
+        return {'status': 'ok', 'jobs': self.jobs.stats(),
+                'cache_rows': self.cache.count_analyses() if self.cache is not None else None}
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    Each connection has a thread of its own (ThreadingHTTPServer), which only waits on the job
+    queue and the socket. A stream holds its thread for at most the request timeout, and a
+    client that stops reading or sending is dropped after the same time (the socket timeout).
+    """
+    protocol_version = "HTTP/1.1"
+    api: AnalysisApi = None
+    timeout = API_REQUEST_TIMEOUT_SECONDS
+
+    def _send_json(self, payload, status: int = 200):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            raise ApiError(400, "The body must be JSON")
+        if not isinstance(payload, dict):
+            raise ApiError(400, "The body must be a JSON object")
+        return payload
+
+    def _handle(self, route):
+        try:
+            route()
+        except ApiError as e:
+            self._send_json({'error': str(e)}, e.status)
+        except InvalidRequest as e:
+            self._send_json({'error': str(e)}, 400)
+        except Exception as e:
+            print(f"API error on {self.command} {self.path}: {e}")
+            self._send_json({'error': "Internal error"}, 500)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        routes = {
+            '/health': lambda: self._send_json(self.api.health()),
+            '/thread': lambda: self._send_json(self.api.thread(query)),
+            '/cache': lambda: self._send_json(self.api.cache_lookup(query)),
+        }
+        if parsed.path.startswith('/jobs/'):
+            self._handle(lambda: self._send_json(self.api.job(parsed.path[len('/jobs/'):])))
+        elif parsed.path in routes:
+            self._handle(routes[parsed.path])
+        else:
+            self._send_json({'error': "Not found"}, 404)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/analyze':
+            self._send_json({'error': "Not found"}, 404)
+            return
+        self._handle(self._analyze)
+
+    def _analyze(self):
+        payload = self._read_json()
+        if not payload.get('stream'):
+            state = self.api.analyze(payload)
+            self._send_json(state, 200 if state['status'] in ('done', 'failed') else 202)
+            return
+
+        # Streaming: one JSON line per progress update, the last one holds the result
+        job = self.api.submit(payload)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            deadline = time.monotonic() + self.api.timeout
+            last = None
+            while True:
+                finished = job.wait(0.25)
+                state = self.api.job_state(job)
+                event = (state['status'], state['stage'], state['message'])
+                if event != last or finished:
+                    if not finished:
+                        state = {key: value for key, value in state.items() if key != 'result'}
+                    self._send_chunk(state)
+                    last = event
+                if finished or time.monotonic() > deadline:
+                    break
+        except OSError:
+            # The client went away or stopped reading: the stream can't be finished
+            self.close_connection = True
+            return
+        except Exception as e:
+            # The status line is sent already: the error goes into the stream as its last line
+            print(f"API error while streaming {self.path}: {e}")
+            self._send_chunk({'status': 'failed', 'error': "Internal error"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_chunk(self, payload):
+        line = (json.dumps(payload, default=str) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host: str = API_HOST, port: int = API_PORT, cache=None) -> ThreadingHTTPServer:
+    """Starts the API server in a background thread and returns it."""
+    handler = type("BoundApiHandler", (ApiHandler,), {'api': AnalysisApi(cache)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the analysis pipeline over HTTP")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    try:
+        cache = get_standalone_cache()
+    except Exception as e:
+        print(f"Could not open the cache, serving without it: {e}")
+        cache = None
+    server = serve(args.host, args.port, cache)
+    print(f"Serving the analysis API on http://{args.host}:{server.server_port} "
+          f"({ANALYSIS_WORKERS} analysis workers)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        if cache is not None:
+            cache.close()
+
+if __name__ == "__main__":
+    main()
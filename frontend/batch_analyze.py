@@ -0,0 +1,265 @@
+import os
+import sys
+import copy
+import json
+import time
+import asyncio
+import argparse
+import contextvars
+from datetime import datetime, timezone
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Add parent directory to path to allow importing analyze_main and fetch_policy
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analyze_main import parse_thread_data
+from fetch_policy import fetch_json
+from cache_backends import get_standalone_cache, reset_cache_backends
+from analysis_jobs import run_analysis
+from analysis_options import parse_options, parse_url
+from tracing import span, disable_tracing
+
+# Analyses running at the same time
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# Thread fetches running at the same time
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "8"))
+# Processes parsing the fetched threads, 0 parses in the event loop's thread
+BATCH_PARSE_PROCESSES = int(os.getenv("BATCH_PARSE_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Seconds between progress lines
+BATCH_PROGRESS_SECONDS = float(os.getenv("BATCH_PROGRESS_SECONDS", "5"))
+
+def job_key(url: str, options: dict) -> str:
+    return json.dumps([url, options], sort_keys=True)
+
+def read_jobs(path: str, option_sets: list) -> list:
+    """
+    The (url, options) jobs of an input file. Each line is either a thread URL, analyzed
+    with every option set, or a JSON object with 'url' and the options of that one job.
+    Blank lines and lines starting with # are skipped, duplicate jobs are dropped.
+    """
+    jobs, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                if line.startswith('{'):
+                    payload = json.loads(line)
+                    line_jobs = [(parse_url(payload.get('url')), parse_options(payload))]
+                else:
+                    line_jobs = [(parse_url(line), parse_options(option_set)) for option_set in option_sets]
+            except ValueError as e:
+                raise SystemExit(f"{path}:{line_number}: {e}")
+            for url, options in line_jobs:
+                if job_key(url, options) not in seen:
+                    seen.add(job_key(url, options))
+                    jobs.append((url, options))
+    return jobs
+
+def read_checkpoint(path: str) -> set:
+    """The keys of the jobs already done in an output file. Failed jobs are retried."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line of an interrupted run may be cut short
+                continue
+            if record.get('status') == 'done':
+                done.add(job_key(record['url'], record['options']))
+    return done
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+class BatchAnalyzer:
+    """
+    Runs many analyses concurrently, writing one JSON line per finished job.
+
+    The event loop fetches the threads on a thread pool and parses them on a process pool.
+    Each thread is fetched once and shared by all its option sets, and only when an
+    analysis needs it: a fresh cached analysis is served without fetching. The analyses
+    run the home page pipeline (run_analysis) on a thread pool of their own, since the
+    pipeline runs its LLM calls in an event loop per call.
+    """
+
+    def __init__(self, cache, output, workers: int = BATCH_WORKERS,
+                 fetch_concurrency: int = BATCH_FETCH_CONCURRENCY, parse_processes: int = BATCH_PARSE_PROCESSES,
+                 progress_seconds: float = BATCH_PROGRESS_SECONDS):
+        self.cache = cache
+        self.output = output
+        self.workers = workers
+        self.progress_seconds = progress_seconds
+        self.fetch_pool = ThreadPoolExecutor(max_workers=fetch_concurrency, thread_name_prefix="batch-fetch")
+        self.parse_pool = (ProcessPoolExecutor(max_workers=parse_processes, initializer=disable_tracing)
+                           if parse_processes > 0 else None)
+        self.analysis_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-analysis")
+        # url -> task of the parsed thread, and the number of unfinished jobs that may need it
+        self.threads = {}
+        self.thread_users = Counter()
+        self.stats = Counter()
+        self.latencies = []
+        self.total = 0
+        self.start = None
+        self.last_progress = 0.0
+
+    async def _load_thread(self, url: str) -> dict:
+        loop = asyncio.get_running_loop()
+        with span('fetch_thread', url=url):
+            # The fetch attempts are traced as children of this span in the pool's thread
+            json_response = await loop.run_in_executor(self.fetch_pool, contextvars.copy_context().run, fetch_json, url)
+            if isinstance(json_response, str):
+                raise RuntimeError(f"Could not fetch the thread: {json_response}")
+            if self.parse_pool is None:
+                all_thread_data = parse_thread_data(json_response)
+            else:
+                # The worker processes don't export spans, so the parse is timed here
+                with span('parse_thread', process_pool=True):
+                    all_thread_data = await loop.run_in_executor(self.parse_pool, parse_thread_data, json_response)
+            if not all_thread_data['original_post']:
+                raise RuntimeError("Could not parse the thread")
+        self.stats['threads_fetched'] += 1
+        return all_thread_data
+
+    async def get_thread(self, url: str) -> dict:
+        if url not in self.threads:
+            self.threads[url] = asyncio.ensure_future(self._load_thread(url))
+        return await self.threads[url]
+
+    def _release_thread(self, url: str):
+        self.thread_users[url] -= 1
+        if self.thread_users[url] <= 0:
+            del self.thread_users[url]
+            task = self.threads.pop(url, None)
+            if task is not None and task.done() and not task.cancelled():
+                task.exception()  # Retrieved, so a failed fetch isn't reported again on exit
+
+    async def run_job(self, url: str, options: dict, semaphore: asyncio.Semaphore):
+        loop = asyncio.get_running_loop()
+
+        def fetch(thread_url):
+            # Called from an analysis thread; the pipeline may modify the thread data, so it gets a copy
+            return copy.deepcopy(asyncio.run_coroutine_threadsafe(self.get_thread(thread_url), loop).result())
+
+        async with semaphore:
+            start = time.perf_counter()
+            record = {'url': url, 'options': options}
+            try:
+                result = await loop.run_in_executor(self.analysis_pool, self._analyze, url, options, fetch)
+                source = 'cache' if result['cache_time'] is not None else 'new'
+                record.update(status='done', source=source, result=result)
+                self.stats[source] += 1
+                self.stats['llm_calls'] += result['llm_usage']['llm_calls']
+                self.stats['tokens'] += result['llm_usage']['prompt_tokens'] + result['llm_usage']['completion_tokens']
+                self.stats['llm_cost_usd'] += result['llm_usage']['llm_cost_usd']
+            except Exception as e:
+                record.update(status='failed', error=str(e))
+            finally:
+                self._release_thread(url)
+            elapsed = time.perf_counter() - start
+
+        record['elapsed'] = round(elapsed, 3)
+        record['finished'] = datetime.now(timezone.utc).isoformat()
+        self.output.write(json.dumps(record, default=str) + "\n")
+        self.output.flush()
+        self.stats[record['status']] += 1
+        self.latencies.append(elapsed)
+        if record['status'] == 'failed':
+            print(f"Failed {url}: {record['error']}")
+        if time.monotonic() - self.last_progress >= self.progress_seconds:
+            self.print_progress()
+
+    def _analyze(self, url: str, options: dict, fetch) -> dict:
+        with span('analysis', url=url, **options):
+            return run_analysis(self.cache, url, options, lambda *args: None, fetch)
+
+    def print_progress(self):
+        self.last_progress = time.monotonic()
+        finished = self.stats['done'] + self.stats['failed']
+        elapsed = time.perf_counter() - self.start
+        print(f"{finished}/{self.total} jobs ({self.stats['failed']} failed), "
+              f"{finished / elapsed if elapsed else 0:.2f} jobs/s, {self.stats['threads_fetched']} threads fetched")
+
+    async def run(self, jobs: list):
+        self.total = len(jobs)
+        self.start = time.perf_counter()
+        self.thread_users.update(url for url, _ in jobs)
+        # Bounds the jobs handed to the analysis pool, so the queue doesn't hold the whole batch
+        semaphore = asyncio.Semaphore(self.workers * 2)
+        await asyncio.gather(*(self.run_job(url, options, semaphore) for url, options in jobs))
+
+    def shutdown(self):
+        self.analysis_pool.shutdown(cancel_futures=True)
+        self.fetch_pool.shutdown(cancel_futures=True)
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(cancel_futures=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a file of thread URLs, writing the results as JSON lines")
+    parser.add_argument("input", help="One thread URL or JSON object ({\"url\": ..., options}) per line")
+    parser.add_argument("-o", "--output", required=True,
+                        help="JSONL results, appended to. Jobs already done in it are skipped")
+    parser.add_argument("--option-sets", help="JSON file with a list of option objects for the plain URLs "
+                                              "(default: the home page defaults)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the results already in the output")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Analyses at the same time")
+    parser.add_argument("--fetch-concurrency", type=int, default=BATCH_FETCH_CONCURRENCY)
+    parser.add_argument("--parse-processes", type=int, default=BATCH_PARSE_PROCESSES)
+    args = parser.parse_args()
+
+    option_sets = [{}]
+    if args.option_sets:
+        with open(args.option_sets, encoding="utf-8") as f:
+            option_sets = json.load(f)
+        if not isinstance(option_sets, list) or not all(isinstance(o, dict) for o in option_sets):
+            raise SystemExit(f"{args.option_sets} must hold a list of option objects")
+
+    jobs = read_jobs(args.input, option_sets)
+    done = set() if args.restart else read_checkpoint(args.output)
+    pending = [(url, options) for url, options in jobs if job_key(url, options) not in done]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+    if not pending:
+        return
+
+    try:
+        cache = get_standalone_cache()
+    except Exception as e:
+        print(f"Could not open the cache, analyzing without it: {e}")
+        cache = None
+
+    cut_short = False
+    if not args.restart and os.path.exists(args.output) and os.path.getsize(args.output):
+        with open(args.output, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            cut_short = f.read(1) != b"\n"
+
+    with open(args.output, "w" if args.restart else "a", encoding="utf-8") as output:
+        if cut_short:
+            # Don't append to a line an interrupted run cut short
+            output.write("\n")
+        batch = BatchAnalyzer(cache, output, args.workers, args.fetch_concurrency, args.parse_processes)
+        try:
+            asyncio.run(batch.run(pending))
+        except KeyboardInterrupt:
+            print("Interrupted. Run the same command again to resume.")
+        finally:
+            batch.shutdown()
+            reset_cache_backends()
+
+    elapsed = time.perf_counter() - batch.start
+    finished = batch.stats['done'] + batch.stats['failed']
+    print(f"{batch.stats['done']} done ({batch.stats['cache']} from the cache, {batch.stats['new']} new analyses), "
+          f"{batch.stats['failed']} failed, {len(jobs) - len(pending)} skipped")
+    print(f"{finished / elapsed if elapsed else 0:.2f} jobs/s over {elapsed:.1f}s, "
+          f"{batch.stats['threads_fetched']} threads fetched")
+    print(f"job latency p50 {percentile(batch.latencies, 0.5):.2f}s  p95 {percentile(batch.latencies, 0.95):.2f}s")
+    print(f"{batch.stats['llm_calls']} LLM calls, {batch.stats['tokens']} tokens, "
+          f"${batch.stats['llm_cost_usd']:.4f} estimated")
+
+if __name__ == "__main__":
+    main()
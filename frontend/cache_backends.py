@@ -0,0 +1,852 @@
+import os
+import re
+import csv
+import json
+import zlib
+import time
+import bisect
+import sqlite3
+import threading
+from typing import List, Dict, Optional
+
+import pandas as pd
+
+from focus_matching import FocusMatcher, canonicalize_focus
+from cache_retention import start_cache_retention, stop_cache_retention
+
+# Check if we're running in local mode
+is_local = os.getenv("LOCAL_RUN", "false").lower() == "true"
+
+# Set the cache paths accordingly
+if is_local:
+    CACHE_CSV_PATH = os.getenv("LOCAL_CACHE_CSV_PATH", "local_analyses.csv")
+else:
+    CACHE_CSV_PATH = os.getenv("CLOUD_CACHE_CSV_PATH", "reddit-links-bucket/analyses.csv")
+CACHE_DB_PATH = os.getenv("LOCAL_CACHE_DB_PATH", "analyses.db")
+
+# LLM usage of the calls that produced a row (llm_interact.LLMUsage.totals). Empty for rows
+# cached before it was recorded.
+USAGE_COLUMNS = ['llm_calls', 'prompt_tokens', 'completion_tokens', 'llm_seconds', 'llm_cost_usd']
+
+CACHE_COLUMNS = [
+    'url', 'timestamp', 'summary_focus', 'summary_length', 'tone', 'include_eli5',
+    'analyze_image', 'search_external', 'number_of_comments', 'total_score',
+    'total_ef_score', *USAGE_COLUMNS, 'analysis_result', 'eli5_summary', 'notable_comments'
+]
+
+# When reading the CSV:
+dtype_mapping = {
+    'url': str,
+    'summary_focus': str,
+    'summary_length': str,
+    'tone': str,
+    'include_eli5': bool,
+    'analyze_image': bool,
+    'search_external': bool,
+    'number_of_comments': int,
+    'total_score': int,
+    'total_ef_score': int,
+    'analysis_result': str,
+    'eli5_summary': str
+    # notable_comments, timestamp and the usage columns (empty in old rows) will be handled automatically
+}
+
+# Length and tone of the rows holding structured (stage one) analyses. They share the storage
+# of the analyses served to users, but are a kind of row of their own: never served to a user,
+# counted as an analysis or evicted to make room for one.
+STRUCTURED = "Structured"
+
+def is_structured(row: Dict) -> bool:
+    return row.get('summary_length') == STRUCTURED
+
+BOOL_COLUMNS = [col for col, dtype in dtype_mapping.items() if dtype is bool]
+KEY_COLUMNS = ['url', 'summary_focus', 'summary_length', 'tone']
+# Everything the cache lookup needs. The large payload columns are only read for the matched row.
+METADATA_COLUMNS = KEY_COLUMNS + [
+    'timestamp', 'include_eli5', 'analyze_image', 'search_external',
+    'number_of_comments', 'total_score', 'total_ef_score', *USAGE_COLUMNS
+]
+# Reddit thread URLs in their different spellings: www/old/new, with or without the
+# title slug and query string, and redd.it short links (but not v.redd.it media links)
+THREAD_ID_PATTERN = re.compile(r"(?:reddit\.com/(?:r/[^/]+/)?comments/|(?<![\w.])redd\.it/)([a-z0-9]+)", re.IGNORECASE)
+
+def canonical_thread_key(url: str) -> str:
+    """
+    Cache key of a thread URL: 'reddit:<thread id>' for Reddit thread URLs, so every
+    spelling of a thread finds its analyses. Other URLs are only stripped.
+    """
+    match = THREAD_ID_PATTERN.search(url or "")
+    if match:
+        return f"reddit:{match.group(1).lower()}"
+    return (url or "").strip()
+
+# Large columns, stored compressed apart from the metadata by the SQLite backend
+PAYLOAD_COLUMNS = ['analysis_result', 'eli5_summary', 'notable_comments']
+PAYLOAD_COMPRESSION_LEVEL = 6
+
+def compress_payload(row: Dict) -> bytes:
+    """Packs the payload columns of a row into one zlib-compressed JSON blob."""
+    payload = {col: row.get(col) for col in PAYLOAD_COLUMNS}
+    return zlib.compress(json.dumps(payload).encode("utf-8"), PAYLOAD_COMPRESSION_LEVEL)
+
+def decompress_payload(blob: bytes) -> Dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+class CacheBackend:
+    """
+    Storage for cached analyses.
+
+    Rows are dictionaries with the CACHE_COLUMNS keys plus an 'id' that identifies the
+    row inside the backend. notable_comments is stored as a JSON string.
+    """
+
+    name = "base"
+
+    def find(self, url: str, summary_focus: str, summary_length: str, tone: str) -> List[Dict]:
+        """
+        Returns all rows matching the URL, focus, length and tone.
+        Rows hold at least the METADATA_COLUMNS, use get() for the full row.
+        """
+        raise NotImplementedError
+
+    def get(self, row_id) -> Optional[Dict]:
+        """Returns the full row with the given id."""
+        raise NotImplementedError
+
+    def load_metadata(self) -> List[Dict]:
+        """Returns the id and METADATA_COLUMNS of every row."""
+        raise NotImplementedError
+
+    def upsert(self, row: Dict, row_id=None):
+        """Replaces the row with the given id, or inserts a new row if row_id is None. Returns the row id."""
+        raise NotImplementedError
+
+    def update_eli5(self, row_id, eli5_summary: str):
+        """Stores the ELI5 summary of an existing row."""
+        raise NotImplementedError
+
+    def write_batch(self, operations: List) -> List:
+        """
+        Applies a batch of ('upsert', row, row_id) and ('eli5', row_id, eli5_summary) operations.
+        Returns the row id of each operation. Backends override this to persist the whole
+        batch at once.
+        """
+        row_ids = []
+        for op, first, second in operations:
+            if op == "upsert":
+                row_ids.append(self.upsert(first, second))
+            else:
+                self.update_eli5(first, second)
+                row_ids.append(first)
+        return row_ids
+
+    def delete(self, row_ids: List):
+        """Removes the rows with the given ids."""
+        raise NotImplementedError
+
+    def set_id_listener(self, callback):
+        """
+        Registers callback({provisional id: durable id}) for backends whose upsert returns a
+        provisional id, called once those rows are stored. Other backends never call it.
+        """
+
+    def row_sizes(self) -> Dict:
+        """Returns the approximate stored size in bytes of every row, by id."""
+        raise NotImplementedError
+
+    def record_access(self, access_times: Dict):
+        """
+        Stores the last time (unix seconds) rows were served, by id, for LRU eviction.
+        Backends that can't store it cheaply ignore it.
+        """
+
+    def load_access(self) -> Dict:
+        """Returns the stored last access times by row id."""
+        return {}
+
+    def compact(self):
+        """Reclaims the space of deleted rows. Called after evictions."""
+
+    def refresh(self) -> Optional[List]:
+        """
+        Picks up rows written by other processes.
+        Returns the ids of the changed rows, or None if everything has to be reloaded.
+        Backends only written by this process have nothing to refresh.
+        """
+        return []
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def count_analyses(self) -> int:
+        """Number of the analyses served to users, without the structured analyses."""
+        return sum(1 for row in self.load_metadata() if not is_structured(row))
+
+    def close(self):
+        pass
+
+class CsvCacheBackend(CacheBackend):
+    """
+    The original cache: a single CSV file, stored locally or in the S3 bucket.
+    Every write rewrites the whole file.
+    """
+
+    name = "csv"
+
+    def __init__(self, path: str = CACHE_CSV_PATH, conn=None):
+        self.path = path
+        self.conn = conn
+        # The write-behind flusher writes from its own thread
+        self.lock = threading.RLock()
+        if conn is None:
+            self.df = pd.read_csv(path) if os.path.exists(path) else pd.DataFrame(columns=CACHE_COLUMNS)
+        else:
+            self.df = conn.read(path, input_format="csv", ttl=0)
+        self._enforce_types(self.df)
+
+    @staticmethod
+    def _enforce_types(df):
+        for col, dtype in dtype_mapping.items():
+            if col in df.columns:
+                df[col] = df[col].astype(dtype)
+
+    @staticmethod
+    def _fix_usage(row: Dict) -> Dict:
+        # pandas holds the usage columns as floats, NaN where the usage is unknown
+        for col in USAGE_COLUMNS:
+            if col in row:
+                value = row[col]
+                if pd.isna(value):
+                    row[col] = None
+                elif col not in ('llm_seconds', 'llm_cost_usd'):
+                    row[col] = int(value)
+        return row
+
+    def _row_dict(self, row_id) -> Dict:
+        row = self._fix_usage(self.df.loc[row_id].to_dict())
+        row['id'] = row_id
+        return row
+
+    def find(self, url, summary_focus, summary_length, tone):
+        with self.lock:
+            matches = self.df[
+                (self.df['url'] == url) &
+                (self.df['summary_focus'] == summary_focus) &
+                (self.df['summary_length'] == summary_length) &
+                (self.df['tone'] == tone)
+            ]
+            return [self._row_dict(row_id) for row_id in matches.index]
+
+    def get(self, row_id):
+        with self.lock:
+            if row_id not in self.df.index:
+                return None
+            return self._row_dict(row_id)
+
+    def load_metadata(self):
+        with self.lock:
+            columns = [col for col in METADATA_COLUMNS if col in self.df.columns]
+            records = self.df[columns].to_dict('records')
+            for row_id, record in zip(self.df.index, records):
+                self._fix_usage(record)
+                record['id'] = row_id
+            return records
+
+    def _apply_upsert(self, row, row_id=None):
+        new_df = pd.DataFrame([{col: row.get(col) for col in CACHE_COLUMNS}])
+        self._enforce_types(new_df)
+        if row_id is not None:
+            self.df.loc[row_id] = new_df.iloc[0]
+        else:
+            # Ids stay stable after deletions
+            row_id = int(self.df.index.max()) + 1 if len(self.df) else 0
+            new_df.index = [row_id]
+            self.df = pd.concat([self.df, new_df])
+        self._enforce_types(self.df)
+        return row_id
+
+    def _apply_eli5(self, row_id, eli5_summary):
+        self.df.loc[row_id, 'eli5_summary'] = eli5_summary
+        self.df.loc[row_id, 'include_eli5'] = True
+
+    def upsert(self, row, row_id=None):
+        with self.lock:
+            row_id = self._apply_upsert(row, row_id)
+            self._write()
+            return row_id
+
+    def update_eli5(self, row_id, eli5_summary):
+        with self.lock:
+            self._apply_eli5(row_id, eli5_summary)
+            self._write()
+
+    def write_batch(self, operations):
+        # The whole file is rewritten once for the batch
+        row_ids = []
+        with self.lock:
+            for op, first, second in operations:
+                if op == "upsert":
+                    row_ids.append(self._apply_upsert(first, second))
+                else:
+                    self._apply_eli5(first, second)
+                    row_ids.append(first)
+            self._write()
+        return row_ids
+
+    def delete(self, row_ids):
+        with self.lock:
+            self.df = self.df.drop(index=[row_id for row_id in row_ids if row_id in self.df.index])
+            self._write()
+
+    def row_sizes(self):
+        with self.lock:
+            columns = [col for col in CACHE_COLUMNS if col in self.df.columns]
+            sizes = self.df[columns].astype(str).apply(lambda column: column.str.len()).sum(axis=1)
+            return sizes.to_dict()
+
+    def _write(self):
+        if self.conn is None:
+            # Local mode: write to local CSV file
+            self.df.to_csv(self.path, index=False)
+        else:
+            # Cloud mode: write to S3 bucket
+            with self.conn.open(self.path, "w") as f:
+                self.df.to_csv(f, index=False)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.df)
+
+class SqliteCacheBackend(CacheBackend):
+    """
+    Embedded SQLite cache. Lookups use an index on (url, summary_focus, summary_length, tone)
+    and every write is a single-row transaction, so neither depends on the size of the cache.
+
+    The metadata columns live in the analyses table and the payload columns in a separate
+    payloads table as one compressed blob per row. Lookups and the index only read the small
+    metadata rows; a payload is decompressed by get() for the matched row only.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = CACHE_DB_PATH):
+        self.path = path
+        # Streamlit runs every session in its own thread, the lock serializes access
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            with self.db:
+                self.db.execute("BEGIN")
+                columns = [row[1] for row in self.db.execute("PRAGMA table_info(analyses)")]
+                if 'analysis_result' in columns:
+                    self._split_payloads()
+                else:
+                    self._create_tables()
+                    self._add_usage_columns(columns)
+
+    def _create_tables(self):
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                timestamp TEXT,
+                summary_focus TEXT NOT NULL,
+                summary_length TEXT NOT NULL,
+                tone TEXT NOT NULL,
+                include_eli5 INTEGER NOT NULL DEFAULT 0,
+                analyze_image INTEGER NOT NULL DEFAULT 0,
+                search_external INTEGER NOT NULL DEFAULT 0,
+                number_of_comments INTEGER,
+                total_score INTEGER,
+                total_ef_score INTEGER,
+                llm_calls INTEGER,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                llm_seconds REAL,
+                llm_cost_usd REAL
+            )
+        """)
+        self.db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_analyses_key
+            ON analyses (url, summary_focus, summary_length, tone)
+        """)
+        self.db.execute("CREATE TABLE IF NOT EXISTS payloads (id INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS access (id INTEGER PRIMARY KEY, last_access REAL NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _add_usage_columns(self, columns: List[str]):
+        """Adds the usage columns to a database created before they existed. The caller holds the transaction."""
+        if not columns:
+            return
+        types = {'llm_seconds': "REAL", 'llm_cost_usd': "REAL"}
+        for col in USAGE_COLUMNS:
+            if col not in columns:
+                self.db.execute(f"ALTER TABLE analyses ADD COLUMN {col} {types.get(col, 'INTEGER')}")
+
+    def _split_payloads(self):
+        """
+        One-shot migration of a database that still stores the payload columns inline.
+        Row ids are kept. The caller holds the lock and the transaction.
+        """
+        self.db.execute("DROP INDEX IF EXISTS idx_analyses_key")
+        self.db.execute("ALTER TABLE analyses RENAME TO analyses_inline")
+        self._create_tables()
+        inline_columns = [row[1] for row in self.db.execute("PRAGMA table_info(analyses_inline)")]
+        metadata = ", ".join(col for col in METADATA_COLUMNS if col in inline_columns)
+        self.db.execute(f"INSERT INTO analyses (id, {metadata}) SELECT id, {metadata} FROM analyses_inline")
+        rows = self.db.execute(f"SELECT id, {', '.join(PAYLOAD_COLUMNS)} FROM analyses_inline").fetchall()
+        self.db.executemany(
+            "INSERT INTO payloads (id, data) VALUES (?, ?)",
+            ((row['id'], compress_payload(dict(row))) for row in rows)
+        )
+        self.db.execute("DROP TABLE analyses_inline")
+        print(f"Moved the payloads of {len(rows)} analyses in {self.path} to compressed storage")
+
+    @staticmethod
+    def _row_dict(row) -> Dict:
+        row = dict(row)
+        for col in BOOL_COLUMNS:
+            row[col] = bool(row[col])
+        return row
+
+    @staticmethod
+    def _values(row) -> List:
+        """The METADATA_COLUMNS values of a row, in column order."""
+        values = []
+        for col in METADATA_COLUMNS:
+            value = row.get(col)
+            values.append(int(bool(value)) if col in BOOL_COLUMNS else value)
+        return values
+
+    def find(self, url, summary_focus, summary_length, tone):
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT id, {', '.join(METADATA_COLUMNS)} FROM analyses "
+                "WHERE url = ? AND summary_focus = ? AND summary_length = ? AND tone = ? ORDER BY id",
+                (url, summary_focus, summary_length, tone)
+            ).fetchall()
+        return [self._row_dict(row) for row in rows]
+
+    def get(self, row_id):
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT a.id, {', '.join('a.' + col for col in METADATA_COLUMNS)}, p.data "
+                "FROM analyses a LEFT JOIN payloads p ON p.id = a.id WHERE a.id = ?",
+                (row_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        row = self._row_dict(row)
+        data = row.pop('data')
+        row.update(decompress_payload(data) if data else {col: None for col in PAYLOAD_COLUMNS})
+        return row
+
+    def load_metadata(self):
+        with self.lock:
+            rows = self.db.execute(f"SELECT id, {', '.join(METADATA_COLUMNS)} FROM analyses").fetchall()
+        return [self._row_dict(row) for row in rows]
+
+    def _execute_upsert(self, row, row_id=None):
+        """Runs the upsert statements. The caller holds the lock and the transaction."""
+        values = self._values(row)
+        if row_id is not None:
+            assignments = ", ".join(f"{col} = ?" for col in METADATA_COLUMNS)
+            cursor = self.db.execute(f"UPDATE analyses SET {assignments} WHERE id = ?", values + [row_id])
+            if cursor.rowcount:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO payloads (id, data) VALUES (?, ?)", (row_id, compress_payload(row))
+                )
+                return row_id
+        placeholders = ", ".join("?" for _ in METADATA_COLUMNS)
+        cursor = self.db.execute(
+            f"INSERT INTO analyses ({', '.join(METADATA_COLUMNS)}) VALUES ({placeholders})", values
+        )
+        self.db.execute("INSERT INTO payloads (id, data) VALUES (?, ?)", (cursor.lastrowid, compress_payload(row)))
+        return cursor.lastrowid
+
+    def _execute_eli5(self, row_id, eli5_summary):
+        row = self.db.execute("SELECT data FROM payloads WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            return
+        payload = decompress_payload(row['data'])
+        payload['eli5_summary'] = eli5_summary
+        self.db.execute("UPDATE payloads SET data = ? WHERE id = ?", (compress_payload(payload), row_id))
+        self.db.execute("UPDATE analyses SET include_eli5 = 1 WHERE id = ?", (row_id,))
+
+    def upsert(self, row, row_id=None):
+        with self.lock, self.db:
+            return self._execute_upsert(row, row_id)
+
+    def update_eli5(self, row_id, eli5_summary):
+        with self.lock, self.db:
+            self._execute_eli5(row_id, eli5_summary)
+
+    def write_batch(self, operations):
+        # One transaction for the whole batch
+        row_ids = []
+        with self.lock, self.db:
+            for op, first, second in operations:
+                if op == "upsert":
+                    row_ids.append(self._execute_upsert(first, second))
+                else:
+                    self._execute_eli5(first, second)
+                    row_ids.append(first)
+        return row_ids
+
+    def delete(self, row_ids):
+        ids = [(row_id,) for row_id in row_ids]
+        with self.lock, self.db:
+            for table in ("analyses", "payloads", "access"):
+                self.db.executemany(f"DELETE FROM {table} WHERE id = ?", ids)
+
+    def row_sizes(self):
+        with self.lock:
+            rows = self.db.execute("SELECT id, length(data) FROM payloads").fetchall()
+        return {row_id: size for row_id, size in rows}
+
+    def record_access(self, access_times):
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO access (id, last_access) VALUES (?, ?)", access_times.items()
+            )
+
+    def load_access(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT id, last_access FROM access").fetchall())
+
+    def compact(self):
+        """Rebuilds the database file once more than a quarter of it is free pages."""
+        with self.lock:
+            free_pages = self.db.execute("PRAGMA freelist_count").fetchone()[0]
+            pages = self.db.execute("PRAGMA page_count").fetchone()[0]
+            if pages and free_pages / pages > 0.25:
+                self.db.execute("VACUUM")
+                print(f"Vacuumed {self.path}: {free_pages} of {pages} pages were free")
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+class IndexedCache(CacheBackend):
+    """
+    Long-lived in-process index over another backend.
+
+    The metadata of every row is loaded once into a dict keyed by
+    (thread id, canonical summary_focus, summary_length, tone). Each key holds its candidate rows
+    sorted by comment count, highest first. Writes go through to the wrapped backend and
+    update the index, so a lookup takes constant time no matter how big the cache is.
+
+    A custom focus with no exact entry falls back to the most similar focus cached for the
+    same thread, length and tone (see focus_matching), so near-identical wordings reuse the
+    existing analysis. The rows found that way keep the summary_focus they were made for;
+    focus_matching.same_focus tells them apart from exact matches.
+
+    get() records when a row was last served. The access times are kept in memory and
+    stored in the backend by flush_access(), which the retention thread calls before
+    evicting the least recently used rows.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.name = backend.name
+        self.lock = threading.RLock()
+        self._load()
+        backend.set_id_listener(self._rekey)
+
+    def _load(self):
+        self.index = {}
+        self.rows_by_id = {}
+        self.structured_rows = 0
+        # (url, summary_length, tone) -> canonical focuses cached for it
+        self.focuses = {}
+        self.matcher = FocusMatcher()
+        for row in self.backend.load_metadata():
+            self._add(row)
+        # Access times not stored in the backend yet survive a reload
+        self.accessed = getattr(self, 'accessed', {})
+        self.last_access = self.backend.load_access()
+        self.last_access.update(self.accessed)
+
+    @staticmethod
+    def _key(row):
+        return (canonical_thread_key(row['url']), canonicalize_focus(row['summary_focus']),
+                row['summary_length'], row['tone'])
+
+    @staticmethod
+    def _sort_key(row):
+        return -(row.get('number_of_comments') or 0)
+
+    def _add(self, row):
+        self.rows_by_id[row['id']] = row
+        self.structured_rows += is_structured(row)
+        key = self._key(row)
+        if key not in self.index:
+            url, focus, summary_length, tone = key
+            self.focuses.setdefault((url, summary_length, tone), set()).add(focus)
+        # bisect.insort only takes a key function from Python 3.10 on
+        rows = self.index.setdefault(key, [])
+        position = bisect.bisect_right([self._sort_key(candidate) for candidate in rows], self._sort_key(row))
+        rows.insert(position, row)
+        self.matcher.add(key[1])
+
+    def _remove(self, row_id):
+        row = self.rows_by_id.pop(row_id, None)
+        if row is None:
+            return
+        self.structured_rows -= is_structured(row)
+        key = self._key(row)
+        self.matcher.remove(key[1])
+        candidates = [candidate for candidate in self.index.get(key, []) if candidate['id'] != row_id]
+        if candidates:
+            self.index[key] = candidates
+            return
+        self.index.pop(key, None)
+        url, focus, summary_length, tone = key
+        thread_focuses = self.focuses.get((url, summary_length, tone), set())
+        thread_focuses.discard(focus)
+        if not thread_focuses:
+            self.focuses.pop((url, summary_length, tone), None)
+
+    def _rekey(self, id_changes: Dict):
+        """Moves rows written behind from their provisional ids to their durable ones."""
+        with self.lock:
+            for old_id, new_id in id_changes.items():
+                row = self.rows_by_id.get(old_id)
+                if row is None:
+                    continue
+                self._remove(old_id)
+                self._add(dict(row, id=new_id))
+                for times in (self.last_access, self.accessed):
+                    if old_id in times:
+                        times[new_id] = times.pop(old_id)
+
+    def find(self, url, summary_focus, summary_length, tone):
+        url = canonical_thread_key(url)
+        focus = canonicalize_focus(summary_focus)
+        with self.lock:
+            rows = self.index.get((url, focus, summary_length, tone))
+            if rows is None:
+                match, similarity = self.matcher.best_match(focus, self.focuses.get((url, summary_length, tone), ()))
+                if match is not None:
+                    print(f"Reusing cached focus '{match}' for '{summary_focus}' (similarity {similarity:.2f})")
+                    rows = self.index[(url, match, summary_length, tone)]
+            return [dict(row) for row in rows or []]
+
+    def get(self, row_id):
+        row = self.backend.get(row_id)
+        if row is not None:
+            with self.lock:
+                self.last_access[row_id] = self.accessed[row_id] = time.time()
+        return row
+
+    def load_metadata(self):
+        with self.lock:
+            return [dict(row) for row in self.rows_by_id.values()]
+
+    def delete(self, row_ids):
+        with self.lock:
+            self.backend.delete(row_ids)
+            for row_id in row_ids:
+                self._remove(row_id)
+                self.last_access.pop(row_id, None)
+                self.accessed.pop(row_id, None)
+
+    def row_sizes(self):
+        return self.backend.row_sizes()
+
+    def record_access(self, access_times):
+        with self.lock:
+            self.last_access.update(access_times)
+        self.backend.record_access(access_times)
+
+    def load_access(self):
+        with self.lock:
+            return dict(self.last_access)
+
+    def flush_access(self):
+        """Stores the access times recorded since the last flush in the backend."""
+        with self.lock:
+            accessed, self.accessed = self.accessed, {}
+        if accessed:
+            self.backend.record_access(accessed)
+
+    def compact(self):
+        self.backend.compact()
+
+    def upsert(self, row, row_id=None):
+        with self.lock:
+            new_id = self.backend.upsert(row, row_id)
+            if row_id is not None:
+                self._remove(row_id)
+            metadata = {col: row.get(col) for col in METADATA_COLUMNS}
+            metadata['id'] = new_id
+            self._add(metadata)
+            return new_id
+
+    def update_eli5(self, row_id, eli5_summary):
+        with self.lock:
+            self.backend.update_eli5(row_id, eli5_summary)
+            if row_id in self.rows_by_id:
+                self.rows_by_id[row_id]['include_eli5'] = True
+
+    def refresh(self):
+        with self.lock:
+            changed = self.backend.refresh()
+            if changed is None:
+                self._load()
+                return None
+            for row_id in changed:
+                self._remove(row_id)
+                row = self.backend.get(row_id)
+                if row is not None:
+                    metadata = {col: row.get(col) for col in METADATA_COLUMNS}
+                    metadata['id'] = row_id
+                    self._add(metadata)
+            return changed
+
+    def __len__(self):
+        return len(self.rows_by_id)
+
+    def count_analyses(self):
+        with self.lock:
+            return len(self.rows_by_id) - self.structured_rows
+
+    def close(self):
+        self.backend.close()
+
+def read_csv_rows(file) -> List[Dict]:
+    """Parses a CSV cache file into typed rows without loading it into pandas."""
+    def parse_bool(value):
+        return str(value).strip().lower() in ('true', '1')
+
+    def parse_int(value):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return 0
+
+    def parse_number(value, cast):
+        # Usage stays unknown (None) for rows cached before it was recorded
+        try:
+            return None if value in (None, "") else cast(float(value))
+        except ValueError:
+            return None
+
+    rows = []
+    for record in csv.DictReader(file):
+        row = {col: record.get(col) for col in CACHE_COLUMNS}
+        for col in BOOL_COLUMNS:
+            row[col] = parse_bool(row[col])
+        for col in ('number_of_comments', 'total_score', 'total_ef_score'):
+            row[col] = parse_int(row[col])
+        for col in USAGE_COLUMNS:
+            row[col] = parse_number(row[col], float if col in ('llm_seconds', 'llm_cost_usd') else int)
+        rows.append(row)
+    return rows
+
+def migrate_csv_to_sqlite(csv_path: str, backend: SqliteCacheBackend) -> int:
+    """
+    One-shot import of an existing CSV cache into the SQLite backend.
+    The migration is recorded in the database, so later calls do nothing.
+    Returns the number of imported rows.
+    """
+    if backend.get_meta('migrated_from_csv') or not os.path.exists(csv_path):
+        return 0
+
+    with open(csv_path, "r", encoding="utf-8", newline="") as file:
+        rows = read_csv_rows(file)
+
+    with backend.lock, backend.db:
+        for row in rows:
+            backend._execute_upsert(row)
+        backend.db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_csv', ?)", (csv_path,)
+        )
+    print(f"Migrated {len(rows)} analyses from {csv_path} to {backend.path}")
+    return len(rows)
+
+# Process-wide cache indexes, shared by every Streamlit session and rerun
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+def open_cache_backend(conn=None) -> CacheBackend:
+    """
+    Opens the configured storage backend.
+
+    CACHE_BACKEND selects it. Local mode: 'sqlite' (default) or 'csv'. Cloud mode: 'log'
+    (default, the append-only segmented log in the S3 bucket) or 'csv'. The first time
+    the SQLite or log backend is opened, the existing CSV cache is migrated into it.
+    """
+    default_backend = "sqlite" if conn is None else "log"
+    backend_name = os.getenv("CACHE_BACKEND", default_backend).lower()
+
+    if backend_name == "sqlite" and conn is None:
+        backend = SqliteCacheBackend(CACHE_DB_PATH)
+        migrate_csv_to_sqlite(CACHE_CSV_PATH, backend)
+        return backend
+    if backend_name == "log" and conn is not None:
+        from segmented_log_backend import SegmentedLogCacheBackend, CACHE_LOG_PATH
+        return SegmentedLogCacheBackend(conn.fs, CACHE_LOG_PATH, legacy_csv_path=CACHE_CSV_PATH)
+    return CsvCacheBackend(CACHE_CSV_PATH, conn)
+
+def get_cache_backend(conn=None) -> CacheBackend:
+    """
+    Returns the process-wide indexed cache, loading it on first use.
+    Later calls reuse the same index, so opening the cache doesn't depend on its size.
+    Unless CACHE_WRITE_BEHIND is 'false', writes are persisted by a background flusher.
+    Rows written by other processes (cloud log backend) are picked up incrementally.
+    The retention limits (CACHE_MAX_ROWS, CACHE_MAX_BYTES, CACHE_MAX_AGE_DAYS) are enforced
+    by a background thread.
+    """
+    key = "local" if conn is None else "cloud"
+    with _shared_caches_lock:
+        if key not in _shared_caches:
+            backend = open_cache_backend(conn)
+            if os.getenv("CACHE_WRITE_BEHIND", "true").lower() == "true":
+                from write_behind import WriteBehindCache, WRITE_BEHIND_JOURNAL_DIR
+                os.makedirs(WRITE_BEHIND_JOURNAL_DIR, exist_ok=True)
+                backend = WriteBehindCache(backend, os.path.join(WRITE_BEHIND_JOURNAL_DIR, f"{key}.jsonl"))
+            _shared_caches[key] = IndexedCache(backend)
+            start_cache_retention(_shared_caches[key])
+        cache = _shared_caches[key]
+    cache.refresh()
+    return cache
+
+def get_standalone_cache() -> CacheBackend:
+    """
+    The process-wide cache for scripts running outside the Streamlit app (warmer, API,
+    batch analyzer). Cloud mode needs the S3 credentials in .streamlit/secrets.toml.
+    """
+    if is_local:
+        return get_cache_backend()
+    import streamlit as st
+    from st_files_connection import FilesConnection
+    return get_cache_backend(st.connection('s3', type=FilesConnection))
+
+def reset_cache_backends():
+    """
+    Closes the process-wide cache indexes, flushing queued writes. The next
+    get_cache_backend call reloads them from storage.
+    """
+    with _shared_caches_lock:
+        caches = list(_shared_caches.values())
+        _shared_caches.clear()
+    for cache in caches:
+        stop_cache_retention(cache)
+        cache.flush_access()
+        cache.close()
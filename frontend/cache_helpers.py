@@ -1,150 +1,133 @@
 import sys
 import os
-import pandas as pd
 import json
+import time
 from datetime import datetime, timezone
 
 # Add parent directory to path to allow importing analyze_main
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from analyze_main import analyze_reddit_thread, fetch_thread_data
+from analyze_main import analyze_reddit_thread, build_structured_analysis, fetch_thread_data
+from cache_backends import CacheBackend, USAGE_COLUMNS, STRUCTURED
+from cache_metrics import metrics
+from cache_retention import parse_timestamp
+from focus_matching import same_focus
+from llm_interact import track_llm_usage
+from tracing import traced, span
 
-# Check if we're running in local mode
-is_local = os.getenv("LOCAL_RUN", "false").lower() == "true"
+# A cached analysis is reused while the thread's comment count and score stay within these fractions
+COMMENT_TOLERANCE = 0.10
+SCORE_TOLERANCE = 0.30
+# Analyses younger than this are served without fetching the thread for the tolerance check. 0 disables.
+CACHE_FRESHNESS_TTL_SECONDS = float(os.getenv("CACHE_FRESHNESS_TTL_SECONDS", "900"))
+# Analyses up to this old are served when the thread can't be fetched for the tolerance check. 0 disables.
+STALE_FALLBACK_MAX_AGE_SECONDS = float(os.getenv("STALE_FALLBACK_MAX_AGE_SECONDS", "86400"))
+# Analysis result of a request whose thread couldn't be fetched
+FETCH_FAILED_MESSAGE = "Failed to fetch thread data. Please try again later."
 
-# Set the cache CSV path accordingly
-if is_local:
-    CACHE_CSV_PATH = os.getenv("LOCAL_CACHE_CSV_PATH", "local_analyses.csv")
-else:
-    CACHE_CSV_PATH = os.getenv("CLOUD_CACHE_CSV_PATH", "reddit-links-bucket/analyses.csv")
-
-# When reading the CSV:
-dtype_mapping = {
-    'url': str,
-    'summary_focus': str, 
-    'summary_length': str,
-    'tone': str,
-    'include_eli5': bool,
-    'analyze_image': bool,
-    'search_external': bool,
-    'number_of_comments': int,
-    'total_score': int,
-    'total_ef_score': int,
-    'analysis_result': str,
-    'eli5_summary': str
-    # notable_comments and timestamp will be handled automatically
-}
-
-def pre_filter_analyses(all_analyses, all_thread_data, summary_focus, summary_length, tone):
+@traced('cache_lookup')
+def pre_filter_analyses(cache: CacheBackend, all_thread_data, summary_focus, summary_length, tone):
     """
     Pre-filters analyses based on URL, focus, length and tone.
-    Returns empty DataFrame and empty indices list if no matches.
     Returns:
-    Tuple of (Filtered DataFrame of potential matches, list of indices in original DataFrame)
+    List of potential matches (row dictionaries with their cache 'id'). Empty if no matches.
     """
-    # Ensure correct types in the DataFrame
-    for col, dtype in dtype_mapping.items():
-        if col in all_analyses.columns:
-            all_analyses[col] = all_analyses[col].astype(dtype)
-    
+    if cache is None:
+        return []
+
     if all_thread_data['original_post']:
         url = all_thread_data['original_post']['url']
     else:
         url = all_thread_data['url']
-        
-    filtered_analyses = all_analyses[
-        (all_analyses['url'] == url) &
-        (all_analyses['summary_focus'] == summary_focus) &
-        (all_analyses['summary_length'] == summary_length) &
-        (all_analyses['tone'] == tone)
-    ]
-    
-    original_indices = filtered_analyses.index.tolist()
+
+    filtered_analyses = cache.find(url, summary_focus, summary_length, tone)
     print(f"Pre-filtered {len(filtered_analyses)} potential matches based on URL, focus, length, and tone.")
-    return filtered_analyses, original_indices
+    return filtered_analyses
 
-def filter_by_params(filtered_analyses, original_indices, image, external):
+@traced('cache_fresh_lookup')
+def find_fresh_analysis(cache: CacheBackend, url, summary_focus, summary_length, tone, analyze_image, search_external,
+                        ttl: float = CACHE_FRESHNESS_TTL_SECONDS):
+    """
+    Cache-first lookup by the URL the user entered, before the thread is fetched.
+    Returns the newest analysis with compatible parameters that is younger than the TTL,
+    or None. Older analyses go through the fetch and the tolerance check instead.
+    """
+    if cache is None or ttl <= 0:
+        return None
+    candidates = filter_by_params(cache.find(url, summary_focus, summary_length, tone),
+                                  image=analyze_image, external=search_external)
+    now = time.time()
+    fresh = [row for row in candidates if now - parse_timestamp(row['timestamp']) <= ttl]
+    if not fresh:
+        return None
+    print(f"Found an analysis younger than {ttl:.0f}s, skipping the thread fetch")
+    return max(fresh, key=lambda row: parse_timestamp(row['timestamp']))
+
+def filter_by_params(filtered_analyses, image, external):
     """
     Filters analyses based on image and external search parameters.
     Allows cached entries with more analysis than requested, but rejects those with less.
     
     Returns:
-    Tuple of (DataFrame of analyses matching parameters, list of indices in original DataFrame)
+    List of analyses matching parameters
     """
-    if filtered_analyses.empty:
+    if not filtered_analyses:
         print("No pre-filtered analyses to check parameters against")
-        return filtered_analyses, []
+        return []
         
     # If user wants image analysis, cached entry must have it
     # If user wants external search, cached entry must have it
-    param_matches = filtered_analyses[
-        filtered_analyses.apply(lambda row: 
-            (not image or row['analyze_image']) and 
-            (not external or row['search_external']), 
-            axis=1
-    )]
-    
-    # Get indices from original dataframe that match with param_matches
-    # Use the position in filtered_analyses to lookup the correct index
-    matched_indices = [original_indices[filtered_analyses.index.get_loc(idx)] 
-                      for idx in param_matches.index]
+    param_matches = [
+        row for row in filtered_analyses
+        if (not image or row['analyze_image']) and (not external or row['search_external'])
+    ]
     
     print(f"Found {len(param_matches)} matches with compatible image/external parameters")
-    return param_matches, matched_indices
+    return param_matches
 
-def find_best_match(param_filtered, param_indices, all_thread_data):
+def find_best_match(param_filtered, all_thread_data, tolerance_margin=1.0):
     """
     Finds best match from parameter-filtered analyses based on tolerances.
-    Returns None and None if no match within tolerances.
+    A tolerance_margin below 1 narrows the tolerances, to find rows that are about to expire.
     Returns:
-    Tuple of (The matching row, original index) or (None, None) if no match.
+    The matching row, or None if no match within tolerances.
     """
-    if param_filtered.empty:
+    if not param_filtered:
         print("No parameter matches to check tolerances against")
-        return None, None
+        return None
         
     comment_count, total_score, total_ef_score = count_all_comments(all_thread_data['comments'])
     
     # Check tolerances
-    for i, row in enumerate(param_filtered.itertuples()):
+    for row in param_filtered:
         if check_all_tolerances(
             comment_count, total_score,
-            row.number_of_comments, row.total_score
+            row['number_of_comments'], row['total_score'],
+            tp_comment=COMMENT_TOLERANCE * tolerance_margin, tp_score=SCORE_TOLERANCE * tolerance_margin
         ):
-            return row, param_indices[i]
+            return row
             
     print("No matches found within tolerances")
-    return None, None
+    return None
 
-def generate_eli5_summary(all_thread_data, summary_focus, summary_length, tone, analyze_image, search_external, max_comments):
+def replaceable_row_id(rows, summary_focus):
     """
-    Generates only the ELI5 summary.
+    Id of the first of the rows a new analysis for the focus may replace, or None to insert
+    the new analysis as a row of its own. Rows found by fuzzy focus matching were made for
+    another focus and are never replaced.
     """
-    _, sum_for_5yo, _ = analyze_reddit_thread(
-        all_thread_data, summary_focus, summary_length, tone,
-        include_eli5=True, analyze_image=analyze_image, search_external=search_external, max_comments=max_comments, include_normal_summary=False
-    )
-    return sum_for_5yo
+    for row in rows:
+        if same_focus(row['summary_focus'], summary_focus):
+            return row['id']
+    return None
 
-def perform_new_analysis(conn, all_thread_data, summary_focus, summary_length, tone, include_eli5, analyze_image, search_external, 
-                         max_comments, all_analyses, replaceIndex=None):
+def build_cache_row(all_thread_data, summary_focus, summary_length, tone, include_eli5, analyze_image, search_external,
+                    analysis_result, sum_for_5yo, notable_comments, usage=None):
     """
-    Performs a new analysis and stores it in the cache.
+    Creates a cache row for an analysis of the thread as it is now.
+    usage is the LLMUsage of the calls that produced it, stored in the USAGE_COLUMNS.
     """
-    # Check fetching one last time
-    if not all_thread_data['original_post']:
-        all_thread_data = fetch_thread_data(all_thread_data['url'])
-        if all_thread_data['original_post'] is None:
-            return "Failed to fetch thread data. Please try again later.", None, None
-    
-    # Perform the analysis
-    analysis_result, sum_for_5yo, notable_comments = analyze_reddit_thread(
-        all_thread_data, summary_focus, summary_length, tone,
-        include_eli5, analyze_image, search_external, max_comments=max_comments
-    )
     comment_count, total_score, total_ef_score = count_all_comments(all_thread_data['comments'])
-    
-    # Create new analysis entry
-    new_analysis = {
+    return {
         'url': all_thread_data['original_post']['url'],
         'timestamp': datetime.now(timezone.utc).isoformat(),
         'summary_focus': summary_focus,
@@ -159,59 +142,116 @@ def perform_new_analysis(conn, all_thread_data, summary_focus, summary_length, t
         'analysis_result': analysis_result,
         'eli5_summary': sum_for_5yo if sum_for_5yo else "",
         'notable_comments': json.dumps(notable_comments),
+        **(usage.totals() if usage is not None else dict.fromkeys(USAGE_COLUMNS)),
     }
-    print("Adding new...")
+
+@traced('cached_structured_analysis')
+def get_structured_analysis(cache: CacheBackend, all_thread_data, summary_focus, analyze_image, search_external):
+    """
+    Returns the tone-neutral structured analysis of the thread for the focus.
+    A cached one is reused under the same parameter and tolerance rules as a summary,
+    so every length, tone and ELI5 view of a thread shares one full-thread LLM call.
+    Otherwise it is computed and cached, with the usage of its LLM calls (the structured
+    analysis, images and links), which the calling analysis also counts as its own.
+    """
+    filtered = pre_filter_analyses(cache, all_thread_data, summary_focus, STRUCTURED, STRUCTURED)
+    param_filtered = filter_by_params(filtered, image=analyze_image, external=search_external)
+    best_match = find_best_match(param_filtered, all_thread_data)
+    if best_match is not None:
+        row = cache.get(best_match['id'])
+        if row and row['analysis_result']:
+            print("Reusing the cached structured analysis")
+            return row['analysis_result']
+
+    with track_llm_usage() as usage:
+        structured_analysis = build_structured_analysis(all_thread_data, summary_focus, analyze_image, search_external)
+    if cache is not None and structured_analysis:
+        replace_id = replaceable_row_id(param_filtered + filtered, summary_focus)
+        with span('cache_write', backend=cache.name, chars=len(structured_analysis)):
+            cache.upsert(build_cache_row(
+                all_thread_data, summary_focus, STRUCTURED, STRUCTURED, False, analyze_image, search_external,
+                structured_analysis, None, [[], []], usage
+            ), replace_id)
+    return structured_analysis
+
+def tolerance_drift(rows, all_thread_data):
+    """
+    Relative change of the thread's comment count and score since it was cached, for the
+    candidate row that changed the least. A row is within tolerance while both values stay
+    below tp_comment and tp_score. Returns (None, None) without candidates or comments.
+    """
+    if not rows or not all_thread_data.get('comments'):
+        return None, None
+    comment_count, total_score, _ = count_all_comments(all_thread_data['comments'])
+
+    def drift(current, cached):
+        if not cached:
+            return 0.0 if current == cached else float('inf')
+        return abs(current - cached) / abs(cached)
+
+    return min(
+        (drift(comment_count, row['number_of_comments']), drift(total_score, row['total_score']))
+        for row in rows
+    )
+
+@traced('eli5_summary')
+def generate_eli5_summary(cache: CacheBackend, all_thread_data, summary_focus, summary_length, tone, analyze_image, search_external, max_comments):
+    """
+    Generates only the ELI5 summary, restyled from the structured analysis.
+    """
+    with metrics.timer('llm'):
+        structured_analysis = get_structured_analysis(cache, all_thread_data, summary_focus, analyze_image, search_external)
+        _, sum_for_5yo, _ = analyze_reddit_thread(
+            all_thread_data, summary_focus, summary_length, tone,
+            include_eli5=True, analyze_image=analyze_image, search_external=search_external, max_comments=max_comments,
+            include_normal_summary=False, structured_analysis=structured_analysis
+        )
+    return sum_for_5yo
+
+@traced('new_analysis')
+def perform_new_analysis(cache: CacheBackend, all_thread_data, summary_focus, summary_length, tone, include_eli5, analyze_image, search_external,
+                         max_comments, replace_id=None):
+    """
+    Performs a new analysis and stores it in the cache.
+    replace_id is the id of an outdated cache row the new analysis replaces.
+    Only the structured analysis reads the whole thread; it is shared by all tones and lengths.
+    The row stores the usage of every LLM call of the analysis, including the structured
+    analysis when it wasn't cached yet.
+    """
+    # Check fetching one last time
+    if not all_thread_data['original_post']:
+        all_thread_data = fetch_thread_data(all_thread_data['url'])
+        if all_thread_data['original_post'] is None:
+            return FETCH_FAILED_MESSAGE, None, None
     
-    # Create DataFrame and enforce types
-    new_df = pd.DataFrame([new_analysis])
-    for col, dtype in dtype_mapping.items():
-        if col in new_df.columns:
-            new_df[col] = new_df[col].astype(dtype)
-            
-    if replaceIndex is not None:
-        all_analyses.iloc[replaceIndex] = new_df.iloc[0]
-        updated_df = all_analyses
-    else:
-        updated_df = pd.concat([all_analyses, new_df], ignore_index=True)
+    # Perform the analysis
+    with metrics.timer('llm'), track_llm_usage() as usage:
+        structured_analysis = get_structured_analysis(cache, all_thread_data, summary_focus, analyze_image, search_external)
+        analysis_result, sum_for_5yo, notable_comments = analyze_reddit_thread(
+            all_thread_data, summary_focus, summary_length, tone,
+            include_eli5, analyze_image, search_external, max_comments=max_comments,
+            structured_analysis=structured_analysis
+        )
     
-    # Ensure types are correct in the final DataFrame
-    for col, dtype in dtype_mapping.items():
-        if col in updated_df.columns:
-            updated_df[col] = updated_df[col].astype(dtype)
+    # Create new analysis entry
+    new_analysis = build_cache_row(
+        all_thread_data, summary_focus, summary_length, tone, include_eli5, analyze_image, search_external,
+        analysis_result, sum_for_5yo, notable_comments, usage
+    )
+    print("Adding new...")
     
-    # Write to CSV
-    if conn is None:
-        # Local mode: write to local CSV file
-        updated_df.to_csv(CACHE_CSV_PATH, index=False)
-    else:
-        # Cloud mode: write to S3 bucket
-        with conn.open(CACHE_CSV_PATH, "w") as f:
-            updated_df.to_csv(f, index=False)
+    if cache is not None:
+        with metrics.timer('write'), span('cache_write', backend=cache.name, chars=len(analysis_result or "")):
+            cache.upsert(new_analysis, replace_id)
     
     return analysis_result, sum_for_5yo, notable_comments
 
-def update_eli5_in_cache(conn, all_analyses, sum_for_5yo, replaceIndex):
+def update_eli5_in_cache(cache: CacheBackend, sum_for_5yo, row_id):
+    """Updates the eli5_summary of a single cached row."""
     print("----------UPDATE ONLY ELI5-----------")
-    """Updates the eli5_summary in the cache."""
-    
-    # Create a dictionary with updated values, using iloc to access the row
-    updated_row = all_analyses.iloc[replaceIndex].to_dict()  # Convert row to dictionary
-    updated_row['eli5_summary'] = sum_for_5yo
-    updated_row['include_eli5'] = True
-    # Create a DataFrame from the updated dictionary
-    updated_row_df = pd.DataFrame([updated_row])
-    
-    # Replace the row at the specified index
-    all_analyses.iloc[replaceIndex] = updated_row_df.iloc[0]
-
-    # Write to CSV
-    if conn is None:
-        # Local mode: write to local CSV file
-        all_analyses.to_csv(CACHE_CSV_PATH, index=False)
-    else:
-        # Cloud mode: write to S3 bucket
-        with conn.open(CACHE_CSV_PATH, "w") as f:
-            all_analyses.to_csv(f, index=False)
+    if cache is not None:
+        with metrics.timer('write'), span('cache_write', backend=cache.name, eli5_only=True):
+            cache.update_eli5(row_id, sum_for_5yo)
 
 def count_all_comments(comments):
     """
@@ -244,7 +284,7 @@ def count_all_comments(comments):
 
 def check_all_tolerances(current_count, current_score,
                          cached_count, cached_score,
-                         tp_comment=0.10, tp_score=0.30): # tp being tolerance percentage
+                         tp_comment=COMMENT_TOLERANCE, tp_score=SCORE_TOLERANCE): # tp being tolerance percentage
     """
     Checks tolerances for count, score, and ef_score.  All inputs are now numbers.
     """
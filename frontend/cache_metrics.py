@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path to allow importing tracing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tracing import current_span
+
+# Lookup and latency events are appended to this JSONL file. Empty disables the dump.
+CACHE_METRICS_PATH = os.getenv("CACHE_METRICS_PATH", "cache_metrics.jsonl")
+CACHE_METRICS_FLUSH_SECONDS = float(os.getenv("CACHE_METRICS_FLUSH_SECONDS", "30"))
+# Serve the counters in the Prometheus text format on this port. Unset disables the endpoint.
+CACHE_METRICS_PORT = os.getenv("CACHE_METRICS_PORT")
+
+# Outcomes of a cache lookup on the home page
+LOOKUP_OUTCOMES = [
+    'hit',               # served from the cache
+    'hit_fresh',         # served from the cache within the freshness TTL, without fetching the thread
+    'hit_eli5_missing',  # served from the cache, the ELI5 summary had to be generated
+    'hit_stale',         # the thread couldn't be fetched, served a recent cached analysis without the tolerance check
+    'miss_no_entry',     # nothing cached for this thread, focus, length and tone
+    'miss_params',       # cached, but without the requested image or external link analysis
+    'miss_tolerance',    # cached, but the thread's comment count or score moved too much since
+    'no_cache',          # the cache couldn't be opened
+    'fetch_failed',      # the thread couldn't be fetched and nothing suitable was cached
+]
+# Timed stages: cache lookup, Reddit fetch, LLM calls and cache writes
+STAGES = ['lookup', 'fetch', 'llm', 'write']
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+class CacheMetrics:
+    """
+    Process-wide cache lookup counters and stage latency histograms.
+
+    Events are buffered in memory and appended to the JSONL dump by a background thread.
+    Lookups record how far the thread has drifted from the closest cached analysis
+    (relative comment count and score change), so the report can replay them against
+    other tolerances.
+    """
+
+    def __init__(self, path: str = CACHE_METRICS_PATH, flush_interval: float = CACHE_METRICS_FLUSH_SECONDS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.lookups = Counter()
+        self.latency_buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self.latency_sum = Counter()
+        self.latency_count = Counter()
+        self.buffer = []
+        self.flush_thread = None
+        atexit.register(self.flush)
+
+    def _event(self, event):
+        event['time'] = time.time()
+        with self.lock:
+            if self.path:
+                self.buffer.append(event)
+            if self.path and self.flush_thread is None:
+                self.flush_thread = threading.Thread(target=self._run, daemon=True)
+                self.flush_thread.start()
+
+    def record_lookup(self, outcome: str, seconds: float, comment_drift: float = None, score_drift: float = None):
+        with self.lock:
+            self.lookups[outcome] += 1
+        current_span().set(cache_outcome=outcome)
+        self.observe('lookup', seconds, record=False)
+        self._event({'type': 'lookup', 'outcome': outcome, 'seconds': seconds,
+                     'comment_drift': comment_drift, 'score_drift': score_drift})
+
+    def observe(self, stage: str, seconds: float, record: bool = True):
+        with self.lock:
+            buckets = self.latency_buckets[stage]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self.latency_sum[stage] += seconds
+            self.latency_count[stage] += 1
+        if record:
+            self._event({'type': 'stage', 'stage': stage, 'seconds': seconds})
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            events, self.buffer = self.buffer, []
+        if not events:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event) + "\n")
+        except OSError as e:
+            print(f"Could not write cache metrics to {self.path}: {e}")
+
+    def render_prometheus(self) -> str:
+        """The counters and histograms in the Prometheus text exposition format."""
+        lines = [
+            "# HELP reddit_analyzer_cache_lookups_total Cache lookups by outcome.",
+            "# TYPE reddit_analyzer_cache_lookups_total counter",
+        ]
+        with self.lock:
+            for outcome in LOOKUP_OUTCOMES:
+                lines.append(f'reddit_analyzer_cache_lookups_total{{outcome="{outcome}"}} {self.lookups[outcome]}')
+            lines += [
+                "# HELP reddit_analyzer_stage_seconds Latency of the cache lookup, Reddit fetch, LLM and cache write stages.",
+                "# TYPE reddit_analyzer_stage_seconds histogram",
+            ]
+            for stage in STAGES:
+                buckets = self.latency_buckets[stage]
+                for bound, count in zip(LATENCY_BUCKETS, buckets):
+                    lines.append(f'reddit_analyzer_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'reddit_analyzer_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {self.latency_count[stage]}')
+                lines.append(f'reddit_analyzer_stage_seconds_sum{{stage="{stage}"}} {self.latency_sum[stage]:.6f}')
+                lines.append(f'reddit_analyzer_stage_seconds_count{{stage="{stage}"}} {self.latency_count[stage]}')
+        return "\n".join(lines) + "\n"
+
+metrics = CacheMetrics()
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=CACHE_METRICS_PORT):
+    """Serves /metrics on the port in a background thread, once per process. Does nothing if port is unset."""
+    global _server
+    if not port:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer(("", int(port)), MetricsHandler)
+        except OSError as e:
+            print(f"Could not start the metrics endpoint on port {port}: {e}")
+            return
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        print(f"Serving cache metrics on http://localhost:{port}/metrics")
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+def report(path: str, tolerance_grid):
+    """Prints the hit ratio, miss reasons, stage latencies and a tolerance what-if table."""
+    lookups, stages = [], defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event['type'] == 'lookup':
+                lookups.append(event)
+                stages['lookup'].append(event['seconds'])
+            else:
+                stages[event['stage']].append(event['seconds'])
+
+    if lookups:
+        outcomes = Counter(event['outcome'] for event in lookups)
+        hits = outcomes['hit'] + outcomes['hit_fresh'] + outcomes['hit_eli5_missing'] + outcomes['hit_stale']
+        print(f"{len(lookups)} lookups, hit ratio {hits / len(lookups):.1%}")
+        for outcome in LOOKUP_OUTCOMES:
+            print(f"  {outcome:<18} {outcomes[outcome]:6d} ({outcomes[outcome] / len(lookups):6.1%})")
+
+    print(f"\n{'stage':<8} {'count':>7} {'p50 (s)':>9} {'p95 (s)':>9} {'max (s)':>9}")
+    for stage in STAGES:
+        values = stages.get(stage, [])
+        if values:
+            print(f"{stage:<8} {len(values):>7} {percentile(values, 0.5):>9.3f} "
+                  f"{percentile(values, 0.95):>9.3f} {max(values):>9.3f}")
+
+    # Hits and tolerance misses carry the drift of the closest cached analysis
+    drifts = [event for event in lookups if event.get('comment_drift') is not None]
+    if drifts:
+        print(f"\nTolerance what-if over {len(drifts)} lookups that found a cached analysis with matching parameters:")
+        print(f"{'tp_comment':>10} {'tp_score':>9} {'would hit':>10}")
+        for tp_comment, tp_score in tolerance_grid:
+            would_hit = sum(1 for event in drifts
+                            if event['comment_drift'] <= tp_comment and event['score_drift'] <= tp_score)
+            print(f"{tp_comment:>10.2f} {tp_score:>9.2f} {would_hit / len(drifts):>10.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cache hit ratio and latencies from the metrics dump")
+    parser.add_argument("path", nargs="?", default=CACHE_METRICS_PATH or "cache_metrics.jsonl")
+    parser.add_argument("--tp-comment", type=float, nargs="+", default=[0.05, 0.10, 0.20, 0.30])
+    parser.add_argument("--tp-score", type=float, nargs="+", default=[0.30, 0.50])
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"{args.path} does not exist")
+    report(args.path, [(c, s) for c in args.tp_comment for s in args.tp_score])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List
+
+# Retention limits of the analysis cache. 0 means no limit.
+CACHE_MAX_ROWS = int(os.getenv("CACHE_MAX_ROWS", "0"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", "0"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("CACHE_MAX_AGE_DAYS", "0"))
+# Seconds between two retention runs
+CACHE_RETENTION_INTERVAL_SECONDS = float(os.getenv("CACHE_RETENTION_INTERVAL_SECONDS", "3600"))
+
+def parse_timestamp(value) -> float:
+    """Unix time of a cached 'timestamp' value, 0 if it can't be parsed."""
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return 0.0
+
+def select_evictions(metadata: List[Dict], last_access: Dict, sizes: Dict,
+                     max_rows: int = CACHE_MAX_ROWS, max_bytes: int = CACHE_MAX_BYTES,
+                     max_age_days: float = CACHE_MAX_AGE_DAYS, now: float = None) -> List:
+    """
+    Returns the ids of the rows to evict.
+
+    Rows created more than max_age_days ago are evicted first. The remaining analyses are
+    evicted least recently used first, by the time they were last served (or created, if
+    they never were), until at most max_rows analyses and max_bytes bytes are left.
+    Structured analyses don't count towards the limits: they are evicted with the last
+    analysis of their thread and focus. Rows still waiting to be written ('pending-' ids)
+    are never evicted.
+    """
+    # cache_backends starts the retention threads, so it can't be imported at module level
+    from cache_backends import canonical_thread_key, is_structured
+    from focus_matching import canonicalize_focus
+
+    def thread_focus(row):
+        return canonical_thread_key(row.get('url')), canonicalize_focus(row.get('summary_focus'))
+
+    now = time.time() if now is None else now
+    rows, structured = [], []
+    for row in metadata:
+        if str(row['id']).startswith('pending-'):
+            continue
+        created = parse_timestamp(row.get('timestamp'))
+        entry = (max(created, last_access.get(row['id'], 0.0)), created, row['id'])
+        (structured if is_structured(row) else rows).append((entry, row))
+
+    evicted = []
+    if max_age_days:
+        cutoff = now - max_age_days * 86400
+        evicted = [entry[2] for entry, _ in rows + structured if entry[1] < cutoff]
+        rows = [(entry, row) for entry, row in rows if entry[1] >= cutoff]
+        structured = [(entry, row) for entry, row in structured if entry[1] >= cutoff]
+
+    rows.sort(key=lambda item: item[0])
+    remaining_rows = len(rows)
+    remaining_bytes = sum(sizes.get(entry[2], 0) for entry, _ in rows)
+    for entry, _ in rows:
+        if (not max_rows or remaining_rows <= max_rows) and (not max_bytes or remaining_bytes <= max_bytes):
+            break
+        evicted.append(entry[2])
+        remaining_rows -= 1
+        remaining_bytes -= sizes.get(entry[2], 0)
+
+    evicted_ids = set(evicted)
+    kept = {thread_focus(row) for row in metadata if not is_structured(row) and row['id'] not in evicted_ids}
+    evicted += [entry[2] for entry, row in structured if thread_focus(row) not in kept]
+    return evicted
+
+def enforce_retention(cache, max_rows: int = CACHE_MAX_ROWS, max_bytes: int = CACHE_MAX_BYTES,
+                      max_age_days: float = CACHE_MAX_AGE_DAYS) -> List:
+    """
+    Evicts the rows over the limits from the indexed cache and compacts its storage.
+    Returns the evicted ids.
+    """
+    cache.flush_access()
+    sizes = cache.row_sizes() if max_bytes else {}
+    evicted = select_evictions(cache.load_metadata(), cache.load_access(), sizes, max_rows, max_bytes, max_age_days)
+    if evicted:
+        cache.delete(evicted)
+        cache.compact()
+        print(f"Evicted {len(evicted)} rows from the {cache.name} cache, {cache.count_analyses()} analyses left")
+    return evicted
+
+def retention_enabled() -> bool:
+    return bool(CACHE_MAX_ROWS or CACHE_MAX_BYTES or CACHE_MAX_AGE_DAYS)
+
+# Stop events of the running retention threads, by cache
+_retention_threads = {}
+_retention_lock = threading.Lock()
+
+def start_cache_retention(cache, interval: float = CACHE_RETENTION_INTERVAL_SECONDS):
+    """Starts the background retention thread of the cache once, if a limit is configured."""
+    if not retention_enabled():
+        return
+    with _retention_lock:
+        if id(cache) in _retention_threads:
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.is_set():
+                try:
+                    enforce_retention(cache)
+                except Exception as e:
+                    print(f"Cache retention run failed: {e}")
+                stop.wait(interval)
+
+        _retention_threads[id(cache)] = stop
+        threading.Thread(target=run, daemon=True).start()
+
+def stop_cache_retention(cache):
+    """Stops the retention thread of the cache, if it has one."""
+    with _retention_lock:
+        stop = _retention_threads.pop(id(cache), None)
+    if stop is not None:
+        stop.set()
@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from itertools import product
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path to allow importing scrape_functions
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scrape_functions import return_listing_threads
+from fetch_policy import fetch_json
+from cache_backends import CacheBackend, get_standalone_cache
+from cache_helpers import (
+    pre_filter_analyses, filter_by_params, find_best_match, replaceable_row_id, perform_new_analysis, fetch_thread_data
+)
+
+def _env_list(name: str, default: str):
+    return [value.strip() for value in os.getenv(name, default).split(",") if value.strip()]
+
+# Run the warmer in the background of the app process
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "false").lower() == "true"
+# Listings read on every cycle: https://www.reddit.com/r/<subreddit>/<listing>.json
+CACHE_WARMER_SUBREDDITS = _env_list("CACHE_WARMER_SUBREDDITS", "popular")
+CACHE_WARMER_LISTINGS = _env_list("CACHE_WARMER_LISTINGS", "hot,rising")
+CACHE_WARMER_THREADS_PER_LISTING = int(os.getenv("CACHE_WARMER_THREADS_PER_LISTING", "10"))
+# Parameter combinations warmed for every thread. The rest of the options use the home page defaults.
+CACHE_WARMER_LENGTHS = _env_list("CACHE_WARMER_LENGTHS", "Medium")
+CACHE_WARMER_TONES = _env_list("CACHE_WARMER_TONES", "Teacher")
+# LLM budget: maximum number of analyses run per cycle
+CACHE_WARMER_MAX_ANALYSES = int(os.getenv("CACHE_WARMER_MAX_ANALYSES", "20"))
+# Maximum number of threads fetched or analyzed at the same time
+CACHE_WARMER_CONCURRENCY = int(os.getenv("CACHE_WARMER_CONCURRENCY", "2"))
+CACHE_WARMER_INTERVAL_SECONDS = float(os.getenv("CACHE_WARMER_INTERVAL_SECONDS", "900"))
+# Entries are refreshed once they drift past this fraction of the cache tolerances,
+# before the tolerance check on a user's request would fail
+CACHE_WARMER_REFRESH_MARGIN = float(os.getenv("CACHE_WARMER_REFRESH_MARGIN", "0.8"))
+
+# Home page defaults, except for the length and tone set above
+DEFAULT_OPTIONS = {
+    'summary_focus': "General Summary",
+    'include_eli5': False,
+    'analyze_image': True,
+    'search_external': False,
+    'max_comments': 5,
+}
+
+def fetch_listing(subreddit: str, listing: str, limit: int = CACHE_WARMER_THREADS_PER_LISTING) -> list:
+    """Returns the thread URLs of a subreddit listing, in listing order."""
+    json_response = fetch_json(f"https://www.reddit.com/r/{subreddit}/{listing}")
+    if isinstance(json_response, str):
+        print(f"Could not read r/{subreddit}/{listing}: {json_response}")
+        return []
+    return return_listing_threads(json_response)[:limit]
+
+class CacheWarmer:
+    """
+    Pre-runs analyses of trending threads so that their first view is served from the cache.
+
+    Every cycle reads the configured hot/rising listings, fetches each thread and checks the
+    cache for every warmed parameter combination, like the home page does. Missing analyses
+    are created and analyses close to falling out of the comment and score tolerances are
+    replaced. At most max_analyses analyses run per cycle, in listing order, and at most
+    concurrency threads are fetched or analyzed at the same time.
+    """
+
+    def __init__(self, cache: CacheBackend, subreddits=None, listings=None,
+                 threads_per_listing: int = CACHE_WARMER_THREADS_PER_LISTING,
+                 lengths=None, tones=None,
+                 max_analyses: int = CACHE_WARMER_MAX_ANALYSES,
+                 concurrency: int = CACHE_WARMER_CONCURRENCY,
+                 refresh_margin: float = CACHE_WARMER_REFRESH_MARGIN):
+        self.cache = cache
+        self.subreddits = subreddits or CACHE_WARMER_SUBREDDITS
+        self.listings = listings or CACHE_WARMER_LISTINGS
+        self.threads_per_listing = threads_per_listing
+        self.combinations = list(product(lengths or CACHE_WARMER_LENGTHS, tones or CACHE_WARMER_TONES))
+        self.max_analyses = max_analyses
+        self.concurrency = concurrency
+        self.refresh_margin = refresh_margin
+
+    def collect_threads(self) -> list:
+        """Thread URLs of all listings, without duplicates, hottest first."""
+        urls = []
+        for subreddit, listing in product(self.subreddits, self.listings):
+            for url in fetch_listing(subreddit, listing, self.threads_per_listing):
+                if url not in urls:
+                    urls.append(url)
+        return urls
+
+    def plan(self, url: str) -> list:
+        """
+        Fetches a thread and returns its analysis jobs as (all_thread_data, summary_length,
+        tone, replace_id, status) tuples, status being 'fresh', 'warm' or 'refresh'.
+        """
+        all_thread_data = fetch_thread_data(url)
+        if not all_thread_data['original_post']:
+            return [(None, None, None, None, 'failed')]
+
+        jobs = []
+        for summary_length, tone in self.combinations:
+            filtered = pre_filter_analyses(self.cache, all_thread_data, DEFAULT_OPTIONS['summary_focus'], summary_length, tone)
+            param_filtered = filter_by_params(filtered, image=DEFAULT_OPTIONS['analyze_image'],
+                                              external=DEFAULT_OPTIONS['search_external'])
+            if find_best_match(param_filtered, all_thread_data, tolerance_margin=self.refresh_margin) is not None:
+                jobs.append((all_thread_data, summary_length, tone, None, 'fresh'))
+            elif replaceable_row_id(filtered, DEFAULT_OPTIONS['summary_focus']) is not None:
+                replace_id = replaceable_row_id(param_filtered + filtered, DEFAULT_OPTIONS['summary_focus'])
+                jobs.append((all_thread_data, summary_length, tone, replace_id, 'refresh'))
+            else:
+                jobs.append((all_thread_data, summary_length, tone, None, 'warm'))
+        return jobs
+
+    def analyze(self, job) -> bool:
+        all_thread_data, summary_length, tone, replace_id, _ = job
+        try:
+            analysis_result, _, _ = perform_new_analysis(
+                self.cache, all_thread_data, DEFAULT_OPTIONS['summary_focus'], summary_length, tone,
+                DEFAULT_OPTIONS['include_eli5'], DEFAULT_OPTIONS['analyze_image'],
+                DEFAULT_OPTIONS['search_external'], DEFAULT_OPTIONS['max_comments'], replace_id
+            )
+            return bool(analysis_result)
+        except Exception as e:
+            print(f"Cache warmer could not analyze {all_thread_data['original_post']['url']}: {e}")
+            return False
+
+    def analyze_thread(self, jobs: list) -> list:
+        """Runs the jobs of one thread in order. Returns (job, success) pairs."""
+        return [(job, self.analyze(job)) for job in jobs]
+
+    def run_once(self) -> Counter:
+        """Runs one warming cycle and returns its counters."""
+        start = time.perf_counter()
+        stats = Counter()
+        urls = self.collect_threads()
+        stats['threads'] = len(urls)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            jobs = [job for thread_jobs in pool.map(self.plan, urls) for job in thread_jobs]
+            stats.update(job[4] for job in jobs if job[4] in ('fresh', 'failed'))
+
+            pending = [job for job in jobs if job[4] in ('warm', 'refresh')]
+            budgeted = pending[:self.max_analyses]
+            stats['over_budget'] = len(pending) - len(budgeted)
+            # A thread's jobs share its all_thread_data and run one after the other: the first one
+            # builds the structured analysis, the others restyle it from the cache
+            by_thread = {}
+            for job in budgeted:
+                by_thread.setdefault(id(job[0]), []).append(job)
+            for thread_jobs in pool.map(self.analyze_thread, by_thread.values()):
+                for job, success in thread_jobs:
+                    stats[job[4] if success else 'failed'] += 1
+
+        print(f"Cache warmer: {stats['threads']} threads listed, {stats['fresh']} fresh, "
+              f"{stats['warm']} warmed, {stats['refresh']} refreshed, {stats['over_budget']} over budget, "
+              f"{stats['failed']} failed in {time.perf_counter() - start:.0f}s")
+        return stats
+
+    def run_forever(self, interval: float = CACHE_WARMER_INTERVAL_SECONDS, stop: threading.Event = None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Cache warmer cycle failed: {e}")
+            stop.wait(interval)
+
+_warmer_thread = None
+_warmer_stop = None
+_warmer_lock = threading.Lock()
+
+def start_cache_warmer(cache: CacheBackend):
+    """Starts the background warmer once per process, if CACHE_WARMER_ENABLED is 'true'."""
+    global _warmer_thread, _warmer_stop
+    if not CACHE_WARMER_ENABLED or cache is None:
+        return
+    with _warmer_lock:
+        if _warmer_thread is None:
+            _warmer_stop = threading.Event()
+            _warmer_thread = threading.Thread(target=CacheWarmer(cache).run_forever,
+                                              kwargs={'stop': _warmer_stop}, daemon=True)
+            _warmer_thread.start()
+            print("Started the cache warmer")
+
+def stop_cache_warmer():
+    """Stops the background warmer after its current cycle, so that it can be started on another cache."""
+    global _warmer_thread, _warmer_stop
+    with _warmer_lock:
+        if _warmer_thread is not None:
+            _warmer_stop.set()
+            _warmer_thread, _warmer_stop = None, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-analyze trending Reddit threads into the cache")
+    parser.add_argument("--once", action="store_true", help="Run a single cycle and exit")
+    parser.add_argument("--subreddits", nargs="+", help="Subreddits to read (default: CACHE_WARMER_SUBREDDITS)")
+    parser.add_argument("--max-analyses", type=int, default=CACHE_WARMER_MAX_ANALYSES, help="Analyses per cycle")
+    parser.add_argument("--concurrency", type=int, default=CACHE_WARMER_CONCURRENCY)
+    args = parser.parse_args()
+
+    cache = get_standalone_cache()
+
+    warmer = CacheWarmer(cache, subreddits=args.subreddits, max_analyses=args.max_analyses,
+                         concurrency=args.concurrency)
+    if args.once:
+        warmer.run_once()
+    else:
+        warmer.run_forever()
+    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import re
+import math
+from html import escape, unescape
+
+import streamlit as st
+
+EF_SCORE_TOOLTIP = "This score is calculated by multiplying the score of the comment with its depth"
+PAGE_SIZES = [10, 25, 50, 100]
+SORT_ORDERS = {
+    "Rank": None,
+    "Score": lambda entry: entry['main'].get('score', 0),
+    "⚡ ef_score": lambda entry: entry['main'].get('ef_score', 0),
+}
+
+def comment_entries(comments_group, kind: str) -> list:
+    """
+    Flattens the precomputed notable comments into one entry per ranked comment.
+    kind is 'best' for (comment, parent) pairs or 'important' for (parent, child) pairs,
+    whose parent may hold its own parent under 'parent_comment'.
+    """
+    entries = []
+    for rank, pair in enumerate(comments_group or [], start=1):
+        if kind == 'best':
+            main, parent = pair
+            grandparent = None
+        else:
+            parent, main = pair
+            grandparent = parent.get('parent_comment') or None
+        texts = [c.get('author') or '' for c in (main, parent) if c] + [c.get('body') or '' for c in (main, parent) if c]
+        entries.append({
+            'rank': rank, 'main': main, 'parent': parent, 'grandparent': grandparent,
+            'search_text': "\n".join(texts).lower(), 'html': None,
+        })
+    return entries
+
+# Inline Reddit markdown, matched on the HTML-escaped text
+INLINE_CODE = re.compile(r"`([^`\n]+)`")
+MARKDOWN_LINK = re.compile(r"\[([^\]\n]+)\]\((https?://[^\s)]+)\)")
+EMPHASIS = [
+    (re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|__(?=\S)(.+?)(?<=\S)__"), "strong"),
+    (re.compile(r"(?<![\w*])\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?![\w*])|(?<![\w_])_(?=[^\s_])(.+?)(?<=[^\s_])_(?![\w_])"), "em"),
+    (re.compile(r"~~(?=\S)(.+?)(?<=\S)~~"), "del"),
+]
+LIST_ITEM = re.compile(r"^\s*(?:[-*+]|(\d+)[.)])\s+(.*)$")
+
+def _emphasis(text: str) -> str:
+    for pattern, tag in EMPHASIS:
+        text = pattern.sub(lambda m: f"<{tag}>{m.group(1) or m.group(2)}</{tag}>", text)
+    return text
+
+def _inline(text: str) -> str:
+    """Renders code spans, links and emphasis. Everything else is escaped."""
+    stashed = []
+
+    def stash(html: str) -> str:
+        stashed.append(html)
+        return f"\x00{len(stashed) - 1}\x00"
+
+    text = INLINE_CODE.sub(lambda m: stash(f"<code>{escape(m.group(1))}</code>"), text)
+    text = escape(text)
+    # The URL is already escaped, and is kept away from the emphasis patterns
+    text = MARKDOWN_LINK.sub(lambda m: stash(
+        f'<a href="{m.group(2)}" target="_blank" rel="noopener noreferrer">{_emphasis(m.group(1))}</a>'), text)
+    text = _emphasis(text)
+    return re.sub(r"\x00(\d+)\x00", lambda m: stashed[int(m.group(1))], text)
+
+def _code_block(lines) -> str:
+    # A blank line would end the HTML block in st.markdown, so line breaks become entities
+    code = "&#10;".join(escape(line) for line in lines)
+    return f'<pre style="white-space: pre-wrap; margin: 4px 0;"><code>{code}</code></pre>'
+
+def _blocks(lines) -> str:
+    html, paragraph = [], []
+
+    def end_paragraph():
+        if paragraph:
+            html.append(f'<p style="margin: 0 0 6px 0;">{"<br>".join(_inline(line) for line in paragraph)}</p>')
+            paragraph.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            end_paragraph()
+            i += 1
+        elif line.strip().startswith("```"):
+            end_paragraph()
+            end = i + 1
+            while end < len(lines) and not lines[end].strip().startswith("```"):
+                end += 1
+            html.append(_code_block(lines[i + 1:end]))
+            i = end + 1
+        elif line.startswith(("    ", "\t")) and not paragraph:
+            end = i
+            while end < len(lines) and (lines[end].startswith(("    ", "\t")) or not lines[end].strip()):
+                end += 1
+            code = [line[4:] if line.startswith("    ") else line[1:] for line in lines[i:end]]
+            while code and not code[-1].strip():
+                code.pop()
+            html.append(_code_block(code))
+            i = end
+        elif line.lstrip().startswith(">"):
+            end_paragraph()
+            end = i
+            while end < len(lines) and lines[end].lstrip().startswith(">"):
+                end += 1
+            quoted = [re.sub(r"^\s*> ?", "", line) for line in lines[i:end]]
+            html.append('<blockquote style="border-left: 3px solid #ccc; margin: 4px 0; padding-left: 10px; '
+                        f'color: #555;">{_blocks(quoted)}</blockquote>')
+            i = end
+        elif LIST_ITEM.match(line):
+            end_paragraph()
+            ordered = LIST_ITEM.match(line).group(1) is not None
+            items = []
+            while i < len(lines) and LIST_ITEM.match(lines[i]):
+                items.append(f"<li>{_inline(LIST_ITEM.match(lines[i]).group(2))}</li>")
+                i += 1
+            tag = "ol" if ordered else "ul"
+            html.append(f'<{tag} style="margin: 0 0 6px 0;">{"".join(items)}</{tag}>')
+        else:
+            paragraph.append(line)
+            i += 1
+    end_paragraph()
+    return "".join(html)
+
+def _text(value) -> str:
+    """
+    Renders a comment body's Reddit markdown (links, emphasis, code, quotes and lists) to HTML.
+    Reddit delivers the bodies with &, < and > as entities; raw HTML in them is escaped.
+    """
+    return _blocks(unescape(str(value)).replace("\r\n", "\n").split("\n"))
+
+def _scores(comment) -> str:
+    return (f'<span style="color: #666;">▲ {escape(str(comment.get("score", "N/A")))} ▼</span>'
+            f'<span style="color: #1e88e5; margin-left: 15px; cursor: help;" title="{EF_SCORE_TOOLTIP}">'
+            f'<span style="font-size: 16px;">⚡</span> {escape(str(comment.get("ef_score", "N/A")))}</span>')
+
+def _comment_box(comment, background: str = "#f6f7f8", font_size: str = "0.9em", label: str = "") -> str:
+    label_html = f'<div style="color: #666; margin-bottom: 5px;">{label}</div>' if label else ""
+    return (f'<div style="background-color: {background}; border: 1px solid #e3e3e3; border-radius: 4px; '
+            f'padding: 10px; margin-top: 5px; font-size: {font_size};">{label_html}'
+            f'<strong>u/{escape(str(comment.get("author", "[deleted]")))}</strong><br>'
+            f'<div>{_text(comment.get("body", "No content available"))}</div>'
+            f'{_scores(comment)}</div>')
+
+def render_entry(entry, kind: str) -> str:
+    """The HTML of one ranked comment with its context. Built the first time its page is shown."""
+    if entry['html'] is not None:
+        return entry['html']
+    main, parent, grandparent = entry['main'], entry['parent'], entry['grandparent']
+
+    scores = _scores(main)
+    if kind == 'important':
+        gain = main.get('ef_score', 0) - parent.get('ef_score', 0)
+        scores += (f'<span style="color: #4CAF50; font-weight: bold; margin-left: 15px; cursor: help;" '
+                   f'title="This comment\'s effective score improved by this amount compared to its parent comment">'
+                   f'<span style="font-size: 16px;">📈</span> +{gain:.2f}</span>')
+
+    if kind == 'important':
+        context = ('<div style="margin-top: 15px; font-style: italic; color: #666;">'
+                   'This comment outperformed its parent below:</div>' + _comment_box(parent))
+        if grandparent:
+            # Toggled in the browser, without a rerun
+            context += ('<details style="margin-top: 10px;"><summary style="cursor: pointer;">'
+                        '💬 Click to see the grandparent comment 💬</summary>'
+                        '<div style="margin-left: 20px; padding-left: 10px; border-left: 2px dashed #ccc;">'
+                        + _comment_box(grandparent, "#f0f0f0", "0.85em", "Earlier in the thread:") +
+                        '</div></details>')
+    elif parent:
+        context = ('<div style="margin-top: 15px; font-style: italic; color: #666;">This was a reply to:</div>'
+                   + _comment_box(parent))
+    else:
+        context = ('<div style="margin-top: 15px; font-style: italic; color: #666;">'
+                   'This was a root comment. No parent available.</div>')
+
+    entry['html'] = (
+        '<div style="display: flex; gap: 12px; padding: 12px 0; border-bottom: 1px solid #e3e3e3;">'
+        f'<div style="font-size: 24px; min-width: 32px; text-align: center;">👤<br>'
+        f'<span style="font-size: 12px; color: #666;">#{entry["rank"]}</span></div>'
+        '<div style="flex: 1; min-width: 0;">'
+        f'<strong>u/{escape(str(main.get("author", "[deleted]")))}</strong>'
+        f'<div style="margin: 6px 0;">{_text(main.get("body", "No content available"))}</div>'
+        f'<div style="display: flex; align-items: center; gap: 15px;">{scores}</div>'
+        f'{context}</div></div>'
+    )
+    return entry['html']
+
+def _entries(notable_comments, kind: str) -> list:
+    """The entries of the displayed analysis, built once and kept in the session across reruns."""
+    cached = st.session_state.setdefault('comment_explorer_entries', {})
+    source = notable_comments[0] if kind == 'best' else notable_comments[1]
+    if kind not in cached or cached[kind][0] is not source:
+        cached[kind] = (source, comment_entries(source, kind))
+    return cached[kind][1]
+
+def comment_explorer(notable_comments, kind: str):
+    """
+    Searchable, sortable and paginated list of the best ('best') or important ('important')
+    comments. Only the current page is rendered, as a single HTML block, so reruns stay
+    fast with hundreds of comments.
+    """
+    entries = _entries(notable_comments, kind)
+    if not entries:
+        st.markdown("No comments found." if kind == 'best' else "No important comment pairs found.")
+        return
+
+    page_key = f"{kind}_explorer_page"
+
+    def reset_page():
+        st.session_state[page_key] = 1
+
+    col1, col2, col3 = st.columns([3, 1, 1])
+    with col1:
+        query = st.text_input("Search comments", key=f"{kind}_explorer_search", on_change=reset_page,
+                              placeholder="Text or author")
+    with col2:
+        order = st.selectbox("Sort by", list(SORT_ORDERS), key=f"{kind}_explorer_sort", on_change=reset_page)
+    with col3:
+        page_size = st.selectbox("Per page", PAGE_SIZES, key=f"{kind}_explorer_page_size", on_change=reset_page)
+
+    query = query.strip().lower()
+    matches = [entry for entry in entries if query in entry['search_text']] if query else entries
+    if SORT_ORDERS[order] is not None:
+        matches = sorted(matches, key=SORT_ORDERS[order], reverse=True)
+    if not matches:
+        st.info("No comments match your search.")
+        return
+
+    pages = math.ceil(len(matches) / page_size)
+    if st.session_state.get(page_key, 1) > pages:
+        # Fewer pages than before, e.g. for a new analysis
+        st.session_state[page_key] = pages
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    else:
+        page = 1
+    start = (page - 1) * page_size
+    shown = matches[start:start + page_size]
+
+    st.caption(f"Showing {start + 1}-{start + len(shown)} of {len(matches)} comments")
+    st.markdown("".join(render_entry(entry, kind) for entry in shown), unsafe_allow_html=True)
@@ -0,0 +1,116 @@
+import os
+import re
+import math
+import unicodedata
+from collections import Counter
+from typing import Iterable, Dict
+
+# Minimum cosine similarity for a cached custom focus to be reused for a new request.
+# 1.0 disables fuzzy matching; canonicalization still applies.
+FOCUS_SIMILARITY_THRESHOLD = float(os.getenv("FOCUS_SIMILARITY_THRESHOLD", "0.8"))
+NGRAM_SIZE = 3
+# Words that don't change what a focus asks for. Every other word and number must appear in
+# both focuses before their n-gram similarity is considered.
+FOCUS_STOPWORDS = frozenset(
+    "a an the of on in at to for about from by with and or is are was were be been its it s "
+    "this that these those what which who how why do does did".split()
+)
+
+def canonicalize_focus(focus: str) -> str:
+    """
+    Normalizes a summary focus so that trivially different spellings share a cache entry:
+    unicode normalization, case, punctuation and whitespace are ignored.
+    "Community Sentiment " and "community sentiment." both become "community sentiment".
+    """
+    if not isinstance(focus, str):
+        return ""
+    focus = unicodedata.normalize("NFKC", focus).casefold()
+    focus = re.sub(r"[^\w\s]", " ", focus)
+    return " ".join(focus.split())
+
+def _stem(word: str) -> str:
+    """Strips plural endings, so "reactions" and "reaction" are the same term. Numbers stay as they are."""
+    if word.isdigit() or len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def focus_terms(focus: str) -> frozenset:
+    """
+    Numbers and content words of a canonical focus. Focuses with different terms never match:
+    "impact on the us economy" and "impact on the uk economy" differ in a single short word,
+    which the character n-grams barely notice.
+    """
+    return frozenset(_stem(word) for word in focus.split() if word not in FOCUS_STOPWORDS)
+
+def same_focus(a: str, b: str) -> bool:
+    """Whether two focuses are the same after canonicalization, i.e. not just a fuzzy match."""
+    return canonicalize_focus(a) == canonicalize_focus(b)
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> Counter:
+    """Character n-grams of the text, with word boundaries marked by spaces."""
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+
+class FocusMatcher:
+    """
+    TF-IDF similarity index over the canonical focus strings in the cache.
+
+    Document frequencies are counted over the distinct cached focuses, so n-grams that
+    appear in many focuses ("summ", "the") weigh less than the distinctive ones.
+    Focuses are reference counted and can be added and removed as rows change.
+    """
+
+    def __init__(self, threshold: float = FOCUS_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.focus_counts = Counter()
+        self.document_frequency = Counter()
+
+    def add(self, focus: str):
+        self.focus_counts[focus] += 1
+        if self.focus_counts[focus] == 1:
+            self.document_frequency.update(char_ngrams(focus).keys())
+
+    def remove(self, focus: str):
+        if self.focus_counts[focus] <= 0:
+            return
+        self.focus_counts[focus] -= 1
+        if self.focus_counts[focus] == 0:
+            del self.focus_counts[focus]
+            self.document_frequency.subtract(char_ngrams(focus).keys())
+
+    def _vector(self, focus: str) -> Dict[str, float]:
+        documents = len(self.focus_counts)
+        vector = {
+            gram: count * (math.log((1 + documents) / (1 + self.document_frequency[gram])) + 1)
+            for gram, count in char_ngrams(focus).items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {gram: weight / norm for gram, weight in vector.items()}
+
+    def similarity(self, a: str, b: str) -> float:
+        """Cosine similarity of the TF-IDF vectors of two canonical focuses."""
+        if a == b:
+            return 1.0
+        vector_a, vector_b = self._vector(a), self._vector(b)
+        if len(vector_a) > len(vector_b):
+            vector_a, vector_b = vector_b, vector_a
+        return sum(weight * vector_b.get(gram, 0.0) for gram, weight in vector_a.items())
+
+    def best_match(self, focus: str, candidates: Iterable[str]):
+        """
+        Returns (candidate, similarity) of the most similar candidate with the same
+        focus_terms at or above the threshold, or (None, 0.0) if there is none.
+        """
+        best, best_score = None, 0.0
+        terms = focus_terms(focus)
+        for candidate in candidates:
+            if focus_terms(candidate) != terms:
+                continue
+            score = self.similarity(focus, candidate)
+            if score >= self.threshold and score > best_score:
+                best, best_score = candidate, score
+        return best, best_score
@@ -1,20 +1,22 @@
 from dotenv import load_dotenv
 import os
 import re
-import json
+import time
 import traceback
 
 import streamlit as st
-import pandas as pd
-from st_files_connection import FilesConnection
 from analysis import analysis_page
-from cache_helpers import pre_filter_analyses, filter_by_params, find_best_match, update_eli5_in_cache, generate_eli5_summary, perform_new_analysis
 from cache_helpers import is_local
-from analyze_main import fetch_thread_data
+from resources import get_cache, clear_resources
+from cache_metrics import start_metrics_server
+from analysis_jobs import get_job_queue
+from analysis_options import SUMMARY_LENGTHS, TONES, MAX_FOCUS_CHARS
 
 
 load_dotenv()
 REDDIT_URL_PATTERN = r"^https?://(www\.)?reddit\.com/r/.*/comments/.*"
+# Seconds between two reruns of the page while an analysis job is running
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
 
 # Configure the default settings
 st.set_page_config(
@@ -81,15 +83,6 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# # Check if we're running in local mode
-# is_local = os.getenv("LOCAL_RUN", "false").lower() == "true"
-
-# Set the cache CSV path accordingly
-if is_local:
-    CACHE_CSV_PATH = os.getenv("LOCAL_CACHE_CSV_PATH")
-else:
-    CACHE_CSV_PATH = os.getenv("CLOUD_CACHE_CSV_PATH")
-
 def home_page():
     # Header
     st.markdown("""
@@ -137,7 +130,7 @@ def home_page():
             summary_focus = st.text_input(
                 "What the summary should focus on: (Max 50 characters. Examples: Technical breakdown, community sentiment, future predictions, etc.):",
                 value=st.session_state.summary_focus if st.session_state.summary_focus != "General Summary" else "",
-                max_chars=50,
+                max_chars=MAX_FOCUS_CHARS,
                 key="summary_focus_input"
             )
         else:
@@ -145,7 +138,7 @@ def home_page():
             st.text_input(
                 "What the summary should focus on: (Max 50 characters. Examples: Technical breakdown, community sentiment, future predictions, etc.):",
                 value="General Summary",
-                max_chars=50,
+                max_chars=MAX_FOCUS_CHARS,
                 key="summary_focus_input",
                 disabled=True
             )
@@ -154,7 +147,7 @@ def home_page():
         # Dropdown for summary length
         summary_length = st.selectbox(
             "Summary Length:",
-            ["Short", "Medium", "Long"],
+            SUMMARY_LENGTHS,
             index=1 # Default to "Medium"
         )
         st.session_state.summary_length = summary_length
@@ -163,7 +156,7 @@ def home_page():
         # Dropdown for tone selection
         tone = st.selectbox(
             "Summary Tone:",
-            ["Teacher", "Foulmouthed", "Cut the Bullshit", "Clickbaiter Youtuber", "Chill Bro", "Valley Girl", "Motivational Speaker", "Pirate", "Time Traveler", "Zen Master"],
+            TONES,
             index=0,  # Default to "Teacher"
             key="tone_selector"
         )
@@ -198,23 +191,14 @@ def home_page():
             # Maximum number of important comments selection
             max_comments = st.selectbox(
                 "Maximum number of best/important comments to show in the analysis page",
-                options=range(3,11),
-                index=2,  # Default to 5 (index 2 corresponds to value 5)
+                options=[3, 5, 10, 25, 50, 100, 250, 500],
+                index=1,  # Default to 5; the analysis page paginates longer lists
                 key="max_comments"
             )
 
     st.markdown("---")  # Horizontal line for separation
 
     if st.button("Analyze", key="analyze_button"):
-        best_match_time = None
-        # Add status message container at the start
-        status_container = st.container()
-
-        def add_status(message, icon="ℹ️"):
-            with status_container:
-                status_container.empty()
-                st.text(f"{icon} {message}")
-
         is_valid_url = bool(re.match(REDDIT_URL_PATTERN, url))
         if not is_valid_url:
             st.error("Please enter a valid Reddit thread URL")
@@ -225,97 +209,74 @@ def home_page():
             st.session_state.summary_length = summary_length
             st.session_state.tone = tone
 
-            all_thread_data = fetch_thread_data(url)
-
             try:
-                # Read cache depending on whether we're in local mode or not
-                if is_local:
-                    # Local mode: read from local CSV file
-                    all_analyses = pd.read_csv(CACHE_CSV_PATH)
-                    add_status(f"Read {len(all_analyses)} analyses from local cache", "📚")
-                else:
-                    # Cloud mode: read from S3 bucket
-                    # This also requires AWS credentials to be set up in .streamlit/secrets.toml
-                    conn = st.connection('s3', type=FilesConnection)
-                    all_analyses = conn.read(CACHE_CSV_PATH, input_format="csv", ttl=0)
-                    add_status(f"Found {len(all_analyses)} existing analyses in cloud cache", "✅")
-
+                # The cache index is shared by the process, opening it doesn't reload it
+                cache = get_cache()
             except Exception as e:
                 print(e)
-                add_status("Error reading existing analyses. Starting new analysis...", "⚠️")
-                all_analyses = None
-
-            # Perform filtering and analysis logic
-            filtered_analyses, core_indices = pre_filter_analyses(all_analyses, all_thread_data, summary_focus, summary_length, tone)
-
-            if filtered_analyses.empty:
-                add_status("No analysis found in cache for this thread. Performing new analysis...", "🔄")
-                analysis_result, sum_for_5yo, notable_comments = perform_new_analysis(
-                    conn if not is_local else None,  # Pass None for local mode
-                    all_thread_data, summary_focus, summary_length, tone, include_eli5,
-                    analyze_image, search_external, max_comments, all_analyses
-                )
-            else:
-                # Filter by image/external parameters
-                add_status("Found a match in cache. Checking if settings are same too and it's recent enough...", "🔍")
-                param_filtered, param_indices = filter_by_params(filtered_analyses, core_indices, image=analyze_image, external=search_external)
-
-                if param_filtered.empty:
-                    add_status("Performing a new analysis because the cached thread's settings do not match your request...", "🔄")
-                    cache_index = core_indices[0]
-                    analysis_result, sum_for_5yo, notable_comments = perform_new_analysis(
-                        conn if not is_local else None,  # Pass None for local mode
-                        all_thread_data, summary_focus, summary_length, tone, include_eli5,
-                        analyze_image, search_external, max_comments, all_analyses, cache_index
-                    )
-                else:
-                    best_match, cache_index = find_best_match(param_filtered, param_indices, all_thread_data)
-
-                    if best_match is not None:
-                        add_status("Cache can be used for this thread. Retrieving analysis...", "🔍")
-                        best_match_dict = best_match._asdict()
-                        analysis_result = best_match_dict['analysis_result']
-                        notable_comments = json.loads(best_match_dict['notable_comments'])
-
-                        # Handle potential "nan" value for eli5_summary
-                        sum_for_5yo = best_match_dict.get('eli5_summary', None)
-                        if isinstance(sum_for_5yo, str) and sum_for_5yo.lower() == 'nan':
-                            sum_for_5yo = None
-
-                        best_match_time = best_match_dict['timestamp']
-
-                        # Wanted eli5 but cache doesn't have it
-                        if include_eli5 and not sum_for_5yo:
-                            add_status("ELI5 was missing in the cache. Generating ELI5 summary...", "🔄")
-                            sum_for_5yo = generate_eli5_summary(all_thread_data, summary_focus, summary_length, tone, analyze_image, search_external, max_comments)
-                            update_eli5_in_cache(
-                                conn if not is_local else None,  # Pass None for local mode
-                                all_analyses, sum_for_5yo, cache_index
-                            )
-                            st.success("Retrieved existing analysis and generated ELI5 summary!")
-                        else:
-                            st.success("Retrieved existing analysis!")
-                    else:
-                        add_status("Cached thread was not recent enough. Performing new analysis...", "🔄")
-                        cache_index = param_indices[0]
-                        analysis_result, sum_for_5yo, notable_comments = perform_new_analysis(
-                            conn if not is_local else None,  # Pass None for local mode
-                            all_thread_data, summary_focus, summary_length, tone, include_eli5,
-                            analyze_image, search_external, max_comments, all_analyses, cache_index
-                        )
-
-            # Update session state
-            st.session_state.analysis_result = analysis_result
-            st.session_state.sum_for_5yo = sum_for_5yo
-            st.session_state.notable_comments = notable_comments
-            st.session_state.cache_time = best_match_time if best_match_time else None
-            st.session_state.page = "analysis"
-            st.rerun()
+                cache = None
+
+            # The analysis runs on the shared workers. The job id is kept in the session and
+            # in the URL, so reruns and page reloads keep following the same job.
+            options = {
+                'summary_focus': summary_focus, 'summary_length': summary_length, 'tone': tone,
+                'include_eli5': include_eli5, 'analyze_image': analyze_image,
+                'search_external': search_external, 'max_comments': max_comments,
+            }
+            st.session_state.job_id = get_job_queue().submit(cache, url, options)
+            st.query_params["job"] = st.session_state.job_id
+
+    if st.session_state.get("job_id"):
+        show_job_progress(st.session_state.job_id)
+
+def show_job_progress(job_id):
+    """Shows the progress of the analysis job, and opens the analysis page once it's done."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        # Finished too long ago, or started by a previous server process
+        forget_job()
+        st.warning("This analysis is no longer available. Please click Analyze again.")
+        return
+
+    state = job.snapshot()
+    st.progress(state['progress'])
+    st.text(f"{state['icon']} {state['message']}")
+
+    if state['status'] == 'failed':
+        forget_job()
+        st.error("The analysis failed. Please try again later.")
+    elif state['status'] == 'done':
+        forget_job()
+        st.session_state.analysis_result = state['result']['analysis_result']
+        st.session_state.sum_for_5yo = state['result']['sum_for_5yo']
+        st.session_state.notable_comments = state['result']['notable_comments']
+        st.session_state.cache_time = state['result']['cache_time']
+        st.session_state.served_focus = state['result']['served_focus']
+        st.session_state.stale = state['result']['stale']
+        st.session_state.page = "analysis"
+        st.rerun()
+    else:
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+def forget_job():
+    st.session_state.pop("job_id", None)
+    if "job" in st.query_params:
+        del st.query_params["job"]
 
 def main():
+    # Prometheus endpoint for the cache metrics (CACHE_METRICS_PORT)
+    start_metrics_server()
+    # Local runs can drop the shared resources (cache index, prompts, clients) with ?reload_resources=true
+    if is_local and st.query_params.get("reload_resources") == "true":
+        clear_resources()
+        del st.query_params["reload_resources"]
     try:
         if 'page' not in st.session_state:
             st.session_state.page = "home"
+        # A reloaded page picks its running analysis job back up from the URL
+        if "job" in st.query_params and "job_id" not in st.session_state:
+            st.session_state.job_id = st.query_params["job"]
 
         if st.session_state.page == "home":
             home_page()
@@ -0,0 +1,67 @@
+import os
+import sys
+import argparse
+from collections import defaultdict
+
+# Add parent directory to path to allow importing analyze_main
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache_backends import get_standalone_cache, reset_cache_backends, is_structured, USAGE_COLUMNS
+
+# Ways to group the cached analyses, by the columns that make up a group
+GROUPINGS = {
+    'tone': lambda row: row['tone'],
+    'length': lambda row: row['summary_length'],
+    'media': lambda row: f"images={'on' if row['analyze_image'] else 'off'} links={'on' if row['search_external'] else 'off'}",
+    'thread': lambda row: row['url'],
+}
+
+def costed_rows(rows: list) -> list:
+    """
+    The analyses with recorded usage. Structured analyses are left out: their calls are
+    also counted in the row of the analysis that built them.
+    """
+    return [row for row in rows if not is_structured(row) and row.get('llm_calls') is not None]
+
+def group_usage(rows: list, key) -> dict:
+    """Sums the USAGE_COLUMNS of the rows by group, with the number of analyses as 'analyses'."""
+    groups = defaultdict(lambda: dict.fromkeys(['analyses', *USAGE_COLUMNS], 0))
+    for row in rows:
+        group = groups[key(row)]
+        group['analyses'] += 1
+        for col in USAGE_COLUMNS:
+            group[col] += row.get(col) or 0
+    return dict(groups)
+
+def report(rows: list, top: int):
+    """Prints the LLM usage of the cached analyses by tone, length, media settings and thread."""
+    costed = costed_rows(rows)
+    unknown = sum(1 for row in rows if not is_structured(row)) - len(costed)
+    print(f"{len(costed)} analyses with recorded LLM usage ({unknown} cached before it was recorded)")
+    if not costed:
+        return
+    total = group_usage(costed, lambda row: 'all')['all']
+    print(f"{total['llm_calls']} calls, {total['prompt_tokens']} prompt + {total['completion_tokens']} completion tokens, "
+          f"{total['llm_seconds']:.1f}s, ${total['llm_cost_usd']:.4f} estimated")
+
+    for name, key in GROUPINGS.items():
+        groups = group_usage(costed, key)
+        ranked = sorted(groups.items(), key=lambda item: (item[1]['llm_cost_usd'], item[1]['prompt_tokens']), reverse=True)
+        print(f"\nBy {name}{f' (top {top})' if name == 'thread' else ''}:")
+        print(f"{'':<48} {'analyses':>8} {'tokens/analysis':>15} {'$/analysis':>10} {'$ total':>9}")
+        for group, usage in ranked[:top] if name == 'thread' else ranked:
+            tokens = (usage['prompt_tokens'] + usage['completion_tokens']) / usage['analyses']
+            print(f"{str(group)[:48]:<48} {usage['analyses']:>8} {tokens:>15.0f} "
+                  f"{usage['llm_cost_usd'] / usage['analyses']:>10.4f} {usage['llm_cost_usd']:>9.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the LLM tokens and estimated cost of the cached analyses")
+    parser.add_argument("--top", type=int, default=10, help="Most expensive threads to list")
+    args = parser.parse_args()
+    cache = get_standalone_cache()
+    try:
+        report(cache.load_metadata(), args.top)
+    finally:
+        reset_cache_backends()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import streamlit as st
+from st_files_connection import FilesConnection
+
+# Add parent directory to path to allow importing config and llm_interact
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import reload_prompts
+from llm_interact import reset_llm_clients
+from cache_backends import CacheBackend, get_cache_backend, reset_cache_backends, is_local
+from cache_warmer import start_cache_warmer, stop_cache_warmer
+
+# Resources shared by every session and rerun of the app, created once per process:
+# the S3 connection (here), the parsed prompts (config), the cache index (cache_backends)
+# and the LLM and HTTP clients (llm_interact, http_client).
+
+@st.cache_resource(show_spinner=False)
+def get_s3_connection():
+    # Requires AWS credentials to be set up in .streamlit/secrets.toml
+    return st.connection('s3', type=FilesConnection)
+
+def get_cache() -> CacheBackend:
+    """
+    Returns the shared cache index: SQLite (or CSV) in local mode, the S3 bucket otherwise.
+    Only the first call loads it, later calls only pick up rows written by other processes.
+    Starts the background cache warmer once (CACHE_WARMER_ENABLED).
+    """
+    cache = get_cache_backend() if is_local else get_cache_backend(get_s3_connection())
+    start_cache_warmer(cache)
+    return cache
+
+def clear_resources():
+    """
+    Drops every shared resource: the cache index is flushed and reloaded from storage on
+    next use, prompts.yaml is re-read, and the S3 connection and LLM clients are recreated.
+    """
+    stop_cache_warmer()
+    reset_cache_backends()
+    get_s3_connection.clear()
+    reload_prompts()
+    reset_llm_clients()
+    print("Cleared the shared resources")
@@ -0,0 +1,361 @@
+import os
+import io
+import json
+import time
+import uuid
+import threading
+from typing import List, Dict
+
+from cache_backends import CacheBackend, METADATA_COLUMNS, read_csv_rows
+
+# Prefix of the log inside the bucket
+CACHE_LOG_PATH = os.getenv("CLOUD_CACHE_LOG_PATH", "reddit-links-bucket/analyses_log")
+# Local read-through copy of the immutable objects (base snapshots and segments)
+CACHE_LOG_MIRROR_DIR = os.getenv("CACHE_LOG_MIRROR_DIR", ".cache_log_mirror")
+# Minimum seconds between two checks of the bucket for new segments
+CACHE_LOG_REFRESH_SECONDS = float(os.getenv("CACHE_LOG_REFRESH_SECONDS", "5"))
+# Number of uncompacted segments after which a background compaction is started
+CACHE_LOG_COMPACT_AFTER = int(os.getenv("CACHE_LOG_COMPACT_AFTER", "50"))
+# A compaction lease older than this is considered abandoned
+COMPACTION_LEASE_SECONDS = 600
+
+class SegmentedLogCacheBackend(CacheBackend):
+    """
+    Append-only cache log for object storage (S3).
+
+    Layout under the prefix:
+        manifest.json           version, current base snapshot, the folded segments
+                                that may still exist
+        base-<version>.jsonl    compacted snapshot of all rows
+        segments/<time>-<id>.jsonl
+                                one immutable object per write
+
+    A write is a single small PUT of a new segment, so concurrent sessions never overwrite
+    each other. Readers fetch the manifest, reload the base only when its version changed,
+    and list the segments to apply the ones they haven't loaded yet. Compaction folds the
+    segments into a new base in a background thread.
+
+    fs is an fsspec-compatible filesystem (the S3 connection's conn.fs, or any local stand-in
+    with open, exists, ls, rm and invalidate_cache).
+    """
+
+    name = "segmented log"
+
+    def __init__(self, fs, prefix: str = CACHE_LOG_PATH, mirror_dir: str = CACHE_LOG_MIRROR_DIR,
+                 legacy_csv_path: str = None):
+        self.fs = fs
+        self.prefix = prefix.rstrip('/')
+        self.mirror_dir = mirror_dir
+        self.lock = threading.RLock()
+        self.rows = {}
+        self.version = None
+        self.compacted_segments = set()
+        self.loaded_segments = set()
+        self.last_refresh = 0.0
+        self.compaction_thread = None
+
+        if legacy_csv_path and not self.fs.exists(self._manifest_path()):
+            self._import_csv(legacy_csv_path)
+        self.refresh(force=True)
+
+    # --- object paths ---
+
+    def _manifest_path(self):
+        return f"{self.prefix}/manifest.json"
+
+    def _segments_dir(self):
+        return f"{self.prefix}/segments"
+
+    def _base_path(self, version):
+        return f"{self.prefix}/base-{version:06d}.jsonl"
+
+    def _lease_path(self):
+        return f"{self.prefix}/compaction.lease"
+
+    # --- object IO ---
+
+    def _put(self, path: str, text: str):
+        with self.fs.open(path, "w") as f:
+            f.write(text)
+
+    def _read_immutable(self, path: str) -> str:
+        """Reads a base snapshot or segment through the local mirror."""
+        local_path = os.path.join(self.mirror_dir, path)
+        try:
+            with open(local_path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Not mirrored yet, or pruned by a refresh in the meantime
+            pass
+        with self.fs.open(path, "r") as f:
+            text = f.read()
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return text
+
+    def _read_manifest(self) -> Dict:
+        path = self._manifest_path()
+        self.fs.invalidate_cache(path)
+        if not self.fs.exists(path):
+            return {"version": 0, "base": None, "compacted_segments": []}
+        with self.fs.open(path, "r") as f:
+            return json.load(f)
+
+    def _list_segments(self) -> List[str]:
+        segments_dir = self._segments_dir()
+        self.fs.invalidate_cache(segments_dir)
+        if not self.fs.exists(segments_dir):
+            return []
+        return sorted(os.path.basename(path) for path in self.fs.ls(segments_dir, detail=False)
+                      if path.endswith(".jsonl"))
+
+    @staticmethod
+    def _records(text: str) -> List[Dict]:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    @staticmethod
+    def _dump(records: List[Dict]) -> str:
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    # --- log replay ---
+
+    @staticmethod
+    def _apply(rows: Dict, record: Dict) -> List:
+        """
+        Applies one log record to rows. Returns the ids of the changed rows.
+        Access times are kept in the rows under 'last_access', so compaction carries them over.
+        """
+        if record["op"] == "upsert":
+            changed = [record["id"]]
+            replaces = record.get("replaces")
+            if replaces is not None and replaces != record["id"]:
+                rows.pop(replaces, None)
+                changed.append(replaces)
+            rows[record["id"]] = dict(record["row"], id=record["id"])
+            return changed
+        if record["op"] == "eli5" and record["id"] in rows:
+            rows[record["id"]]["eli5_summary"] = record["eli5_summary"]
+            rows[record["id"]]["include_eli5"] = True
+            return [record["id"]]
+        if record["op"] == "delete":
+            return [row_id for row_id in record["ids"] if rows.pop(row_id, None) is not None]
+        if record["op"] == "access":
+            for row_id, last_access in record["times"].items():
+                if row_id in rows:
+                    rows[row_id]["last_access"] = last_access
+        return []
+
+    def refresh(self, force: bool = False):
+        with self.lock:
+            if not force and time.monotonic() - self.last_refresh < CACHE_LOG_REFRESH_SECONDS:
+                return []
+            self.last_refresh = time.monotonic()
+
+            manifest = self._read_manifest()
+            full_reload = manifest["version"] != self.version
+            if full_reload:
+                self.rows = {}
+                self.loaded_segments = set()
+                if manifest["base"]:
+                    for record in self._records(self._read_immutable(manifest["base"])):
+                        self._apply(self.rows, record)
+                self.version = manifest["version"]
+                self.compacted_segments = set(manifest["compacted_segments"])
+                self._prune_mirror(manifest)
+
+            pending = [name for name in self._list_segments() if name not in self.compacted_segments]
+            changed = []
+            for name in pending:
+                if name in self.loaded_segments:
+                    continue
+                for record in self._records(self._read_immutable(f"{self._segments_dir()}/{name}")):
+                    changed += self._apply(self.rows, record)
+                self.loaded_segments.add(name)
+
+            if len(pending) >= CACHE_LOG_COMPACT_AFTER:
+                self.start_compaction()
+            return None if full_reload else changed
+
+    def _prune_mirror(self, manifest: Dict):
+        """Removes the mirrored bases and segments the current manifest no longer needs."""
+        local_prefix = os.path.join(self.mirror_dir, self.prefix)
+        if not os.path.isdir(local_prefix):
+            return
+        current_base = os.path.basename(manifest["base"]) if manifest["base"] else None
+        stale = [os.path.join(local_prefix, name) for name in os.listdir(local_prefix)
+                 if name.startswith("base-") and name != current_base]
+        local_segments = os.path.join(local_prefix, "segments")
+        if os.path.isdir(local_segments):
+            stale += [os.path.join(local_segments, name) for name in os.listdir(local_segments)
+                      if name in self.compacted_segments]
+        for path in stale:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _append(self, records: List[Dict]):
+        """Writes the records as a new immutable segment: one small PUT."""
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:12]}.jsonl"
+        text = self._dump(records)
+        path = f"{self._segments_dir()}/{name}"
+        self._put(path, text)
+        local_path = os.path.join(self.mirror_dir, path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        with self.lock:
+            for record in records:
+                self._apply(self.rows, record)
+            self.loaded_segments.add(name)
+
+    # --- CacheBackend interface ---
+
+    def find(self, url, summary_focus, summary_length, tone):
+        with self.lock:
+            return [dict(row) for row in self.rows.values()
+                    if (row['url'], row['summary_focus'], row['summary_length'], row['tone']) ==
+                    (url, summary_focus, summary_length, tone)]
+
+    def get(self, row_id):
+        with self.lock:
+            row = self.rows.get(row_id)
+            return {k: v for k, v in row.items() if k != 'last_access'} if row else None
+
+    def load_metadata(self):
+        with self.lock:
+            return [dict({col: row.get(col) for col in METADATA_COLUMNS}, id=row_id)
+                    for row_id, row in self.rows.items()]
+
+    def upsert(self, row, row_id=None):
+        new_id = uuid.uuid4().hex
+        self._append([{"op": "upsert", "id": new_id, "replaces": row_id, "row": dict(row)}])
+        return new_id
+
+    def update_eli5(self, row_id, eli5_summary):
+        self._append([{"op": "eli5", "id": row_id, "eli5_summary": eli5_summary}])
+
+    def write_batch(self, operations):
+        # The whole batch goes into a single segment
+        records, row_ids = [], []
+        for op, first, second in operations:
+            if op == "upsert":
+                new_id = uuid.uuid4().hex
+                records.append({"op": "upsert", "id": new_id, "replaces": second, "row": dict(first)})
+                row_ids.append(new_id)
+            else:
+                records.append({"op": "eli5", "id": first, "eli5_summary": second})
+                row_ids.append(first)
+        if records:
+            self._append(records)
+        return row_ids
+
+    def delete(self, row_ids):
+        self._append([{"op": "delete", "ids": list(row_ids)}])
+
+    def row_sizes(self):
+        with self.lock:
+            return {row_id: len(json.dumps(row)) for row_id, row in self.rows.items()}
+
+    def record_access(self, access_times):
+        # One small segment per retention run, not one per hit
+        if access_times:
+            self._append([{"op": "access", "times": dict(access_times)}])
+
+    def load_access(self):
+        with self.lock:
+            return {row_id: row["last_access"] for row_id, row in self.rows.items() if "last_access" in row}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.rows)
+
+    # --- migration and compaction ---
+
+    def _import_csv(self, csv_path: str):
+        """One-shot import of the legacy CSV cache as the first base snapshot."""
+        if not self.fs.exists(csv_path):
+            return
+        with self.fs.open(csv_path, "r") as f:
+            rows = read_csv_rows(io.StringIO(f.read()))
+        records = [{"op": "upsert", "id": uuid.uuid4().hex, "row": row} for row in rows]
+        self._put(self._base_path(1), self._dump(records))
+        self._put(self._manifest_path(), json.dumps(
+            {"version": 1, "base": self._base_path(1), "compacted_segments": []}
+        ))
+        print(f"Migrated {len(records)} analyses from {csv_path} to {self.prefix}")
+
+    def start_compaction(self):
+        """Starts a background compaction unless one is already running in this process."""
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return
+        self.compaction_thread = threading.Thread(target=self.compact, daemon=True)
+        self.compaction_thread.start()
+
+    def _acquire_lease(self) -> bool:
+        """
+        Best-effort lease so that only one process compacts at a time.
+        Object storage has no atomic create-if-absent here, so two processes starting
+        within the same instant could both compact; the later manifest simply wins.
+        """
+        path = self._lease_path()
+        self.fs.invalidate_cache(path)
+        if self.fs.exists(path):
+            with self.fs.open(path, "r") as f:
+                try:
+                    if time.time() - float(f.read()) < COMPACTION_LEASE_SECONDS:
+                        return False
+                except ValueError:
+                    pass
+        self._put(path, str(time.time()))
+        return True
+
+    def compact(self):
+        """
+        Folds all current segments into a new base snapshot. The new manifest is written
+        before the old objects are deleted, so readers always see a consistent state.
+
+        The manifest lists every folded segment that may still exist, not just this round's.
+        Segments are deleted only once a published manifest covers them, and they stay in the
+        list until a later compaction no longer finds them, so a reader that refreshes before
+        the deletion (or after a crash that skipped it) never replays them over the new base.
+        """
+        if not self._acquire_lease():
+            return
+        try:
+            manifest = self._read_manifest()
+            rows = {}
+            if manifest["base"]:
+                for record in self._records(self._read_immutable(manifest["base"])):
+                    self._apply(rows, record)
+            listed = self._list_segments()
+            previously_compacted = set(manifest["compacted_segments"]) & set(listed)
+            segments = [name for name in listed if name not in previously_compacted]
+            for name in segments:
+                for record in self._records(self._read_immutable(f"{self._segments_dir()}/{name}")):
+                    self._apply(rows, record)
+
+            version = manifest["version"] + 1
+            snapshot = [
+                {"op": "upsert", "id": row_id, "row": {k: v for k, v in row.items() if k != 'id'}}
+                for row_id, row in rows.items()
+            ]
+            self._put(self._base_path(version), self._dump(snapshot))
+            self._put(self._manifest_path(), json.dumps({
+                "version": version, "base": self._base_path(version),
+                "compacted_segments": sorted(previously_compacted) + segments,
+            }))
+
+            # Readers of the previous manifest skip these too, and its base already holds them
+            for name in previously_compacted:
+                path = f"{self._segments_dir()}/{name}"
+                if self.fs.exists(path):
+                    self.fs.rm(path)
+            # Keep the replaced base for readers still holding the old manifest
+            stale_base = self._base_path(manifest["version"] - 1)
+            if manifest["version"] > 1 and self.fs.exists(stale_base):
+                self.fs.rm(stale_base)
+            print(f"Compacted {len(segments)} segments into {self._base_path(version)}")
+        finally:
+            self.fs.rm(self._lease_path())
@@ -0,0 +1,317 @@
+import os
+import json
+import uuid
+import atexit
+import threading
+from typing import Dict
+
+from cache_backends import CacheBackend, METADATA_COLUMNS, KEY_COLUMNS
+
+# Seconds between two background flushes
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "2"))
+# Maximum number of operations written to the durable store in one batch
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "50"))
+# Directory of the local journals of accepted but not yet flushed writes
+WRITE_BEHIND_JOURNAL_DIR = os.getenv("WRITE_BEHIND_JOURNAL_DIR", ".write_behind")
+# Flushed provisional ids still resolved for callers holding on to one, most recent first
+ID_MAP_SIZE = 1000
+
+def _json_default(value):
+    # numpy scalars coming from the CSV backend
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class WriteBehindCache(CacheBackend):
+    """
+    Write-behind queue in front of a durable backend.
+
+    Writes are accepted immediately under a provisional 'pending-' id and served to readers
+    from memory. A background thread batches them into the durable store with write_batch().
+    Writes to a row that is still queued are coalesced: an ELI5 update is merged into the
+    queued row and a replacement takes the queued row's place.
+
+    Every accepted write is appended to a local journal before it is acknowledged, and an
+    operation only leaves the queue after the durable store accepted it. Journaled operations
+    are replayed on the next start, so a write is stored at least once even if the process
+    dies before the flush. The journal is also flushed on interpreter shutdown.
+
+    Once rows are stored, the id listener (see set_id_listener) learns their durable ids.
+    Only the ID_MAP_SIZE most recent provisional ids stay resolvable after that.
+    """
+
+    def __init__(self, backend: CacheBackend, journal_path: str,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_SECONDS,
+                 max_batch: int = WRITE_BEHIND_MAX_BATCH):
+        self.backend = backend
+        self.name = backend.name
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.queue = []           # queued operations, oldest first
+        self.in_flight = set()    # provisional ids being written right now
+        self.pending_rows = {}    # provisional id -> row
+        self.pending_eli5 = {}    # durable id -> queued ELI5 summary
+        self.id_map = {}          # provisional id -> durable id, once flushed
+        self.id_listener = None
+        self.closed = False
+
+        self._replay_journal()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # --- journal ---
+
+    def _journal_append(self, entry: Dict):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=_json_default) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_journal(self):
+        """Rewrites the journal with the operations still queued. Caller holds the lock."""
+        entries = []
+        for op in self.queue:
+            entry = dict(op)
+            if op["op"] == "upsert":
+                entry["replace_id"] = self._resolve(op["replace_id"])
+            else:
+                entry["id"] = self._resolve(op["id"])
+            entries.append(entry)
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, default=_json_default) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        with self.lock:
+            for entry in entries:
+                if entry["op"] == "upsert":
+                    self._enqueue_upsert(entry["row"], entry["replace_id"], entry["pid"])
+                else:
+                    self._enqueue_eli5(entry["id"], entry["eli5_summary"])
+            self._rewrite_journal()
+        if entries:
+            print(f"Replayed {len(entries)} unflushed cache writes from {self.journal_path}")
+
+    # --- queue ---
+
+    def _resolve(self, row_id):
+        return self.id_map.get(row_id, row_id)
+
+    def _enqueue_upsert(self, row: Dict, row_id, pid: str) -> Dict:
+        row_id = self._resolve(row_id)
+        replace_id = row_id
+        if row_id in self.pending_rows and row_id not in self.in_flight:
+            # The replaced row was never written: take its place in the queue
+            old = next(op for op in self.queue if op.get("pid") == row_id)
+            self.queue.remove(old)
+            del self.pending_rows[row_id]
+            replace_id = old["replace_id"]
+        op = {"op": "upsert", "pid": pid, "row": row, "replace_id": replace_id}
+        self.queue.append(op)
+        self.pending_rows[pid] = row
+        return op
+
+    def _enqueue_eli5(self, row_id, eli5_summary: str) -> Dict:
+        row_id = self._resolve(row_id)
+        if row_id in self.pending_rows:
+            # Merged into the queued row
+            self.pending_rows[row_id]["eli5_summary"] = eli5_summary
+            self.pending_rows[row_id]["include_eli5"] = True
+            return {"op": "eli5", "id": row_id, "eli5_summary": eli5_summary}
+        op = {"op": "eli5", "id": row_id, "eli5_summary": eli5_summary}
+        self.queue.append(op)
+        self.pending_eli5[row_id] = eli5_summary
+        return op
+
+    def upsert(self, row, row_id=None):
+        pid = f"pending-{uuid.uuid4().hex}"
+        with self.lock:
+            op = self._enqueue_upsert(dict(row), row_id, pid)
+            self._journal_append(op)
+            queued = len(self.queue)
+        if queued >= self.max_batch:
+            self.wake.set()
+        return pid
+
+    def update_eli5(self, row_id, eli5_summary):
+        with self.lock:
+            self._journal_append(self._enqueue_eli5(row_id, eli5_summary))
+
+    # --- flushing ---
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def set_id_listener(self, callback):
+        self.id_listener = callback
+
+    def _prune_id_map(self):
+        """Forgets the oldest flushed ids no queued operation refers to. Caller holds the lock."""
+        excess = len(self.id_map) - ID_MAP_SIZE
+        if excess <= 0:
+            return
+        referenced = {op["replace_id"] if op["op"] == "upsert" else op["id"] for op in self.queue}
+        for pid in list(self.id_map)[:excess]:
+            if pid not in referenced:
+                del self.id_map[pid]
+
+    def flush(self) -> bool:
+        """
+        Writes the queued operations to the durable store, in batches of max_batch.
+        Returns False if a batch failed; it stays queued and is retried on the next flush.
+        """
+        flushed = {}
+        try:
+            return self._flush(flushed)
+        finally:
+            # Outside the flush lock: the listener takes the index lock, which is held around deletes
+            if flushed and self.id_listener is not None:
+                self.id_listener(flushed)
+            with self.lock:
+                self._prune_id_map()
+
+    def _flush(self, flushed: Dict) -> bool:
+        with self.flush_lock:
+            while True:
+                with self.lock:
+                    batch = self.queue[:self.max_batch]
+                    if not batch:
+                        return True
+                    operations, snapshots = [], []
+                    for op in batch:
+                        if op["op"] == "upsert":
+                            snapshot = dict(op["row"])
+                            operations.append(("upsert", snapshot, self._resolve(op["replace_id"])))
+                            self.in_flight.add(op["pid"])
+                        else:
+                            snapshot = None
+                            operations.append(("eli5", self._resolve(op["id"]), op["eli5_summary"]))
+                        snapshots.append(snapshot)
+
+                try:
+                    row_ids = self.backend.write_batch(operations)
+                except Exception as e:
+                    print(f"Write-behind flush failed, will retry: {e}")
+                    with self.lock:
+                        self.in_flight.clear()
+                    return False
+
+                with self.lock:
+                    for op, snapshot, row_id in zip(batch, snapshots, row_ids):
+                        self.queue.remove(op)
+                        if op["op"] == "upsert":
+                            self.id_map[op["pid"]] = flushed[op["pid"]] = row_id
+                            row = self.pending_rows.pop(op["pid"])
+                            self.in_flight.discard(op["pid"])
+                            if row.get("eli5_summary") != snapshot.get("eli5_summary"):
+                                # ELI5 arrived while the row was being written
+                                self._enqueue_eli5(row_id, row["eli5_summary"])
+                        elif self.pending_eli5.get(op["id"]) == op["eli5_summary"]:
+                            del self.pending_eli5[op["id"]]
+                    self._rewrite_journal()
+
+    # --- reads ---
+
+    def _with_overlay(self, row: Dict, row_id) -> Dict:
+        eli5_summary = self.pending_eli5.get(self._resolve(row_id))
+        if eli5_summary is not None:
+            row["eli5_summary"] = eli5_summary
+            row["include_eli5"] = True
+        return row
+
+    def get(self, row_id):
+        with self.lock:
+            durable_id = self._resolve(row_id)
+            if durable_id in self.pending_rows:
+                return dict(self.pending_rows[durable_id], id=row_id)
+        row = self.backend.get(durable_id)
+        if row is None:
+            return None
+        with self.lock:
+            row = self._with_overlay(row, durable_id)
+        row["id"] = row_id
+        return row
+
+    def find(self, url, summary_focus, summary_length, tone):
+        key = (url, summary_focus, summary_length, tone)
+        rows = self.backend.find(url, summary_focus, summary_length, tone)
+        with self.lock:
+            replaced = {self._resolve(op["replace_id"]) for op in self.queue if op["op"] == "upsert"}
+            rows = [self._with_overlay(row, row["id"]) for row in rows if row["id"] not in replaced]
+            rows += [dict(row, id=pid) for pid, row in self.pending_rows.items()
+                     if tuple(row.get(col) for col in KEY_COLUMNS) == key]
+        return rows
+
+    def load_metadata(self):
+        rows = self.backend.load_metadata()
+        with self.lock:
+            replaced = {self._resolve(op["replace_id"]) for op in self.queue if op["op"] == "upsert"}
+            rows = [self._with_overlay(row, row["id"]) for row in rows if row["id"] not in replaced]
+            rows += [dict({col: row.get(col) for col in METADATA_COLUMNS}, id=pid)
+                     for pid, row in self.pending_rows.items()]
+        return rows
+
+    def delete(self, row_ids):
+        """Deletes stored rows. Rows still waiting in the queue are kept."""
+        with self.flush_lock, self.lock:
+            durable_ids = {self._resolve(row_id) for row_id in row_ids} - set(self.pending_rows)
+            # Drop queued ELI5 updates of the deleted rows
+            dropped = [op for op in self.queue if op["op"] == "eli5" and self._resolve(op["id"]) in durable_ids]
+            for op in dropped:
+                self.queue.remove(op)
+                self.pending_eli5.pop(self._resolve(op["id"]), None)
+            if dropped:
+                self._rewrite_journal()
+        self.backend.delete(list(durable_ids))
+
+    def row_sizes(self):
+        return self.backend.row_sizes()
+
+    def record_access(self, access_times):
+        with self.lock:
+            durable = {self._resolve(row_id): t for row_id, t in access_times.items()}
+            durable = {row_id: t for row_id, t in durable.items() if row_id not in self.pending_rows}
+        self.backend.record_access(durable)
+
+    def load_access(self):
+        return self.backend.load_access()
+
+    def compact(self):
+        self.backend.compact()
+
+    def refresh(self):
+        return self.backend.refresh()
+
+    def __len__(self):
+        with self.lock:
+            new_rows = sum(1 for op in self.queue if op["op"] == "upsert" and op["replace_id"] is None)
+        return len(self.backend) + new_rows
+
+    def close(self):
+        """Stops the flusher and writes everything still queued."""
+        if self.closed:
+            return
+        self.closed = True
+        self.stopping.set()
+        self.wake.set()
+        self.thread.join(timeout=30)
+        self.flush()
+        self.backend.close()
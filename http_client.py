@@ -0,0 +1,59 @@
+import os
+import asyncio
+import weakref
+
+import httpx
+
+DEFAULT_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/58.0.3029.110 Safari/537.3'
+    )
+}
+
+# One pooled client per event loop. httpx clients can't be shared across loops,
+# and analyze_main starts a fresh loop with asyncio.run for every analysis.
+_async_clients = weakref.WeakKeyDictionary()
+
+def _proxy_mounts():
+    """
+    Returns httpx transport mounts for the configured proxies in cloud mode, None otherwise.
+    """
+    is_local = os.getenv("LOCAL_RUN", "false").lower() == "true"
+    http_proxy = os.getenv("PROXY_HTTP")
+    https_proxy = os.getenv("PROXY_HTTPS")
+    if is_local or not (http_proxy or https_proxy):
+        return None
+
+    mounts = {}
+    if http_proxy:
+        mounts["http://"] = httpx.AsyncHTTPTransport(proxy=http_proxy)
+    if https_proxy:
+        mounts["https://"] = httpx.AsyncHTTPTransport(proxy=https_proxy)
+    return mounts
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the pooled async HTTP client for the running event loop, creating it on first use.
+    All fetches made inside the same loop share its keep-alive connections.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(10.0),
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            mounts=_proxy_mounts(),
+        )
+        _async_clients[loop] = client
+    return client
+
+async def close_async_client():
+    """Closes the pooled client of the running event loop, if one was created."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
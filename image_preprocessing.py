@@ -0,0 +1,178 @@
+import os
+import io
+import base64
+import asyncio
+from typing import List, Dict, Optional, Tuple
+
+from PIL import Image
+
+from http_client import get_async_client
+from tracing import traced, current_span
+
+# Longest side (in pixels) an image is downscaled to before it is sent to the VLM.
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+# Maximum Hamming distance between two perceptual hashes to treat the images as duplicates.
+IMAGE_HASH_THRESHOLD = int(os.getenv("IMAGE_HASH_THRESHOLD", "5"))
+# Number of images packed into a single VLM request. 1 keeps one call per image.
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", "1"))
+# Images larger than this are not downloaded; the original URL is passed to the VLM instead.
+IMAGE_MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Computes the difference hash of an image.
+    The image is shrunk to (hash_size + 1) x hash_size grayscale pixels and each bit
+    records whether a pixel is brighter than its right neighbour.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    return bin(hash_a ^ hash_b).count("1")
+
+def downscale(image: Image.Image, max_side: int) -> Image.Image:
+    """Shrinks the image so its longest side is at most max_side, keeping the aspect ratio."""
+    if max(image.size) <= max_side:
+        return image
+    image = image.copy()
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+def encode_data_url(image: Image.Image) -> Tuple[str, int]:
+    """
+    Encodes the image as a base64 JPEG data URL.
+    Returns tuple of (data_url, encoded_size_in_bytes)
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85, optimize=True)
+    encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return f"data:image/jpeg;base64,{encoded}", buffer.tell()
+
+def encode_downscaled(image: Image.Image, max_side: int) -> Tuple[str, int]:
+    return encode_data_url(downscale(image, max_side))
+
+async def fetch_image(link: str) -> Optional[bytes]:
+    """Downloads an image through the pooled client. Returns None if it can't be used."""
+    try:
+        client = get_async_client()
+        async with client.stream("GET", link) as response:
+            response.raise_for_status()
+            content_length = int(response.headers.get("content-length", 0))
+            if content_length > IMAGE_MAX_DOWNLOAD_BYTES:
+                return None
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data.extend(chunk)
+                if len(data) > IMAGE_MAX_DOWNLOAD_BYTES:
+                    return None
+            return bytes(data)
+    except Exception as e:
+        print(f"Failed to fetch image {link}: {e}")
+        return None
+
+def decode_and_hash(link: str, raw: Optional[bytes]) -> Tuple[Optional[Image.Image], Optional[int]]:
+    """Decodes a fetched image and computes its dhash. (None, None) if it wasn't fetched or can't be decoded."""
+    if raw is None:
+        return None, None
+    try:
+        image = Image.open(io.BytesIO(raw))
+        image.load()  # For animated GIFs this is the first frame
+    except Exception as e:
+        print(f"Failed to decode image {link}: {e}")
+        return None, None
+    return image, dhash(image)
+
+@traced('preprocess_images')
+async def preprocess_images(
+    image_links: List[str],
+    max_side: int = IMAGE_MAX_SIDE,
+    hash_threshold: int = IMAGE_HASH_THRESHOLD
+) -> Tuple[List[str], Dict]:
+    """
+    Fetches the images, drops near-duplicates and downscales the rest.
+
+    Images that can't be fetched or decoded are kept as their original URL so the
+    VLM can still try to load them itself.
+
+    Returns:
+        tuple: (image_urls, stats)
+               image_urls is a list of data URLs (or original URLs) in gallery order.
+               stats holds counts and byte sizes of the preprocessing.
+    """
+    raw_images = await asyncio.gather(*(fetch_image(link) for link in image_links))
+    # Decoding, hashing and re-encoding are CPU bound: they run in threads to keep the event
+    # loop free for the link summaries and VLM calls running next to them
+    decoded = await asyncio.gather(*(asyncio.to_thread(decode_and_hash, link, raw)
+                                     for link, raw in zip(image_links, raw_images)))
+
+    image_urls = []
+    kept_hashes = []
+    to_encode = {}
+    stats = {
+        "images_in": len(image_links),
+        "duplicates_dropped": 0,
+        "bytes_fetched": 0,
+        "bytes_sent": 0,
+    }
+
+    for link, raw, (image, image_hash) in zip(image_links, raw_images, decoded):
+        if image is None:
+            image_urls.append(link)
+            continue
+
+        stats["bytes_fetched"] += len(raw)
+        if any(hamming_distance(image_hash, h) <= hash_threshold for h in kept_hashes):
+            stats["duplicates_dropped"] += 1
+            continue
+        kept_hashes.append(image_hash)
+        to_encode[len(image_urls)] = image
+        image_urls.append(link)
+
+    encoded = await asyncio.gather(*(asyncio.to_thread(encode_downscaled, image, max_side)
+                                     for image in to_encode.values()))
+    for index, (data_url, size) in zip(to_encode, encoded):
+        stats["bytes_sent"] += size
+        image_urls[index] = data_url
+
+    stats["bytes_saved"] = stats["bytes_fetched"] - stats["bytes_sent"]
+    current_span().set(**stats)
+    return image_urls, stats
+
+def build_image_chat_histories(image_urls: List[str], batch_size: int = IMAGE_BATCH_SIZE) -> List[List[Dict]]:
+    """
+    Packs the images into VLM chat histories, batch_size images per request.
+    """
+    batch_size = max(1, batch_size)
+    chat_histories = []
+    for start in range(0, len(image_urls), batch_size):
+        batch = image_urls[start:start + batch_size]
+        content = [{"type": "image_url", "image_url": {"url": url}} for url in batch]
+        if len(batch) == 1:
+            content.append({"type": "text", "text": "Describe what's on this image:"})
+        else:
+            content.append({"type": "text", "text": (
+                f"Describe what's on each of these {len(batch)} images. "
+                f"Describe them separately, in order, labelled Image 1 to Image {len(batch)}:"
+            )})
+        chat_histories.append([{"role": "user", "content": content}])
+    return chat_histories
+
+def format_gallery_report(stats: Dict, vlm_calls: int) -> str:
+    """Returns a one-line report of the VLM calls and bytes saved for a gallery."""
+    saved_calls = stats["images_in"] - vlm_calls
+    return (
+        f"Gallery preprocessing: {stats['images_in']} image(s), "
+        f"{stats['duplicates_dropped']} duplicate(s) dropped, "
+        f"{vlm_calls} VLM call(s) ({saved_calls} saved), "
+        f"{stats['bytes_fetched']} bytes fetched, {stats['bytes_sent']} bytes sent "
+        f"({stats['bytes_saved']} saved)"
+    )
@@ -1,26 +1,218 @@
 import os
+import json
+import time
+import asyncio
+import weakref
+import threading
+import contextvars
+from contextlib import contextmanager
 from typing import List, Dict
 from openai import OpenAI
 from openai import AsyncOpenAI
+
+from tracing import span
 # import time
 
+# Clients are built once and reused, keeping their connections alive between calls.
+# The sync client is shared by the whole process. Async clients can't be shared across
+# event loops, so there's one per loop, like the pooled HTTP client in http_client.
+_clients = {}
+_clients_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+# Estimated USD per million prompt and completion tokens by model, e.g. {"gpt-4o-mini": [0.15, 0.6]}.
+# "*" prices the models not listed. Calls of unpriced models cost 0.
+LLM_PRICES = json.loads(os.getenv("LLM_PRICES", "{}"))
+# Budgets of one analysis, 0 for none. An optional call (an image or link summary) that would
+# take the analysis over a budget is skipped; the analysis and summary calls always run.
+LLM_BUDGET_TOKENS = int(os.getenv("LLM_BUDGET_TOKENS", "0"))
+LLM_BUDGET_USD = float(os.getenv("LLM_BUDGET_USD", "0"))
+# Prompt tokens counted for an image before its call, to check the budget
+IMAGE_TOKEN_ESTIMATE = 1000
+OPTIONAL_KINDS = ('image', 'link')
+
+class LLMBudgetExceeded(Exception):
+    """An optional LLM call was skipped because the analysis reached its budget."""
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = LLM_PRICES.get(model) or LLM_PRICES.get("*") or (0, 0)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+def estimate_prompt_tokens(chat_history: List[Dict]) -> int:
+    """A rough count before the call: 4 characters per token, IMAGE_TOKEN_ESTIMATE per image."""
+    chars, images = 0, 0
+    for message in chat_history:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "image_url":
+                images += 1
+            else:
+                chars += len(part.get("text", ""))
+    return chars // 4 + images * IMAGE_TOKEN_ESTIMATE
+
+class LLMUsage:
+    """
+    The LLM calls of one analysis: tokens, latency and estimated cost of each, by kind
+    ('structured', 'summary', 'eli5', 'image', 'link'). track_llm_usage makes it the
+    ledger of every call in the same context, including the event loops the analysis runs.
+    A nested ledger also adds its calls to its parent, and the outermost one holds the budget.
+    """
+
+    def __init__(self, parent: "LLMUsage" = None, max_tokens: int = LLM_BUDGET_TOKENS, max_cost: float = LLM_BUDGET_USD):
+        self.parent = parent
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.lock = threading.Lock()
+        self.calls = []
+        self.skipped = 0
+        # Estimates of the calls in flight, so concurrent optional calls can't all pass the budget check
+        self.reserved_tokens = 0
+        self.reserved_cost = 0.0
+
+    def reserve(self, kind: str, model: str, prompt_tokens: int) -> bool:
+        """Counts a call's estimated prompt against the budget. False if an optional call doesn't fit."""
+        if self.parent is not None:
+            return self.parent.reserve(kind, model, prompt_tokens)
+        cost = call_cost(model, prompt_tokens, 0)
+        with self.lock:
+            tokens_used = sum(call['prompt_tokens'] + call['completion_tokens'] for call in self.calls)
+            cost_used = sum(call['cost_usd'] for call in self.calls)
+            over_tokens = self.max_tokens and tokens_used + self.reserved_tokens + prompt_tokens > self.max_tokens
+            over_cost = self.max_cost and cost_used + self.reserved_cost + cost > self.max_cost
+            if kind in OPTIONAL_KINDS and (over_tokens or over_cost):
+                self.skipped += 1
+                return False
+            self.reserved_tokens += prompt_tokens
+            self.reserved_cost += cost
+            return True
+
+    def release(self, model: str, prompt_tokens: int):
+        if self.parent is not None:
+            return self.parent.release(model, prompt_tokens)
+        with self.lock:
+            self.reserved_tokens -= prompt_tokens
+            self.reserved_cost -= call_cost(model, prompt_tokens, 0)
+
+    def record(self, call: dict):
+        with self.lock:
+            self.calls.append(call)
+        if self.parent is not None:
+            self.parent.record(call)
+
+    def totals(self) -> dict:
+        """The summed usage, with the names of the cache columns it is stored in."""
+        with self.lock:
+            calls = list(self.calls)
+        return {
+            'llm_calls': len(calls),
+            'prompt_tokens': sum(call['prompt_tokens'] for call in calls),
+            'completion_tokens': sum(call['completion_tokens'] for call in calls),
+            'llm_seconds': round(sum(call['seconds'] for call in calls), 3),
+            'llm_cost_usd': round(sum(call['cost_usd'] for call in calls), 6),
+        }
+
+    def summary(self) -> dict:
+        """The totals, the totals by kind of call and the number of calls skipped by the budget."""
+        with self.lock:
+            calls = list(self.calls)
+        by_kind = {}
+        for kind in sorted({call['kind'] for call in calls}):
+            ledger = LLMUsage()
+            ledger.calls = [call for call in calls if call['kind'] == kind]
+            by_kind[kind] = ledger.totals()
+        return dict(self.totals(), by_kind=by_kind, skipped_calls=self.skipped)
+
+_usage = contextvars.ContextVar("llm_usage", default=None)
+
+@contextmanager
+def track_llm_usage():
+    """Records the LLM calls made inside the block, e.g. by one analysis. Yields the LLMUsage."""
+    usage = LLMUsage(parent=_usage.get())
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+def _begin_call(kind: str, model: str, chat_history: List[Dict]):
+    """
+    Checks the budget of the current analysis. Returns its ledger and the reserved estimate,
+    which the caller releases once the call is recorded or failed.
+    """
+    usage = _usage.get()
+    if usage is None:
+        return None, 0
+    estimate = estimate_prompt_tokens(chat_history)
+    if not usage.reserve(kind, model, estimate):
+        print(f"Skipping a {kind} call, the analysis reached its LLM budget")
+        raise LLMBudgetExceeded(f"The {kind} call was skipped to stay within the analysis budget")
+    return usage, estimate
+
+def _end_call(usage, estimate: int, kind: str, model: str, response, seconds: float, call_span):
+    """Records the usage of a finished call on the ledger and its span."""
+    response_usage = getattr(response, 'usage', None)
+    prompt_tokens = getattr(response_usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(response_usage, 'completion_tokens', 0) or 0
+    cost = call_cost(model, prompt_tokens, completion_tokens)
+    if call_span.recording:
+        call_span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cost_usd=round(cost, 6))
+    if usage is not None:
+        usage.record({'kind': kind, 'model': model, 'prompt_tokens': prompt_tokens,
+                      'completion_tokens': completion_tokens, 'seconds': seconds, 'cost_usd': cost})
+
+def _endpoint():
+    return os.getenv("LLM_BASE_URL").rstrip('/'), os.getenv("LLM_API_KEY").rstrip('/')
+
+def get_llm_client() -> OpenAI:
+    """Returns the process-wide client for the configured endpoint, creating it on first use."""
+    base_url, api_key = _endpoint()
+    with _clients_lock:
+        client = _clients.get((base_url, api_key))
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url)
+            _clients[(base_url, api_key)] = client
+    return client
+
+def get_async_llm_client() -> AsyncOpenAI:
+    """Returns the async client of the running event loop for the configured endpoint."""
+    base_url, api_key = _endpoint()
+    loop_clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = loop_clients.get((base_url, api_key))
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        loop_clients[(base_url, api_key)] = client
+    return client
+
+async def close_async_llm_clients():
+    """Closes the async clients of the running event loop. Call it before the loop ends."""
+    for client in _async_clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.close()
+
+def reset_llm_clients():
+    """Drops the shared sync clients, e.g. after the endpoint or API key changed."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
 def chat_completion(
     chat_history: List[Dict[str, str]],
     temperature: float = 0.9,
-    is_image=False
+    is_image=False,
+    kind: str = None
 ) -> str:
     """
     Unified chat completion function using OpenAI-compatible API.
+    kind labels the call in the usage of the analysis; defaults to 'image' or 'summary'.
     """
-    base_url = os.getenv("LLM_BASE_URL").rstrip('/')
-    api_key = os.getenv("LLM_API_KEY").rstrip('/')
+    base_url, _ = _endpoint()
     model = os.getenv("VLM_NAME" if is_image else "MODEL_NAME")
-
-    # Create OpenAI client
-    client = OpenAI(
-        api_key=api_key,
-        base_url=base_url,
-    )
+    kind = kind or ('image' if is_image else 'summary')
+    client = get_llm_client()
 
     # Prepare request parameters
     request_params = {
@@ -29,32 +221,40 @@ def chat_completion(
         "temperature": temperature,
     }
 
+    usage, estimate = _begin_call(kind, model, chat_history)
     try:
-        response = client.chat.completions.create(**request_params)
+        with span('llm_call', model=model, kind=kind, messages=len(chat_history)) as call_span:
+            start = time.perf_counter()
+            response = client.chat.completions.create(**request_params)
+            _end_call(usage, estimate, kind, model, response, time.perf_counter() - start, call_span)
         return response.choices[0].message.content
     except Exception as e:
         print(f"Full base URL: {base_url}")
         print(f"Request params: {request_params}")
         raise
+    finally:
+        if usage is not None:
+            usage.release(model, estimate)
 
 async def async_chat_completion(
     chat_history: List[Dict[str, str]],
     temperature: float = 0.9,
-    is_image: bool = False
+    is_image: bool = False,
+    model: str = None,
+    kind: str = None
 ) -> str:
     """
     Asynchronous chat completion function using OpenAI-compatible API.
+    model overrides the model name from the environment.
+    kind labels the call in the usage of the analysis ('structured', 'summary', 'eli5',
+    'image' or 'link'); defaults to 'image' or 'summary'. Raises LLMBudgetExceeded
+    instead of calling for an image or link once the analysis reached its budget.
+    The client of the event loop is reused; close_async_llm_clients closes it.
     """
-    base_url = os.getenv("LLM_BASE_URL").rstrip('/')
-    api_key = os.getenv("LLM_API_KEY").rstrip('/')
-    model = os.getenv("VLM_NAME" if is_image else "MODEL_NAME")
-    
-    # Create the asynchronous OpenAI client
-    client = AsyncOpenAI(
-        api_key=api_key,
-        base_url=base_url,
-    )
-    
+    model = model or os.getenv("VLM_NAME" if is_image else "MODEL_NAME")
+    kind = kind or ('image' if is_image else 'summary')
+    client = get_async_llm_client()
+
     # Prepare request parameters
     request_params = {
         "model": model,
@@ -62,13 +262,16 @@ async def async_chat_completion(
         "temperature": temperature,
     }
 
+    usage, estimate = _begin_call(kind, model, chat_history)
     try:
-        response = await client.chat.completions.create(**request_params)
-        return response.choices[0].message.content
-    except Exception as e:
-        raise
+        with span('llm_call', model=model, kind=kind, messages=len(chat_history)) as call_span:
+            start = time.perf_counter()
+            response = await client.chat.completions.create(**request_params)
+            _end_call(usage, estimate, kind, model, response, time.perf_counter() - start, call_span)
     finally:
-        await client.close()  # Ensure the client is closed
+        if usage is not None:
+            usage.release(model, estimate)
+    return response.choices[0].message.content
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
@@ -4,17 +4,27 @@ import os
 import html
 from urllib.parse import urlparse
 
-def fetch_json_response(url: str, use_proxy: bool = False) -> dict or str:
+from tracing import traced, current_span
+
+# Sends reddit.com fetches to another host instead, e.g. the stub in benchmarks/stubs.py for load tests
+REDDIT_BASE_URL = os.getenv("REDDIT_BASE_URL", "").rstrip("/")
+
+def fetch_json_response(url: str, use_proxy: bool = False, proxies: dict = None, timeout: float = None) -> tuple:
     """
     Fetches the JSON response from the given URL using the requests package.
-    Uses proxy if specified. Uses a custom User-Agent if provided via
+    Uses the configured proxy if specified, or the given proxies. Uses a custom User-Agent if provided via
     the CUSTOM_USER_AGENT environment variable; otherwise, uses a default.
     
     Query parameters (including the '?' character) are removed from the URL before processing.
+
+    Returns (parsed JSON or an error message, HTTP status code). The status code is None
+    when no response was received.
     """
     # Remove query parameters from the URL
     parsed_url = urlparse(url)
     url = parsed_url.scheme + "://" + parsed_url.netloc + parsed_url.path
+    if REDDIT_BASE_URL and parsed_url.netloc.endswith("reddit.com"):
+        url = REDDIT_BASE_URL + parsed_url.path
 
     # Ensure the URL ends with '.json'
     if not url.endswith('.json'):
@@ -29,8 +39,7 @@ def fetch_json_response(url: str, use_proxy: bool = False) -> dict or str:
         )
     }
 
-    proxies = None
-    if use_proxy:
+    if use_proxy and proxies is None:
         http_proxy = os.getenv("PROXY_HTTP")
         https_proxy = os.getenv("PROXY_HTTPS")
         if http_proxy or https_proxy:  # Only set proxies if they are actually defined
@@ -39,16 +48,19 @@ def fetch_json_response(url: str, use_proxy: bool = False) -> dict or str:
                 'https': https_proxy
             }
 
+    status_code = None
     try:
-        response = requests.get(url, headers=headers, proxies=proxies)
+        response = requests.get(url, headers=headers, proxies=proxies, timeout=timeout)
+        status_code = response.status_code
+        current_span().set(status_code=status_code, bytes=len(response.content))
         response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-        return response.json()
+        return response.json(), status_code
     except requests.exceptions.RequestException as e:
-        return f"Error: Request failed with exception: {e}"
+        return f"Error: Request failed with exception: {e}", status_code
     except ValueError as e:  # json.decoder.JSONDecodeError in Python 3.6+ is ValueError
-        return f"Error: Invalid JSON response: {e}"  # Handle cases where the response isn't valid JSON
+        return f"Error: Invalid JSON response: {e}", status_code  # Handle cases where the response isn't valid JSON
     except Exception as e:
-        return f"Error fetching JSON response: {e}"
+        return f"Error fetching JSON response: {e}", status_code
 
 
 def return_OP(json_data):
@@ -136,6 +148,7 @@ def return_OP(json_data):
         print(e)
         return (None, None)
 
+@traced('parse_comments')
 def return_comments(json_data):
     """
     Scrapes the comments section from the JSON response, preserving the hierarchy (nesting).
@@ -254,6 +267,30 @@ def return_comments(json_data):
 
     return comments
 
+def return_listing_threads(json_data):
+    """
+    Extracts the thread URLs from a subreddit listing JSON response (hot, rising, ...).
+    Stickied posts are skipped, as they stay on top regardless of activity.
+
+    Args:
+        json_data (dict): The JSON response of a listing endpoint.
+
+    Returns:
+        list: Thread URLs in listing order. Empty if the response is not a listing.
+    """
+    if not isinstance(json_data, dict) or not isinstance(json_data.get('data'), dict):
+        return []
+
+    urls = []
+    for child in json_data['data'].get('children', []):
+        if not isinstance(child, dict) or child.get('kind') != 't3':
+            continue
+        data = child.get('data', {})
+        if data.get('stickied') or not data.get('permalink'):
+            continue
+        urls.append(f"https://www.reddit.com{data['permalink']}")
+    return urls
+
 def prettify_comments(comments):
     """
     Formats the comments in a tree-like structure, using separators and arrows to show the hierarchy.
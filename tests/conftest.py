@@ -0,0 +1,13 @@
+import os
+import sys
+
+# Keep the metrics and traces of the code under test out of the working directory
+os.environ.setdefault("CACHE_METRICS_PATH", "")
+os.environ.setdefault("TRACE_PATH", "")
+
+# Add the root and frontend directories to path, as the app and scripts do, and the
+# benchmarks for their local stand-ins
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "frontend"))
+sys.path.append(os.path.join(ROOT, "benchmarks"))
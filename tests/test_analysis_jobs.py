@@ -0,0 +1,138 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import analysis_jobs
+from analyze_main import failed_thread_data
+from analysis_jobs import run_analysis
+from analysis_options import DEFAULT_OPTIONS
+from cache_backends import IndexedCache, SqliteCacheBackend
+from cache_helpers import FETCH_FAILED_MESSAGE
+
+URL = "https://www.reddit.com/r/test/comments/abc123/title/"
+
+def cached_row(**overrides):
+    # Older than the freshness TTL, so the thread is fetched for the tolerance check
+    timestamp = datetime.now(timezone.utc) - timedelta(days=2)
+    row = {
+        'url': URL, 'timestamp': timestamp.isoformat(), 'summary_focus': DEFAULT_OPTIONS['summary_focus'],
+        'summary_length': DEFAULT_OPTIONS['summary_length'], 'tone': DEFAULT_OPTIONS['tone'],
+        'include_eli5': False, 'analyze_image': DEFAULT_OPTIONS['analyze_image'],
+        'search_external': DEFAULT_OPTIONS['search_external'], 'number_of_comments': 10, 'total_score': 100,
+        'total_ef_score': 50, 'analysis_result': "cached analysis", 'eli5_summary': "",
+        'notable_comments': "[[], []]",
+    }
+    row.update(overrides)
+    return row
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = IndexedCache(SqliteCacheBackend(str(tmp_path / "analyses.db")))
+    yield cache
+    cache.close()
+
+@pytest.fixture
+def new_analyses(monkeypatch):
+    """Records the new analyses run_analysis starts instead of calling the LLM."""
+    calls = []
+
+    def perform_new_analysis(cache, all_thread_data, *args):
+        calls.append(all_thread_data)
+        return "new analysis", None, [[], []]
+
+    monkeypatch.setattr(analysis_jobs, "perform_new_analysis", perform_new_analysis)
+    return calls
+
+def analyze(cache, fetch, **options):
+    return run_analysis(cache, URL, dict(DEFAULT_OPTIONS, **options), lambda *args: None, fetch)
+
+def stale_row(**overrides):
+    """Too old for the freshness TTL, recent enough for the fallback when the fetch fails."""
+    return cached_row(timestamp=(datetime.now(timezone.utc) - timedelta(hours=2)).isoformat(), **overrides)
+
+def test_failed_fetch_serves_the_stale_cached_analysis(cache, new_analyses):
+    cache.upsert(stale_row())
+    result = analyze(cache, failed_thread_data)
+    assert result['analysis_result'] == "cached analysis"
+    assert result['cache_time'] is not None
+    assert result['stale']
+    assert new_analyses == []
+
+def test_failed_fetch_does_not_serve_analyses_past_the_stale_age(cache, new_analyses):
+    cache.upsert(cached_row())
+    result = analyze(cache, failed_thread_data)
+    assert result['analysis_result'] == FETCH_FAILED_MESSAGE
+    assert not result['stale']
+
+def test_failed_fetch_without_cached_analysis_is_reported(cache, new_analyses):
+    result = analyze(cache, failed_thread_data)
+    assert result['analysis_result'] == FETCH_FAILED_MESSAGE
+    assert result['notable_comments'] is None
+    assert new_analyses == []
+
+def test_failed_fetch_skips_the_missing_eli5(cache, new_analyses):
+    cache.upsert(stale_row())
+    result = analyze(cache, failed_thread_data, include_eli5=True)
+    assert result['analysis_result'] == "cached analysis"
+    assert result['sum_for_5yo'] is None
+
+def test_row_evicted_after_the_lookup_runs_a_new_analysis(cache, new_analyses, monkeypatch):
+    cache.upsert(cached_row(timestamp=datetime.now(timezone.utc).isoformat()))
+    monkeypatch.setattr(cache, "get", lambda row_id: None)
+    thread = {'title': "t", 'url': URL, 'original_post': {'url': URL}, 'comments': []}
+    result = analyze(cache, lambda url: thread)
+    assert result['analysis_result'] == "new analysis"
+    assert new_analyses == [thread]
+
+def test_new_analysis_never_replaces_the_row_of_a_fuzzy_matched_focus(cache, monkeypatch):
+    replaced = []
+    monkeypatch.setattr(analysis_jobs, "perform_new_analysis",
+                        lambda *args: replaced.append(args[9]) or ("new analysis", None, [[], []]))
+    other_id = cache.upsert(cached_row(summary_focus="The community's sentiment"))
+    own_id = cache.upsert(cached_row(summary_focus="community sentiment", analyze_image=False))
+    # The thread grew far past the tolerances of both rows
+    thread = {'title': "t", 'url': URL, 'original_post': {'url': URL},
+              'comments': [{'score': 50, 'ef_score': 1, 'replies': []}] * 40}
+
+    analyze(cache, lambda url: thread, summary_focus="Community sentiment!", analyze_image=True)
+    assert replaced == [own_id]
+
+    cache.delete([own_id])
+    result = analyze(cache, lambda url: thread, summary_focus="Community sentiment!", analyze_image=True)
+    assert replaced == [own_id, None]
+    assert result['served_focus'] == "Community sentiment!"
+    # The fuzzy-matched row was a candidate both times, and is kept
+    assert cache.get(other_id)['summary_focus'] == "The community's sentiment"
+
+def test_served_focus_names_the_fuzzy_matched_focus(cache, new_analyses):
+    cache.upsert(cached_row(summary_focus="The community's sentiment"))
+    thread = {'title': "t", 'url': URL, 'original_post': {'url': URL},
+              'comments': [{'score': 10, 'ef_score': 5, 'replies': []}] * 10}
+    result = analyze(cache, lambda url: thread, summary_focus="Community sentiment")
+    assert result['analysis_result'] == "cached analysis"
+    assert result['served_focus'] == "The community's sentiment"
+
+def comment(author, score, replies=()):
+    return {'author': author, 'body': "text", 'score': score, 'ef_score': score, 'depth': 0, 'replies': list(replies)}
+
+def test_cached_comments_are_ranked_again_when_more_are_requested(cache, new_analyses):
+    thread = {'title': "t", 'url': URL, 'original_post': {'url': URL},
+              'comments': [comment(f"user{i}", 10 + i) for i in range(10)]}
+    ranked = [[[comment(f"user{i}", 10 + i), None] for i in (9, 8)], []]
+    cache.upsert(cached_row(timestamp=datetime.now(timezone.utc).isoformat(), notable_comments=json.dumps(ranked),
+                            number_of_comments=10, total_score=145))
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        return thread
+
+    result = analyze(cache, fetch, max_comments=1)
+    assert [main['author'] for main, _ in result['notable_comments'][0]] == ["user9"]
+    assert fetched == []
+
+    result = analyze(cache, fetch, max_comments=5)
+    assert result['analysis_result'] == "cached analysis"
+    assert [main['author'] for main, _ in result['notable_comments'][0]] == [f"user{i}" for i in range(9, 4, -1)]
+    assert fetched == [URL] and new_analyses == []
@@ -0,0 +1,34 @@
+import pytest
+
+from analysis_options import DEFAULT_OPTIONS, TONES, InvalidRequest, parse_options, parse_url
+from config import prompts
+
+def test_missing_options_get_the_home_page_defaults():
+    assert parse_options({'url': "https://www.reddit.com/r/a/comments/1/", 'tone': "Pirate"}) == dict(DEFAULT_OPTIONS, tone="Pirate")
+
+@pytest.mark.parametrize("payload, message", [
+    ({'wait': 5}, "Unknown fields: wait"),
+    ({'max_comments': "5"}, "'max_comments' must be a int"),
+    ({'summary_length': "Huge"}, "'summary_length' must be one of"),
+    ({'tone': "Robot"}, "Unknown tone 'Robot'"),
+    ({'tone': "structured_analysis"}, "Unknown tone 'structured_analysis'"),
+    ({'tone': "restyle_analysis"}, "Unknown tone 'restyle_analysis'"),
+    ({'summary_focus': "x" * 51}, "'summary_focus' must be at most 50 characters"),
+    ({'max_comments': 0}, "'max_comments' must be between 1 and 500"),
+    ({'max_comments': -5}, "'max_comments' must be between 1 and 500"),
+    ({'max_comments': 501}, "'max_comments' must be between 1 and 500"),
+])
+def test_invalid_options_are_rejected(payload, message):
+    with pytest.raises(InvalidRequest, match=message):
+        parse_options(payload)
+
+def test_every_home_page_tone_has_a_prompt():
+    assert set(TONES) <= set(prompts)
+
+def test_other_fields_of_the_request_are_allowed():
+    assert parse_options({'url': "u", 'wait': 5}, other_fields=('url', 'wait')) == DEFAULT_OPTIONS
+
+@pytest.mark.parametrize("value", [None, 42, "reddit.com/r/a", "ftp://reddit.com/r/a"])
+def test_only_web_urls_are_accepted(value):
+    with pytest.raises(InvalidRequest):
+        parse_url(value)
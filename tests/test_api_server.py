@@ -0,0 +1,46 @@
+import json
+import http.client
+from http.server import ThreadingHTTPServer
+import threading
+
+import pytest
+
+from api_server import AnalysisApi, ApiError, ApiHandler
+
+class FinishedJob:
+    def wait(self, timeout):
+        return True
+
+@pytest.fixture
+def api():
+    return AnalysisApi(None, timeout=1)
+
+@pytest.fixture
+def post(api):
+    handler = type("TestApiHandler", (ApiHandler,), {'api': api})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def post(payload):
+        connection = http.client.HTTPConnection(*server.server_address, timeout=5)
+        connection.request("POST", "/analyze", json.dumps(payload), {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, response.read()
+    yield post
+    server.shutdown()
+    server.server_close()
+
+@pytest.mark.parametrize("wait", [True, False, "5", -1])
+def test_wait_must_be_a_number_of_seconds(api, wait):
+    with pytest.raises(ApiError) as error:
+        api.analyze({'url': "https://www.reddit.com/r/test/comments/a/one/", 'wait': wait})
+    assert error.value.status == 400
+
+def test_a_failure_while_streaming_ends_the_stream_with_an_error_line(api, post, monkeypatch):
+    monkeypatch.setattr(api, "submit", lambda payload: FinishedJob())
+    monkeypatch.setattr(api, "job_state", lambda job: 1 / 0)
+
+    # http.client reads the chunked framing, and fails on a broken one
+    status, body = post({'url': "https://www.reddit.com/r/test/comments/a/one/", 'stream': True})
+    assert status == 200
+    assert [json.loads(line) for line in body.splitlines()] == [{'status': 'failed', 'error': "Internal error"}]
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import write_behind
+from cache_backends import IndexedCache, SqliteCacheBackend, STRUCTURED
+from cache_retention import enforce_retention, select_evictions
+from write_behind import WriteBehindCache
+
+def make_row(i, **overrides):
+    timestamp = datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i)
+    row = {
+        'url': f"https://www.reddit.com/r/test/comments/t{i}/x/", 'timestamp': timestamp.isoformat(),
+        'summary_focus': "General Summary", 'summary_length': "Medium", 'tone': "Teacher",
+        'include_eli5': False, 'analyze_image': False, 'search_external': False,
+        'number_of_comments': 10, 'total_score': 100, 'total_ef_score': 50,
+        'analysis_result': f"analysis {i}", 'eli5_summary': "", 'notable_comments': "[[], []]",
+    }
+    row.update(overrides)
+    return row
+
+@pytest.fixture
+def write_behind_cache(tmp_path):
+    backend = WriteBehindCache(SqliteCacheBackend(str(tmp_path / "analyses.db")), str(tmp_path / "journal.jsonl"),
+                               flush_interval=3600)
+    cache = IndexedCache(backend)
+    yield cache
+    backend.close()
+
+def test_select_evictions_oldest_first_and_skips_pending():
+    metadata = [{'id': i, 'timestamp': make_row(i)['timestamp']} for i in range(4)]
+    metadata.append({'id': "pending-x", 'timestamp': make_row(0)['timestamp']})
+    assert select_evictions(metadata, {0: 1e12}, {}, max_rows=2) == [1, 2]
+
+def test_rows_written_behind_are_evicted_after_the_flush(write_behind_cache):
+    for i in range(5):
+        write_behind_cache.upsert(make_row(i))
+    write_behind_cache.backend.flush()
+
+    ids = [row['id'] for row in write_behind_cache.load_metadata()]
+    assert not any(str(row_id).startswith('pending-') for row_id in ids)
+
+    evicted = enforce_retention(write_behind_cache, max_rows=2)
+    assert len(evicted) == 3
+    assert len(write_behind_cache) == 2
+    assert len(write_behind_cache.backend.backend) == 2
+    assert sorted(row['url'] for row in write_behind_cache.load_metadata()) == [make_row(3)['url'], make_row(4)['url']]
+
+def test_unflushed_rows_are_kept(write_behind_cache):
+    for i in range(3):
+        write_behind_cache.upsert(make_row(i))
+    assert enforce_retention(write_behind_cache, max_rows=1) == []
+    assert len(write_behind_cache) == 3
+
+def test_access_time_follows_the_rekeyed_row(write_behind_cache):
+    pid = write_behind_cache.upsert(make_row(0))
+    write_behind_cache.upsert(make_row(1))
+    write_behind_cache.get(pid)
+    write_behind_cache.backend.flush()
+
+    # Row 0 is older but was served last, so row 1 goes
+    evicted = enforce_retention(write_behind_cache, max_rows=1)
+    remaining = write_behind_cache.load_metadata()
+    assert len(evicted) == 1 and [row['url'] for row in remaining] == [make_row(0)['url']]
+
+def test_flushed_ids_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_behind, "ID_MAP_SIZE", 2)
+    backend = WriteBehindCache(SqliteCacheBackend(str(tmp_path / "analyses.db")), str(tmp_path / "journal.jsonl"),
+                               flush_interval=3600)
+    try:
+        pids = [backend.upsert(make_row(i)) for i in range(5)]
+        backend.flush()
+        assert list(backend.id_map) == pids[-2:]
+        assert backend.get(pids[-1])['analysis_result'] == "analysis 4"
+    finally:
+        backend.close()
+
+def test_structured_analyses_go_with_the_last_analysis_of_their_thread_and_focus():
+    structured = dict(summary_length=STRUCTURED, tone=STRUCTURED)
+    metadata = [dict(make_row(i), id=i) for i in range(3)]
+    metadata += [dict(make_row(i, **structured), id=f"s{i}") for i in range(3)]
+    # A second analysis of thread 1 in another tone keeps its structured analysis alive
+    metadata.append(dict(make_row(1, tone="Pirate", timestamp=make_row(9)['timestamp']), id=9))
+
+    assert select_evictions(metadata, {}, {}, max_rows=2) == [0, 1, "s0"]
+
+def test_structured_analyses_are_not_counted_as_analyses(tmp_path):
+    cache = IndexedCache(SqliteCacheBackend(str(tmp_path / "analyses.db")))
+    try:
+        for i in range(2):
+            cache.upsert(make_row(i))
+            cache.upsert(make_row(i, summary_length=STRUCTURED, tone=STRUCTURED))
+        assert (len(cache), cache.count_analyses()) == (4, 2)
+        assert enforce_retention(cache, max_rows=2) == []
+    finally:
+        cache.close()
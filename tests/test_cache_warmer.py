@@ -0,0 +1,108 @@
+import time
+import threading
+from collections import Counter
+
+import pytest
+
+import cache_warmer
+from cache_backends import IndexedCache, SqliteCacheBackend
+from cache_warmer import CacheWarmer, DEFAULT_OPTIONS
+from test_analysis_jobs import cached_row
+
+THREADS = ["https://www.reddit.com/r/test/comments/a/one/", "https://www.reddit.com/r/test/comments/b/two/"]
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = IndexedCache(SqliteCacheBackend(str(tmp_path / "analyses.db")))
+    yield cache
+    cache.close()
+
+def thread_data(url, comments=100):
+    """A thread with `comments` comments of score 1, so its comment count and score are both `comments`."""
+    return {'title': "t", 'url': url, 'original_post': {'url': url, 'body': "post"},
+            'comments': [{'score': 1, 'ef_score': 1, 'replies': []}] * comments}
+
+def warmed_row(url, summary_length, tone, comments, **overrides):
+    row = dict(url=url, summary_focus=DEFAULT_OPTIONS['summary_focus'], summary_length=summary_length, tone=tone,
+               analyze_image=DEFAULT_OPTIONS['analyze_image'], number_of_comments=comments, total_score=comments)
+    return cached_row(**dict(row, **overrides))
+
+@pytest.fixture
+def listed(monkeypatch):
+    """Lists THREADS, each with 100 comments, and records the analyses instead of running them."""
+    analyses = []
+    monkeypatch.setattr(cache_warmer, "fetch_listing", lambda subreddit, listing, limit: THREADS)
+    monkeypatch.setattr(cache_warmer, "fetch_thread_data", thread_data)
+    monkeypatch.setattr(cache_warmer, "perform_new_analysis",
+                        lambda *args: analyses.append(args) or ("analysis", None, [[], []]))
+    return analyses
+
+def planned(warmer, url):
+    return {(length, tone): (replace_id, status) for _, length, tone, replace_id, status in warmer.plan(url)}
+
+def test_plan_classifies_against_the_narrowed_tolerances(cache, listed):
+    url = THREADS[0]
+    cache.upsert(warmed_row(url, "Short", "Teacher", 100))
+    # 91 -> 100 comments is within the 10% tolerance, but past 80% of it
+    expiring_id = cache.upsert(warmed_row(url, "Medium", "Teacher", 91))
+    cache.upsert(warmed_row(url, "Long", "Teacher", 50))
+
+    warmer = CacheWarmer(cache, lengths=["Short", "Medium", "Long"], tones=["Teacher", "Pirate"])
+    plan = planned(warmer, url)
+
+    assert plan[("Short", "Teacher")] == (None, 'fresh')
+    assert plan[("Medium", "Teacher")] == (expiring_id, 'refresh')
+    assert plan[("Long", "Teacher")][1] == 'refresh'
+    assert plan[("Short", "Pirate")] == (None, 'warm')
+
+    # With the full tolerances the expiring row is still fresh
+    warmer.refresh_margin = 1.0
+    assert planned(warmer, url)[("Medium", "Teacher")] == (None, 'fresh')
+
+def test_refresh_replaces_the_row_without_matching_parameters(cache, listed):
+    url = THREADS[0]
+    old_id = cache.upsert(warmed_row(url, "Medium", "Teacher", 50, analyze_image=False))
+    [(_, _, _, replace_id, status)] = CacheWarmer(cache, lengths=["Medium"], tones=["Teacher"]).plan(url)
+    assert (replace_id, status) == (old_id, 'refresh')
+
+def test_rows_of_a_fuzzy_matched_focus_are_not_replaced(cache, listed):
+    url = THREADS[0]
+    cache.upsert(warmed_row(url, "Medium", "Teacher", 50, summary_focus="A general summary"))
+    [(_, _, _, replace_id, status)] = CacheWarmer(cache, lengths=["Medium"], tones=["Teacher"]).plan(url)
+    assert (replace_id, status) == (None, 'warm')
+
+def test_analyses_past_the_budget_are_skipped_in_listing_order(cache, listed):
+    cache.upsert(warmed_row(THREADS[1], "Short", "Teacher", 100))
+    warmer = CacheWarmer(cache, subreddits=["test"], listings=["hot"], lengths=["Short", "Medium"],
+                         tones=["Teacher", "Pirate"], max_analyses=5)
+    stats = warmer.run_once()
+
+    assert (stats['fresh'], stats['warm'], stats['over_budget']) == (1, 5, 2)
+    analyzed = [(args[1]['original_post']['url'], args[3], args[4]) for args in listed]
+    assert sorted(analyzed) == sorted([(THREADS[0], length, tone) for length in ("Short", "Medium")
+                                       for tone in ("Teacher", "Pirate")] + [(THREADS[1], "Short", "Pirate")])
+
+def test_a_threads_combinations_run_one_after_the_other(cache, monkeypatch):
+    running, overlaps, lock = Counter(), [], threading.Lock()
+
+    def perform_new_analysis(cache, all_thread_data, *args):
+        url = all_thread_data['original_post']['url']
+        with lock:
+            running[url] += 1
+            overlaps.append(running[url])
+        time.sleep(0.05)
+        with lock:
+            running[url] -= 1
+        return "analysis", None, [[], []]
+
+    monkeypatch.setattr(cache_warmer, "fetch_listing", lambda subreddit, listing, limit: THREADS)
+    monkeypatch.setattr(cache_warmer, "fetch_thread_data", lambda url: {
+        'title': "t", 'url': url, 'original_post': {'url': url, 'body': "post"}, 'comments': []})
+    monkeypatch.setattr(cache_warmer, "perform_new_analysis", perform_new_analysis)
+
+    warmer = CacheWarmer(cache, subreddits=["test"], listings=["hot"], lengths=["Short", "Medium"],
+                         tones=["Teacher", "Pirate"], concurrency=4)
+    stats = warmer.run_once()
+
+    assert stats['warm'] == 8
+    assert len(overlaps) == 8 and max(overlaps) == 1
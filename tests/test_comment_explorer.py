@@ -0,0 +1,21 @@
+from comment_explorer import _text
+
+def test_reddit_markdown_is_rendered():
+    html = _text("**bold** and *italic* with `code` and [a link](https://example.com/a_b?x=1&amp;y=2)")
+    assert "<strong>bold</strong>" in html
+    assert "<em>italic</em>" in html
+    assert "<code>code</code>" in html
+    assert '<a href="https://example.com/a_b?x=1&amp;y=2"' in html and ">a link</a>" in html
+
+def test_quotes_lists_and_code_blocks_are_rendered():
+    html = _text("&gt; quoted\n\n- one\n- two\n\n    first line\n\n    second line")
+    assert "<blockquote" in html and "quoted" in html
+    assert "<ul" in html and "<li>one</li><li>two</li>" in html
+    assert "<pre" in html and "first line&#10;&#10;second line" in html
+    # A blank line would end the HTML block the comments are rendered in
+    assert "\n" not in html
+
+def test_raw_html_is_escaped():
+    html = _text("&lt;script&gt;alert(1)&lt;/script&gt; <img src=x onerror=alert(1)> [x](javascript:alert(1))")
+    assert "<script>" not in html and "<img" not in html and "<a " not in html
+    assert "&lt;script&gt;" in html
@@ -0,0 +1,36 @@
+import pytest
+
+from content_extraction import extract_main_content
+
+ARTICLE = "<p>" + "This paragraph is the readable main content of the page, with enough words. " * 6 + "</p>"
+
+def page(body):
+    return f"<html><body><nav><a href='/'>Home</a></nav>{body}<footer>Footer links</footer></body></html>"
+
+def test_github_readme_is_selected_by_the_domain_rule():
+    html = page(f"<div class='sidebar'>About</div><article class='markdown-body'>{ARTICLE}</article>")
+    assert extract_main_content(html, "https://github.com/owner/repo").startswith("This paragraph")
+
+def test_missing_readme_on_a_repository_page_raises():
+    with pytest.raises(ValueError):
+        extract_main_content(page(f"<div>{ARTICLE}</div>"), "https://www.github.com/owner/repo")
+
+@pytest.mark.parametrize("url", [
+    "https://docs.github.com/en/actions/quickstart",
+    "https://gist.github.com/owner/0123456789abcdef",
+    "https://github.com/owner/repo/issues/1",
+])
+def test_other_github_pages_fall_back_to_scoring(url):
+    content = extract_main_content(page(f"<div class='content'>{ARTICLE}</div>"), url)
+    assert content.startswith("This paragraph")
+    assert "Footer" not in content
+
+@pytest.mark.parametrize("prolog", [
+    '<?xml version="1.0" encoding="utf-8"?>',
+    "<?xml version='1.0' encoding='iso-8859-1'?>\n<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.0 Strict//EN\" "
+    "\"http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd\">",
+])
+def test_pages_with_an_xml_declaration_are_extracted(prolog):
+    html = prolog + page(f"<div class='content'>{ARTICLE}</div>").replace(
+        "<html>", "<html xmlns='http://www.w3.org/1999/xhtml'>")
+    assert extract_main_content(html, "https://example.com/article").startswith("This paragraph")
@@ -0,0 +1,61 @@
+import pytest
+
+from fetch_policy import FetchPolicy, is_permanent_failure
+
+class ScriptedFetch:
+    """Answers each fetch with the next (result, status code), recording the routes used."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.routes = []
+
+    def __call__(self, url, proxies=None, timeout=None):
+        self.routes.append(proxies)
+        return self.responses.pop(0)
+
+def make_policy(fetch):
+    return FetchPolicy([("direct", None), ("proxy", {'https': 'http://proxy'})], fetch=fetch,
+                       breaker_failures=1, sleep=lambda seconds: None)
+
+@pytest.mark.parametrize("status_code, permanent", [
+    (404, True), (410, True), (451, True), (401, False), (403, False), (200, False),
+    (408, False), (429, False), (503, False), (None, False),
+])
+def test_is_permanent_failure(status_code, permanent):
+    assert is_permanent_failure(status_code) is permanent
+
+def test_client_error_is_not_retried_or_held_against_the_route():
+    fetch = ScriptedFetch(("Error: Request failed with exception: 404 Client Error", 404))
+    policy = make_policy(fetch)
+    assert policy.fetch_json("https://www.reddit.com/r/x/comments/gone").startswith("Error")
+    assert len(fetch.routes) == 1
+    direct = policy.snapshot()[0]
+    assert direct['success_rate'] == 1.0 and not direct['open']
+
+def test_invalid_json_is_retried_on_another_route():
+    fetch = ScriptedFetch(("Error: Invalid JSON response: Expecting value", 200), ({'data': {}}, 200))
+    policy = make_policy(fetch)
+    assert policy.fetch_json("https://www.reddit.com/r/x/comments/abc") == {'data': {}}
+    assert fetch.routes == [None, {'https': 'http://proxy'}]
+    assert policy.snapshot()[0]['open']
+
+def test_blocked_direct_route_falls_back_on_the_proxy():
+    fetch = ScriptedFetch(("Error: Request failed with exception: 403 Client Error", 403), ({'data': {}}, 200))
+    policy = make_policy(fetch)
+    assert policy.fetch_json("https://www.reddit.com/r/x/comments/abc") == {'data': {}}
+    assert fetch.routes == [None, {'https': 'http://proxy'}]
+    direct, proxy = policy.snapshot()
+    assert direct['open'] and direct['success_rate'] < 1.0
+    assert not proxy['open']
+
+def test_server_error_is_retried_on_another_route():
+    fetch = ScriptedFetch(("Error: Request failed with exception: 503 Server Error", 503), ({'data': {}}, 200))
+    policy = make_policy(fetch)
+    assert policy.fetch_json("https://www.reddit.com/r/x/comments/abc") == {'data': {}}
+    assert fetch.routes == [None, {'https': 'http://proxy'}]
+    assert policy.snapshot()[0]['open']
+
+def test_rate_limit_is_retried():
+    fetch = ScriptedFetch(("Error: Request failed with exception: 429 Client Error", 429), ({'data': {}}, 200))
+    assert make_policy(fetch).fetch_json("https://www.reddit.com/r/x/comments/abc") == {'data': {}}
+    assert len(fetch.routes) == 2
@@ -0,0 +1,40 @@
+import pytest
+
+from cache_backends import IndexedCache, SqliteCacheBackend
+from focus_matching import FocusMatcher, canonicalize_focus, same_focus
+from test_analysis_jobs import cached_row
+
+@pytest.mark.parametrize("requested, cached", [
+    ("impact on the US economy", "impact on the UK economy"),
+    ("bugs in version 2", "bugs in version 3"),
+    ("reactions in 2023", "reactions in 2024"),
+])
+def test_focuses_with_different_words_or_numbers_never_match(requested, cached):
+    matcher = FocusMatcher(threshold=0.5)
+    requested, cached = canonicalize_focus(requested), canonicalize_focus(cached)
+    matcher.add(cached)
+    assert matcher.best_match(requested, [cached]) == (None, 0.0)
+
+def test_rewordings_of_the_same_focus_match():
+    matcher = FocusMatcher()
+    cached = canonicalize_focus("The community's sentiment")
+    matcher.add(cached)
+    match, similarity = matcher.best_match(canonicalize_focus("Community sentiment"), [cached])
+    assert match == cached
+    assert similarity >= matcher.threshold
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = IndexedCache(SqliteCacheBackend(str(tmp_path / "analyses.db")))
+    yield cache
+    cache.close()
+
+def test_find_returns_the_focus_that_was_matched(cache):
+    cache.upsert(cached_row(summary_focus="The community's sentiment"))
+    cache.upsert(cached_row(summary_focus="impact on the UK economy"))
+    row = cached_row()
+
+    [match] = cache.find(row['url'], "Community sentiment", row['summary_length'], row['tone'])
+    assert match['summary_focus'] == "The community's sentiment"
+    assert not same_focus(match['summary_focus'], "Community sentiment")
+    assert cache.find(row['url'], "impact on the US economy", row['summary_length'], row['tone']) == []
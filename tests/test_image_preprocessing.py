@@ -0,0 +1,36 @@
+import io
+import asyncio
+
+from PIL import Image
+
+import image_preprocessing
+from image_preprocessing import preprocess_images
+
+def png(color, size=(64, 48), split=False):
+    image = Image.new("RGB", size, color)
+    if split:
+        image.paste((255, 255, 255), (0, 0, size[0] // 2, size[1]))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def test_preprocess_keeps_gallery_order_and_drops_duplicates(monkeypatch):
+    images = {
+        "https://i.redd.it/a.png": png((0, 0, 0), split=True),
+        "https://i.redd.it/b.png": png((0, 0, 0), split=True),
+        "https://i.redd.it/broken.png": b"not an image",
+        "https://i.redd.it/missing.png": None,
+        "https://i.redd.it/c.png": png((0, 0, 0), size=(2048, 1024)),
+    }
+
+    async def fetch_image(link):
+        return images[link]
+
+    monkeypatch.setattr(image_preprocessing, "fetch_image", fetch_image)
+    image_urls, stats = asyncio.run(preprocess_images(list(images), max_side=512))
+
+    assert stats["duplicates_dropped"] == 1
+    assert image_urls[0].startswith("data:image/jpeg;base64,")
+    assert image_urls[1:3] == ["https://i.redd.it/broken.png", "https://i.redd.it/missing.png"]
+    assert image_urls[3].startswith("data:image/jpeg;base64,")
+    assert len(image_urls) == 4
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+import analysis_jobs
+from analysis_jobs import JobQueue
+
+OPTIONS = {'summary_focus': "General Summary", 'summary_length': "Medium", 'tone': "Teacher",
+           'include_eli5': False, 'analyze_image': True, 'search_external': False, 'max_comments': 5}
+
+@pytest.fixture
+def analyses(monkeypatch):
+    """Replaces the pipeline: analyses block until release is set, and fail for URLs containing 'fail'."""
+    release, calls = threading.Event(), []
+
+    def run_analysis(cache, url, options, progress):
+        calls.append(url)
+        progress('analysis', "Analyzing...")
+        release.wait(5)
+        if "fail" in url:
+            raise RuntimeError("analysis failed")
+        return {'analysis_result': f"analysis of {url}"}
+
+    monkeypatch.setattr(analysis_jobs, "run_analysis", run_analysis)
+    return release, calls
+
+def test_identical_requests_join_the_running_job(analyses):
+    release, calls = analyses
+    queue = JobQueue(workers=2)
+    first = queue.submit(None, "https://www.reddit.com/r/a/comments/1/", OPTIONS)
+    joined = queue.submit(None, "https://www.reddit.com/r/a/comments/1/", dict(OPTIONS))
+    other_tone = queue.submit(None, "https://www.reddit.com/r/a/comments/1/", dict(OPTIONS, tone="Pirate"))
+    assert joined == first and other_tone != first
+
+    release.set()
+    assert queue.get(first).wait(5) and queue.get(other_tone).wait(5)
+    assert len(calls) == 2
+    assert queue.get(first).snapshot()['result'] == {'analysis_result': "analysis of https://www.reddit.com/r/a/comments/1/"}
+    assert queue.stats() == {'queued': 0, 'running': 0, 'done': 2, 'failed': 0}
+
+def test_a_finished_request_starts_a_new_job(analyses):
+    release, calls = analyses
+    release.set()
+    queue = JobQueue(workers=1)
+    first = queue.submit(None, "https://www.reddit.com/r/a/comments/1/", OPTIONS)
+    queue.get(first).wait(5)
+    assert queue.submit(None, "https://www.reddit.com/r/a/comments/1/", OPTIONS) != first
+
+def test_jobs_wait_for_a_free_worker(analyses):
+    release, calls = analyses
+    queue = JobQueue(workers=1)
+    running = queue.submit(None, "https://www.reddit.com/r/a/comments/1/", OPTIONS)
+    waiting = queue.submit(None, "https://www.reddit.com/r/a/comments/2/", OPTIONS)
+    assert queue.get(waiting).snapshot()['stage'] == 'queued'
+    assert queue.pending() == 2
+
+    release.set()
+    assert queue.get(waiting).wait(5)
+    assert queue.get(running).status == 'done'
+    assert queue.pending() == 0
+
+def test_a_failed_analysis_is_reported(analyses):
+    release, calls = analyses
+    release.set()
+    queue = JobQueue(workers=1)
+    job = queue.get(queue.submit(None, "https://www.reddit.com/r/a/comments/fail/", OPTIONS))
+    assert job.wait(5)
+    snapshot = job.snapshot()
+    assert snapshot['status'] == 'failed' and snapshot['error'] == "analysis failed"
+
+def test_finished_jobs_are_dropped_after_the_ttl(analyses):
+    release, calls = analyses
+    release.set()
+    queue = JobQueue(workers=1, ttl=0)
+    first = queue.submit(None, "https://www.reddit.com/r/a/comments/1/", OPTIONS)
+    queue.get(first).wait(5)
+    queue.get(first).finished -= 1
+    second = queue.submit(None, "https://www.reddit.com/r/a/comments/2/", OPTIONS)
+    assert queue.get(first) is None
+    assert queue.get(second).wait(5)
@@ -0,0 +1,108 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+import try_html_summary
+from try_html_summary import fetch_link_html
+
+PAGE = b"<html><body><article><p>" + b"Plenty of readable text. " * 50 + b"</p></article></body></html>"
+
+@pytest.fixture
+def site(monkeypatch):
+    """Serves PAGE for every URL, except the routes of `site.routes` (path -> handler)."""
+    routes = {}
+    requests = []
+
+    def handle(request):
+        requests.append(request.url)
+        handler = routes.get(request.url.path)
+        if handler is not None:
+            return handler(request)
+        return httpx.Response(200, headers={"content-type": "text/html"}, content=PAGE)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle), follow_redirects=True)
+    monkeypatch.setattr(try_html_summary, "get_async_client", lambda: client)
+    monkeypatch.setattr(try_html_summary, "_bad_links", {})
+    monkeypatch.setattr(try_html_summary, "_domain_failures", {})
+    site.routes = routes
+    site.requests = requests
+    yield site
+    asyncio.run(client.aclose())
+
+def fetch(url):
+    return asyncio.run(fetch_link_html(url))
+
+def probe(url):
+    return fetch(url)[1]
+
+def test_login_like_paths_without_redirect_are_fine(site):
+    assert probe("https://docs.python.org/3/library/authentication.html") is None
+    assert probe("https://blog.example.com/author/jane") is None
+    assert probe("https://docs.python.org/3/library/os.html") is None
+
+def test_redirect_to_login_wall_skips_the_domain(site):
+    site.routes["/article"] = lambda request: httpx.Response(302, headers={"location": "/accounts/login?next=/article"})
+    assert probe("https://news.example.com/article") == "redirects to a login or consent wall"
+    assert probe("https://news.example.com/other").endswith("(cached)")
+
+def test_unsupported_hosts_match_whole_labels(site):
+    assert probe("https://x.com/user/status/1") == "unsupported link"
+    assert probe("https://mobile.twitter.com/user/status/1") == "unsupported link"
+    assert probe("https://www.dropbox.com/s/file") is None
+    assert probe("https://www.netflix.com/title/1") is None
+
+def test_one_network_error_does_not_skip_the_domain(site):
+    failing = {"count": 1}
+
+    def flaky(request):
+        if failing["count"]:
+            failing["count"] -= 1
+            raise httpx.ConnectTimeout("timed out", request=request)
+        return httpx.Response(200, headers={"content-type": "text/html"}, content=PAGE)
+
+    site.routes["/page"] = flaky
+    assert probe("https://slow.example.com/page") == "unreachable (ConnectTimeout)"
+    assert probe("https://slow.example.com/page") is None
+
+def test_repeated_network_errors_skip_the_domain(site):
+    def down(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    site.routes["/page"] = down
+    for _ in range(try_html_summary.UNREACHABLE_DOMAIN_FAILURES):
+        assert probe("https://down.example.com/page") == "unreachable (ConnectError)"
+    assert probe("https://down.example.com/elsewhere").endswith("(cached)")
+
+def html_page(content):
+    return lambda request: httpx.Response(200, headers={"content-type": "text/html"}, content=content)
+
+def test_usable_link_is_probed_and_read_with_one_request(site):
+    html, reason = fetch("https://blog.example.com/post")
+    assert reason is None
+    assert html == PAGE.decode()
+    assert len(site.requests) == 1
+
+def test_noscript_notice_on_a_readable_page_is_not_a_javascript_wall(site):
+    notice = b"<noscript>Please enable JavaScript for the best experience.</noscript>"
+    site.routes["/news"] = html_page(PAGE.replace(b"<body>", b"<body>" + notice))
+    html, reason = fetch("https://news.example.com/news")
+    assert reason is None
+    assert "Plenty of readable text" in html
+
+def test_javascript_wall_skips_only_that_page(site):
+    wall = b"<html><body><noscript>You need to enable JavaScript to run this app.</noscript><div id='root'></div></body></html>"
+    site.routes["/app"] = html_page(wall)
+    assert probe("https://spa.example.com/app") == "page requires JavaScript"
+    assert probe("https://spa.example.com/app").endswith("(cached)")
+    assert probe("https://spa.example.com/blog/post") is None
+
+@pytest.mark.parametrize("headers, cooldown", [({"retry-after": "5"}, 5), ({}, try_html_summary.RATE_LIMIT_COOLDOWN_SECONDS)])
+def test_rate_limit_pauses_the_domain_for_its_retry_after(site, headers, cooldown):
+    site.routes["/page"] = lambda request: httpx.Response(429, headers=headers)
+    assert probe("https://busy.example.com/page") == "rate limited with HTTP 429"
+    assert probe("https://busy.example.com/other").endswith("(cached)")
+
+    _, expires_at = try_html_summary._bad_links[('domain', "busy.example.com")]
+    assert cooldown - 1 < expires_at - time.monotonic() <= cooldown
@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+
+import segmented_log_backend
+from segmented_log_backend import SegmentedLogCacheBackend
+from bench_cache_backends import synthetic_row
+from bench_segmented_log import LocalObjectStore, fill_csv
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Compactions are started by the tests, not in the background
+    monkeypatch.setattr(segmented_log_backend, "CACHE_LOG_COMPACT_AFTER", float("inf"))
+    return LocalObjectStore(str(tmp_path / "bucket"))
+
+@pytest.fixture
+def open_log(store, tmp_path):
+    """Opens another session on the same log, each with its own mirror."""
+    sessions = []
+
+    def open_log(**kwargs):
+        sessions.append(SegmentedLogCacheBackend(store, "bucket/log", str(tmp_path / f"mirror-{len(sessions)}"), **kwargs))
+        return sessions[-1]
+    return open_log
+
+def test_concurrent_writers_keep_each_others_rows(open_log):
+    writers = [open_log(), open_log()]
+    threads = [threading.Thread(target=lambda w=w, base=base: [w.upsert(synthetic_row(base + i, "x")) for i in range(25)])
+               for w, base in zip(writers, (0, 1000))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reader = open_log()
+    assert len(reader) == 50
+    for writer in writers:
+        writer.refresh(force=True)
+        assert len(writer) == 50
+
+def test_refresh_returns_the_rows_other_sessions_changed(open_log):
+    writer, reader = open_log(), open_log()
+    row_id = writer.upsert(synthetic_row(0, "x"))
+    assert reader.refresh(force=True) == [row_id]
+
+    new_id = writer.upsert(synthetic_row(0, "y"), row_id)
+    writer.update_eli5(new_id, "simple")
+    assert sorted(reader.refresh(force=True)) == sorted([new_id, row_id, new_id])
+    assert reader.get(row_id) is None
+    assert reader.get(new_id)['eli5_summary'] == "simple"
+
+    writer.delete([new_id])
+    assert reader.refresh(force=True) == [new_id]
+    assert len(reader) == 0
+
+def test_compaction_keeps_every_row_and_access_time(open_log, store):
+    writer = open_log()
+    ids = writer.write_batch([("upsert", synthetic_row(i, "x"), None) for i in range(10)])
+    writer.delete(ids[:2])
+    writer.record_access({ids[5]: 123.0})
+    reader = open_log()
+
+    writer.compact()
+    assert reader.refresh(force=True) is None  # the base changed, everything was reloaded
+    assert sorted(row['id'] for row in reader.load_metadata()) == sorted(ids[2:])
+    assert reader.load_access() == {ids[5]: 123.0}
+
+    # The next compaction deletes the segments folded into the previous base
+    writer.upsert(synthetic_row(10, "x"))
+    writer.compact()
+    assert len(store.ls("bucket/log/segments")) == 1
+    assert len(open_log()) == 9
+
+def test_compaction_skips_while_another_process_holds_the_lease(open_log, store):
+    writer = open_log()
+    writer.upsert(synthetic_row(0, "x"))
+    writer._put(writer._lease_path(), "9999999999")
+    writer.compact()
+    assert writer._read_manifest()['version'] == 0
+
+def test_legacy_csv_becomes_the_first_base(store, open_log):
+    fill_csv(store, "bucket/analyses.csv", 5)
+    log = open_log(legacy_csv_path="bucket/analyses.csv")
+    assert len(log) == 5
+    assert log._read_manifest()['version'] == 1
+
+def test_reader_between_publishing_and_deleting_does_not_replay_folded_segments(open_log, store, monkeypatch):
+    writer = open_log()
+    row_id = writer.upsert(synthetic_row(0, "x"))
+    gone_id = writer.upsert(synthetic_row(1, "x"))
+    writer.compact()
+    new_id = writer.upsert(synthetic_row(0, "y"), row_id)
+    writer.delete([gone_id])
+
+    # The second compaction publishes its manifest, then a reader refreshes before the
+    # segments folded into the first base are deleted
+    readers = []
+    remove = store.rm
+    def rm(path):
+        if "/segments/" in path and not readers:
+            readers.append(open_log())
+        remove(path)
+    monkeypatch.setattr(store, "rm", rm)
+    writer.compact()
+
+    assert [row['id'] for row in readers[0].load_metadata()] == [new_id]
+
+def test_segments_left_behind_by_a_crash_stay_folded(open_log, store, monkeypatch):
+    writer = open_log()
+    row_id = writer.upsert(synthetic_row(0, "x"))
+    writer.compact()
+    new_id = writer.upsert(synthetic_row(0, "y"), row_id)
+
+    remove = store.rm
+    def crash(path):
+        if "/segments/" in path:
+            raise OSError("crashed before deleting")
+        remove(path)
+    monkeypatch.setattr(store, "rm", crash)
+    with pytest.raises(OSError):
+        writer.compact()
+    monkeypatch.setattr(store, "rm", remove)
+
+    assert [row['id'] for row in open_log().load_metadata()] == [new_id]
+    writer.upsert(synthetic_row(2, "x"))
+    writer.compact()
+    assert len(store.ls("bucket/log/segments")) == 1
+    assert len(open_log()) == 2
+
+def test_refresh_prunes_the_mirror_after_compaction(open_log, tmp_path):
+    writer = open_log()
+    for i in range(3):
+        writer.upsert(synthetic_row(i, "x"))
+    writer.compact()
+    writer.upsert(synthetic_row(3, "x"))
+    writer.compact()
+    writer.refresh(force=True)
+
+    mirror = tmp_path / "mirror-0" / "bucket" / "log"
+    assert sorted(path.name for path in mirror.glob("base-*")) == ["base-000002.jsonl"]
+    assert len(list((mirror / "segments").iterdir())) == 0
+    assert len(writer) == 4
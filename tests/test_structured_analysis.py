@@ -0,0 +1,41 @@
+import copy
+import json
+
+import analyze_main
+from analyze_main import build_structured_analysis
+
+def test_media_analysis_goes_into_the_prompt_but_not_the_thread_data(monkeypatch):
+    prompts = []
+
+    async def async_chat_completion(chat_history, **kwargs):
+        prompts.append(json.loads(chat_history[-1]['content']))
+        return "structured"
+
+    monkeypatch.setattr(analyze_main, "process_media_content", lambda *args: (["a cat"], None, 0))
+    monkeypatch.setattr(analyze_main, "async_chat_completion", async_chat_completion)
+    all_data = {'title': "t", 'original_post': {'url': "u", 'body': "post", 'image_link': ["i"]}, 'comments': []}
+    original = copy.deepcopy(all_data)
+
+    for _ in range(2):
+        assert build_structured_analysis(all_data, "General Summary", True, False) == "structured"
+
+    assert all_data == original
+    for prompt in prompts:
+        assert prompt['original_post']['body'].startswith("post\n")
+        assert prompt['original_post']['body'].count("Image analysis 1: a cat") == 1
+
+def test_the_prompt_only_mentions_skipped_duplicates_when_some_were_dropped(monkeypatch):
+    prompts = []
+
+    async def async_chat_completion(chat_history, **kwargs):
+        prompts.append(json.loads(chat_history[-1]['content'])['original_post']['body'])
+        return "structured"
+
+    monkeypatch.setattr(analyze_main, "async_chat_completion", async_chat_completion)
+    all_data = {'title': "t", 'original_post': {'url': "u", 'body': "post", 'image_link': ["i", "j"]}, 'comments': []}
+    for dropped in (0, 1):
+        monkeypatch.setattr(analyze_main, "process_media_content", lambda *args: (["a cat"], None, dropped))
+        build_structured_analysis(all_data, "General Summary", True, False)
+
+    assert "duplicate" not in prompts[0]
+    assert "1 near-duplicate image(s) were skipped." in prompts[1]
@@ -0,0 +1,124 @@
+import os
+import time
+
+import pytest
+
+from bench_cache_backends import synthetic_row
+from cache_backends import SqliteCacheBackend
+from write_behind import WriteBehindCache
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "analyses.db"), str(tmp_path / "journal.jsonl")
+
+@pytest.fixture
+def open_cache(paths):
+    """Opens a write-behind cache on the test's database and journal. The background flusher never runs."""
+    caches = []
+
+    def open_cache(**kwargs):
+        caches.append(WriteBehindCache(SqliteCacheBackend(paths[0]), paths[1], flush_interval=3600, **kwargs))
+        return caches[-1]
+    yield open_cache
+    for cache in caches:
+        cache.close()
+
+def crash(cache):
+    """Drops the cache as if the process died: nothing queued is flushed."""
+    cache.closed = True
+    cache.backend.close()
+
+def test_unflushed_writes_are_replayed_after_a_crash(open_cache, paths):
+    cache = open_cache()
+    pids = [cache.upsert(synthetic_row(i, "x")) for i in range(3)]
+    cache.update_eli5(pids[1], "simple")
+    crash(cache)
+    assert len(SqliteCacheBackend(paths[0])) == 0
+
+    restarted = open_cache()
+    assert len(restarted.queue) == 3
+    assert restarted.flush()
+    rows = restarted.backend.load_metadata()
+    assert len(rows) == 3
+    assert sum(row['include_eli5'] for row in rows) == 1
+    assert os.path.getsize(paths[1]) == 0
+
+def test_flush_writes_everything_and_keeps_provisional_ids_working(open_cache):
+    cache = open_cache()
+    pids = [cache.upsert(synthetic_row(i, f"analysis {i}")) for i in range(5)]
+    assert len(cache.backend) == 0
+    assert cache.get(pids[0])['analysis_result'] == "analysis 0"
+
+    assert cache.flush()
+    assert len(cache.backend) == 5 and not cache.queue
+    assert cache.get(pids[4]) == dict(cache.backend.get(cache.id_map[pids[4]]), id=pids[4])
+
+def test_a_full_batch_wakes_the_flusher(open_cache):
+    cache = open_cache(max_batch=2)
+    for i in range(2):
+        cache.upsert(synthetic_row(i, "x"))
+    deadline = time.monotonic() + 5
+    while cache.queue and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(cache.backend) == 2
+
+def test_reads_include_queued_writes(open_cache):
+    cache = open_cache()
+    row = synthetic_row(0, "x")
+    stored_id = cache.backend.upsert(row)
+    pid = cache.upsert(synthetic_row(0, "y"), stored_id)
+    cache.update_eli5(pid, "simple")
+
+    found = cache.find(row['url'], row['summary_focus'], row['summary_length'], row['tone'])
+    assert [(r['id'], r['analysis_result'], r['eli5_summary']) for r in found] == [(pid, "y", "simple")]
+    assert len(cache) == 1
+
+def test_writes_to_a_queued_row_are_coalesced(open_cache):
+    cache = open_cache()
+    pid = cache.upsert(synthetic_row(0, "first"))
+    cache.update_eli5(pid, "simple")
+    replacement = cache.upsert(synthetic_row(0, "second"), pid)
+    assert len(cache.queue) == 1
+
+    cache.flush()
+    rows = cache.backend.load_metadata()
+    assert len(rows) == 1
+    assert cache.backend.get(rows[0]['id'])['analysis_result'] == "second"
+    assert cache.get(replacement)['analysis_result'] == "second"
+
+def test_failed_flush_keeps_the_writes_queued(open_cache, monkeypatch):
+    cache = open_cache()
+    cache.upsert(synthetic_row(0, "x"))
+
+    def unavailable(operations):
+        raise ConnectionError("store unavailable")
+
+    monkeypatch.setattr(cache.backend, "write_batch", unavailable)
+    assert not cache.flush()
+    assert len(cache.queue) == 1 and not cache.in_flight
+
+    monkeypatch.undo()
+    assert cache.flush()
+    assert len(cache.backend) == 1
+
+def test_find_hides_a_flushed_row_replaced_while_it_was_written(open_cache, monkeypatch):
+    cache = open_cache()
+    row = synthetic_row(0, "first")
+    pid = cache.upsert(row)
+    write_batch = cache.backend.write_batch
+    replacements = []
+
+    def replace_during_the_write(operations):
+        if replacements:
+            raise ConnectionError("store unavailable")
+        # The replacement is queued against the provisional id, which the write then maps to a real one
+        replacements.append(cache.upsert(synthetic_row(0, "second"), pid))
+        return write_batch(operations)
+
+    monkeypatch.setattr(cache.backend, "write_batch", replace_during_the_write)
+    assert not cache.flush()
+    assert len(cache.backend) == 1 and len(cache.queue) == 1
+
+    found = cache.find(row['url'], row['summary_focus'], row['summary_length'], row['tone'])
+    assert [(r['id'], r['analysis_result']) for r in found] == [(replacements[0], "second")]
+    assert [r['id'] for r in cache.load_metadata()] == replacements
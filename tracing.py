@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import asyncio
+import argparse
+import functools
+import threading
+import contextvars
+from collections import defaultdict
+
+import requests
+
+# Finished spans are appended to this file. Tracing is off while it and TRACE_OTLP_ENDPOINT are empty.
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+# 'jsonl' writes one span per line, 'otlp' one OTLP/JSON export request per flush (the
+# OpenTelemetry Collector file exporter format)
+TRACE_FORMAT = os.getenv("TRACE_FORMAT", "jsonl")
+# OTLP/HTTP collector the spans are also posted to, e.g. http://localhost:4318/v1/traces
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "5"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "reddit_analyzer")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """
+    One timed step of a request. Spans opened inside it become its children, also across
+    asyncio tasks, which inherit the context. Attributes hold sizes and outcomes.
+    """
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start', 'end', 'error', '_token')
+    recording = True
+
+    def __init__(self, name: str, request_id: str = None, attributes: dict = None):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = request_id or (parent.trace_id if parent else uuid.uuid4().hex)
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent and not request_id else None
+        self.attributes = attributes or {}
+        self.start = self.end = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time_ns()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        tracer.record(self)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+            'name': self.name, 'start': self.start / 1e9, 'duration': (self.end - self.start) / 1e9,
+            'status': 'error' if self.error else 'ok', 'error': self.error, 'attributes': self.attributes,
+        }
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off, so instrumented code needs no checks."""
+    __slots__ = ()
+    recording = False
+    trace_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def to_otlp(spans: list) -> dict:
+    """An OTLP/JSON ExportTraceServiceRequest with the finished spans."""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': TRACE_SERVICE_NAME}}]},
+        'scopeSpans': [{
+            'scope': {'name': 'reddit_analyzer.tracing'},
+            'spans': [{
+                'traceId': span.trace_id, 'spanId': span.span_id, 'parentSpanId': span.parent_id or "",
+                'name': span.name, 'kind': 1,
+                'startTimeUnixNano': str(span.start), 'endTimeUnixNano': str(span.end),
+                'attributes': [{'key': key, 'value': _otlp_value(value)}
+                               for key, value in span.attributes.items() if value is not None],
+                'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+            } for span in spans],
+        }],
+    }]}
+
+class Tracer:
+    """
+    Collects the finished spans of the process and exports them in batches from a
+    background thread, to the TRACE_PATH file and/or an OTLP collector.
+    While both are unset, span() hands out a shared no-op span and traced functions
+    run unwrapped but for one check.
+    """
+
+    def __init__(self, path: str = TRACE_PATH, format: str = TRACE_FORMAT, endpoint: str = TRACE_OTLP_ENDPOINT,
+                 flush_interval: float = TRACE_FLUSH_SECONDS):
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.flush_thread = None
+        self.configure(path, format, endpoint, flush_interval)
+        atexit.register(self.flush)
+
+    def configure(self, path: str = "", format: str = "jsonl", endpoint: str = "", flush_interval: float = TRACE_FLUSH_SECONDS):
+        """(Re)targets the export, e.g. from a script. Empty path and endpoint turn tracing off."""
+        if format not in ('jsonl', 'otlp'):
+            raise ValueError(f"Unknown trace format '{format}', expected 'jsonl' or 'otlp'")
+        self.flush()
+        self.path, self.format, self.endpoint = path, format, endpoint
+        self.flush_interval = flush_interval
+        self.enabled = bool(path or endpoint)
+
+    def record(self, span: Span):
+        with self.lock:
+            self.buffer.append(span)
+            if self.flush_thread is None:
+                self.flush_thread = threading.Thread(target=self._run, daemon=True)
+                self.flush_thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            spans, self.buffer = self.buffer, []
+        if not spans:
+            return
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    if self.format == 'otlp':
+                        f.write(json.dumps(to_otlp(spans)) + "\n")
+                    else:
+                        for span in spans:
+                            f.write(json.dumps(span.to_dict(), default=str) + "\n")
+            except OSError as e:
+                print(f"Could not write traces to {self.path}: {e}")
+        if self.endpoint:
+            try:
+                requests.post(self.endpoint, json=to_otlp(spans), timeout=10).raise_for_status()
+            except requests.exceptions.RequestException as e:
+                print(f"Could not export traces to {self.endpoint}: {e}")
+
+tracer = Tracer()
+
+def span(name: str, request_id: str = None, **attributes):
+    """
+    Context manager timing a step as a child of the current span. request_id starts a
+    new trace with that id (32 hex characters, like the analysis job ids) instead.
+    """
+    if not tracer.enabled:
+        return NOOP_SPAN
+    return Span(name, request_id, attributes)
+
+def current_span():
+    """The innermost open span, to attach attributes to. A no-op span if there is none."""
+    if not tracer.enabled:
+        return NOOP_SPAN
+    return _current_span.get() or NOOP_SPAN
+
+def disable_tracing():
+    """
+    Turns tracing off and drops the buffered spans without exporting them, e.g. in worker
+    processes forked with a copy of the parent's buffer.
+    """
+    tracer.enabled = False
+    tracer.buffer = []
+
+def traced(name: str = None):
+    """Decorator running every call of a function or coroutine function in a span."""
+    def decorate(func):
+        span_name = name or func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with Span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def report(path: str, slowest: int):
+    """Prints the time per span name and the span trees of the slowest traces of a JSONL trace file."""
+    traces = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            traces[record['trace_id']].append(record)
+
+    totals, counts = defaultdict(float), defaultdict(int)
+    for spans in traces.values():
+        for record in spans:
+            totals[record['name']] += record['duration']
+            counts[record['name']] += 1
+    print(f"{len(traces)} traces\n\n{'span':<28} {'count':>7} {'total (s)':>10} {'mean (s)':>9}")
+    for name in sorted(totals, key=totals.get, reverse=True):
+        print(f"{name:<28} {counts[name]:>7} {totals[name]:>10.3f} {totals[name] / counts[name]:>9.3f}")
+
+    def root_duration(spans):
+        return max(record['duration'] for record in spans if not record['parent_id'])
+
+    rooted = [spans for spans in traces.values() if any(not record['parent_id'] for record in spans)]
+    for spans in sorted(rooted, key=root_duration, reverse=True)[:slowest]:
+        children = defaultdict(list)
+        for record in spans:
+            children[record['parent_id']].append(record)
+        print(f"\nTrace {spans[0]['trace_id']}")
+
+        def show(record, depth):
+            attributes = " ".join(f"{key}={value}" for key, value in record['attributes'].items())
+            error = f" ERROR {record['error']}" if record['error'] else ""
+            print(f"{'  ' * depth}{record['name']} {record['duration']:.3f}s {attributes}{error}")
+            for child in sorted(children[record['span_id']], key=lambda r: r['start']):
+                show(child, depth + 1)
+
+        for root in sorted(children[None], key=lambda r: r['start']):
+            show(root, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a JSONL trace file")
+    parser.add_argument("path", nargs="?", default=TRACE_PATH or "traces.jsonl")
+    parser.add_argument("--slowest", type=int, default=3, help="Span trees of the slowest traces to print")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"{args.path} does not exist")
+    report(args.path, args.slowest)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import os
+import time
+import threading
 import requests
-from bs4 import BeautifulSoup
-# import time
+from typing import Optional
 from dotenv import load_dotenv
 from urllib.parse import urlparse
-from llm_interact import chat_completion
+from email.utils import parsedate_to_datetime
+from llm_interact import chat_completion, async_chat_completion
+from http_client import get_async_client
+from content_extraction import extract_main_content
+from tracing import traced, current_span
 
 load_dotenv()
 
@@ -16,28 +21,47 @@ PROXIES = {
     'https': PROXY_HTTPS
 }
 
-def extract_main_content(html: str, url: str) -> str:
-    """
-    Extracts and cleans the main textual content from HTML, removing ads, sidebars, etc.
-    For GitHub URLs, extracts content from the specific <article> tag.
-    """
-    parsed_url = urlparse(url)
-    domain = parsed_url.netloc.lower()
-
-    # Check if the domain is exactly 'github.com' or starts with 'www.github.com'
-    if domain == 'github.com' or domain == 'www.github.com':
-        soup = BeautifulSoup(html, 'html.parser')
-        article = soup.find('article', class_='markdown-body entry-content container-lg')
-        if article:
-            text = ' '.join(article.get_text(separator=' ').split())
-            return text
-        else:
-            raise ValueError("Could not find the specified <article> tag in GitHub URL.")
-    else:
-        soup = BeautifulSoup(html, 'html.parser')
-        # Get text and replace multiple whitespaces with single space
-        text = ' '.join(soup.get_text(separator=' ').split())
-        return text
+# Only this many characters of the main content are sent to the LLM.
+MAIN_CONTENT_CHARS = 4096
+# Hard cap on the bytes read from a single page.
+MAX_HTML_BYTES = 1024 * 1024
+# Size of the body after which the streamed HTML is first checked for enough main content.
+# The threshold doubles after every check.
+FIRST_EXTRACTION_CHECK_BYTES = 64 * 1024
+
+JS_REQUIRED_PHRASES = [
+    'enable javascript',
+    'javascript is required',
+    'please enable javascript',
+    'javascript must be enabled'
+]
+
+# A page mentioning JavaScript only counts as a JavaScript wall below this much main content.
+JS_WALL_MAX_CONTENT_CHARS = 200
+# Pages that advertise a larger size than this are skipped.
+PROBE_MAX_CONTENT_LENGTH = 10 * 1024 * 1024
+# How long a known-bad domain or URL is skipped without probing it again.
+BAD_LINK_TTL_SECONDS = 6 * 60 * 60
+# Hosts that can't be summarized without running JavaScript or logging in, with their subdomains.
+UNSUPPORTED_HOSTS = ('x.com', 'twitter.com')
+# Path segments of the pages a redirect to a login or consent wall ends on.
+LOGIN_WALL_PATH_SEGMENTS = {'login', 'signin', 'sign-in', 'auth', 'consent', 'accounts'}
+# A domain is skipped after this many probes in a row failed with a network error.
+UNREACHABLE_DOMAIN_FAILURES = 3
+# Status codes that mean the whole site blocks us, not just this page.
+DOMAIN_BLOCKING_STATUSES = {401, 403, 451}
+# A rate-limited domain (HTTP 429) is skipped for its Retry-After, or this many seconds without one.
+RATE_LIMIT_COOLDOWN_SECONDS = 60
+
+# Known-bad links. Keys are ('domain', netloc) for site-wide dead ends (blocking, login walls,
+# unreachable hosts) and ('url', url) for page-specific ones (JS walls, wrong content type,
+# too large, 404).
+# Values are (reason, expires_at).
+_bad_links = {}
+# Network errors in a row by domain, reset by a successful probe
+_domain_failures = {}
+# Both are shared by the job queue threads and their event loops
+_bad_links_lock = threading.Lock()
 
 def fetch_html(url: str) -> tuple[str, bool]:
     """
@@ -67,12 +91,7 @@ def fetch_html(url: str) -> tuple[str, bool]:
         content = response.text
         
         # Check if page requires JavaScript
-        requires_js = any(phrase in content.lower() for phrase in [
-            'enable javascript',
-            'javascript is required',
-            'please enable javascript',
-            'javascript must be enabled'
-        ])
+        requires_js = requires_javascript(content, url)
         
         return content, requires_js
         
@@ -80,6 +99,197 @@ def fetch_html(url: str) -> tuple[str, bool]:
         print(f"Failed to fetch HTML content: {e}")
         return None, True
 
+def requires_javascript(content: str, url: str) -> bool:
+    """
+    Checks whether the page only tells the visitor to enable JavaScript.
+    Many ordinary pages carry such a notice in <noscript>, so it only counts when the page
+    has next to no main content besides it.
+    """
+    lowered = content.lower()
+    if not any(phrase in lowered for phrase in JS_REQUIRED_PHRASES):
+        return False
+    try:
+        return len(extract_main_content(content, url)) < JS_WALL_MAX_CONTENT_CHARS
+    except ValueError:
+        return True
+
+def link_domain(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+def is_unsupported_host(host: str) -> bool:
+    host = host.lower()
+    return any(host == unsupported or host.endswith('.' + unsupported) for unsupported in UNSUPPORTED_HOSTS)
+
+def is_login_wall(path: str) -> bool:
+    return any(segment in LOGIN_WALL_PATH_SEGMENTS for segment in path.lower().split('/'))
+
+def remember_bad_link(url: str, reason: str, domain_wide: bool = False, ttl: float = BAD_LINK_TTL_SECONDS):
+    """Caches a dead end so the link (or its whole domain) is skipped for ttl seconds."""
+    key = ('domain', link_domain(url)) if domain_wide else ('url', url)
+    with _bad_links_lock:
+        _bad_links[key] = (reason, time.monotonic() + ttl)
+
+def known_bad_reason(url: str) -> Optional[str]:
+    """Returns the cached reason the link is unusable, or None if it isn't known to be bad."""
+    now = time.monotonic()
+    with _bad_links_lock:
+        for key in (('url', url), ('domain', link_domain(url))):
+            entry = _bad_links.get(key)
+            if entry is None:
+                continue
+            reason, expires_at = entry
+            if expires_at > now:
+                return reason
+            del _bad_links[key]
+    return None
+
+def retry_after_seconds(value: str) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given in seconds or as an HTTP date. None if unreadable."""
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def record_domain_failure(domain: str) -> bool:
+    """Counts a network error of the domain. True once it failed UNREACHABLE_DOMAIN_FAILURES times in a row."""
+    with _bad_links_lock:
+        failures = _domain_failures.get(domain, 0) + 1
+        if failures >= UNREACHABLE_DOMAIN_FAILURES:
+            _domain_failures.pop(domain, None)
+            return True
+        _domain_failures[domain] = failures
+        return False
+
+def check_response(url: str, response) -> Optional[str]:
+    """
+    Checks the status, the final URL after redirects, the content type and the advertised size
+    of an open response before any of its body is read.
+    Returns None if the link looks usable, otherwise the reason it was skipped.
+    """
+    if response.status_code == 429:
+        # Only a short pause: the site works, it just wants fewer requests
+        retry_after = retry_after_seconds(response.headers.get("retry-after", ""))
+        cooldown = RATE_LIMIT_COOLDOWN_SECONDS if retry_after is None else min(retry_after, BAD_LINK_TTL_SECONDS)
+        reason = "rate limited with HTTP 429"
+        remember_bad_link(url, reason, domain_wide=True, ttl=cooldown)
+        return reason
+    if response.status_code in DOMAIN_BLOCKING_STATUSES:
+        reason = f"blocked with HTTP {response.status_code}"
+        remember_bad_link(url, reason, domain_wide=True)
+        return reason
+    if response.status_code >= 400:
+        reason = f"HTTP {response.status_code}"
+        remember_bad_link(url, reason)
+        return reason
+
+    final_url = response.url
+    if is_unsupported_host(final_url.host):
+        reason = f"redirects to unsupported host {final_url.host}"
+        remember_bad_link(url, reason, domain_wide=True)
+        return reason
+    if response.history and is_login_wall(final_url.path):
+        reason = "redirects to a login or consent wall"
+        remember_bad_link(url, reason, domain_wide=True)
+        return reason
+
+    content_type = response.headers.get("content-type", "").lower()
+    if content_type and "html" not in content_type:
+        reason = f"unsupported content type '{content_type}'"
+        remember_bad_link(url, reason)
+        return reason
+
+    total_size = response.headers.get("content-length", "")
+    if total_size.isdigit() and int(total_size) > PROBE_MAX_CONTENT_LENGTH:
+        reason = f"page too large ({total_size} bytes)"
+        remember_bad_link(url, reason)
+        return reason
+    return None
+
+def has_enough_main_content(html: str, url: str, enough_chars: int) -> bool:
+    """Checks whether the (possibly partial) HTML already yields enough main content."""
+    try:
+        return len(extract_main_content(html, url)) >= enough_chars
+    except ValueError:
+        # e.g. the GitHub README article hasn't arrived yet
+        return False
+
+async def fetch_link_html(url: str, max_bytes: int = MAX_HTML_BYTES,
+                          enough_chars: int = MAIN_CONTENT_CHARS) -> tuple[Optional[str], Optional[str]]:
+    """
+    Probes a link and streams its HTML through the pooled async client in a single request.
+
+    The headers of the response are checked before its body is read, so unusable links are
+    dropped without a download. Usable pages are then read from the same response until
+    enough main content has been extracted or max_bytes have been read.
+
+    Returns tuple of (html_content, skip_reason), one of which is None.
+    Dead ends are cached, so repeated requests for a known-bad link or domain cost nothing.
+    """
+    reason = known_bad_reason(url)
+    if reason:
+        return None, f"{reason} (cached)"
+
+    if is_unsupported_host(urlparse(url).hostname or "") or urlparse(url).path.lower().endswith(".pdf"):
+        remember_bad_link(url, "unsupported link")
+        return None, "unsupported link"
+
+    try:
+        client = get_async_client()
+        async with client.stream("GET", url) as response:
+            reason = check_response(url, response)
+            if reason:
+                return None, reason
+
+            encoding = response.encoding or "utf-8"
+            body = bytearray()
+            next_check = FIRST_EXTRACTION_CHECK_BYTES
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) >= max_bytes:
+                    break
+                if len(body) >= next_check:
+                    partial = body.decode(encoding, errors="replace")
+                    if has_enough_main_content(partial, url, enough_chars):
+                        break
+                    next_check *= 2
+
+    except Exception as e:
+        # One timeout or reset says little about the site, only repeated failures skip the domain
+        reason = f"unreachable ({type(e).__name__})"
+        if record_domain_failure(link_domain(url)):
+            remember_bad_link(url, reason, domain_wide=True)
+        return None, reason
+
+    with _bad_links_lock:
+        _domain_failures.pop(link_domain(url), None)
+    content = body[:max_bytes].decode(encoding, errors="replace")
+    if requires_javascript(content, url):
+        # Only this page: other pages of the site may well be rendered on the server
+        reason = "page requires JavaScript"
+        remember_bad_link(url, reason)
+        return None, reason
+    return content, None
+
+def build_summary_chat_history(main_content: str, word_count: int) -> list:
+    """Builds the chat history asking the LLM to summarize the extracted page content."""
+    return [
+        {"role": "system", "content": (
+            "You are a focused web content summarization assistant. "
+            "Your goal is to extract and summarize the main theme of a web page. "
+            "For GitHub repositories, prioritize summarizing the README file. "
+            "Ignore any error messages or unrelated content that might be displayed alongside the main content such as navbar text, about us information etc. "
+            "Be concise, clear, and structured in your summaries, ensuring that key information is retained while filtering out noise."
+        )},
+        {"role": "user", "content": (
+            f"Please provide a concise summary (100 to {word_count} words) of the following content, "
+            "focusing on the main theme and ignoring sidebars, ads, and other irrelevant information.\n\n"
+            f"{main_content[:MAIN_CONTENT_CHARS]}"
+        )}
+    ]
+
 def generate_summary(url: str, word_count: int = 200) -> str:
     """
     Generates a summary for the main content of the given URL.
@@ -108,27 +318,34 @@ def generate_summary(url: str, word_count: int = 200) -> str:
     # print("\n\n")
     
     # Prepare the chat history
-    chat_history = [
-        {"role": "system", "content": (
-            "You are a focused web content summarization assistant. "
-            "Your goal is to extract and summarize the main theme of a web page. "
-            "For GitHub repositories, prioritize summarizing the README file. "
-            "Ignore any error messages or unrelated content that might be displayed alongside the main content such as navbar text, about us information etc. "
-            "Be concise, clear, and structured in your summaries, ensuring that key information is retained while filtering out noise."
-        )},
-        {"role": "user", "content": (
-            f"Please provide a concise summary (100 to {word_count} words) of the following content, "
-            "focusing on the main theme and ignoring sidebars, ads, and other irrelevant information.\n\n"
-            f"{main_content[:4096]}"
-        )}
-    ]
+    chat_history = build_summary_chat_history(main_content, word_count)
     
     # Call the chat_completion function
-    summary = chat_completion(chat_history, temperature=0.5)
+    summary = chat_completion(chat_history, temperature=0.5, kind='link')
     # print("Time at the end of the generate_summary: ", time.time())
     # print(summary)
     return summary
 
+@traced('link_summary')
+async def generate_summary_async(url: str, word_count: int = 200) -> str:
+    """
+    Asynchronous version of generate_summary. The link's headers are checked before its body
+    is read, so unusable pages cost neither a full download nor an LLM call. Usable pages are
+    read from the same response, only until enough main content is available.
+    """
+    link_span = current_span()
+    link_span.set(url=url)
+    html, skip_reason = await fetch_link_html(url)
+    if skip_reason:
+        print(f"Skipping {url}: {skip_reason}")
+        link_span.set(outcome='skipped')
+        return "No summary available. Ignore this and continue."
+
+    main_content = extract_main_content(html, url)
+    link_span.set(outcome='summarized', html_chars=len(html), content_chars=len(main_content))
+    chat_history = build_summary_chat_history(main_content, word_count)
+    return await async_chat_completion(chat_history, temperature=0.5, kind='link')
+
 if __name__ == "__main__":
     # Example usage
     test_url = "https://www.anthropic.com/research/building-effective-agents"